@@ -0,0 +1,17 @@
+"""
+ASGI config for education project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+serve it with an ASGI server, e.g. ``uvicorn education.asgi:application``.
+Django 2.2 has no ASGI support of its own, see eneza.asgi.ASGIHandler.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+from eneza.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'education.settings')
+
+application = ASGIHandler(get_wsgi_application())
@@ -26,7 +26,7 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = config('True', default=True)
+DEBUG = config('DEBUG', cast=bool, default=False)
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv())
 
@@ -44,10 +44,12 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'education',
     'eneza.apps.EnezaConfig',
-    'eneza.authentication',
+    'eneza.authentication.apps.AuthenticationConfig',
 ]
 
 MIDDLEWARE = [
+    'eneza.instrumentation.InstrumentationMiddleware',
+    'eneza.db_routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +61,13 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'education.urls'
 
+# rows fetched per round trip by the gradebook export, see eneza.services.gradebook
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', cast=int, default=2000)
+
+# request instrumentation, see eneza.instrumentation
+INSTRUMENTATION_SAMPLE_RATE = config('INSTRUMENTATION_SAMPLE_RATE', cast=float, default=1.0)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -77,15 +86,99 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'education.wsgi.application'
 
+# asgi, see eneza.asgi
+# threads running views per process, request bodies and responses are
+# transferred on the event loop
+ASGI_THREADS = config('ASGI_THREADS', cast=int, default=8)
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# connection management, see eneza.db
+# persistent connections live for DATABASE_CONN_MAX_AGE seconds and are health
+# checked at the start of a request, DATABASE_POOL_SIZE > 0 switches PostgreSQL
+# databases to a per process pool of at most that many connections
+DATABASE_CONN_MAX_AGE = config('DATABASE_CONN_MAX_AGE', cast=int, default=60)
+DATABASE_HEALTH_CHECK_INTERVAL = config('DATABASE_HEALTH_CHECK_INTERVAL', cast=float, default=10)
+DATABASE_POOL_SIZE = config('DATABASE_POOL_SIZE', cast=int, default=0)
+DATABASE_POOL_TIMEOUT = config('DATABASE_POOL_TIMEOUT', cast=float, default=10)
+
+
+def database_config(url):
+    database = dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE)
+    if DATABASE_POOL_SIZE and 'postgresql' in database['ENGINE']:
+        database['ENGINE'] = 'eneza.db.backends.postgresql_pool'
+        database['CONN_MAX_AGE'] = 0
+        database['POOL'] = {'MAX_SIZE': DATABASE_POOL_SIZE, 'TIMEOUT': DATABASE_POOL_TIMEOUT,
+            'HEALTH_CHECK_INTERVAL': DATABASE_HEALTH_CHECK_INTERVAL}
+    return database
+
+
 DATABASES = {
-    'default': dj_database_url.config(default=config('DATABASE_URL'))
+    'default': database_config(config('DATABASE_URL'))
+}
+
+# read replicas, safe requests to the eneza viewsets read from them, see eneza.db_routers
+DATABASE_REPLICAS = []
+for i, url in enumerate(config('DATABASE_REPLICA_URLS', cast=Csv(), default='')):
+    alias = 'replica_{}'.format(i)
+    DATABASES[alias] = database_config(url)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['eneza.db_routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', cast=int, default=5)
+REPLICA_MAX_LAG = config('REPLICA_MAX_LAG', cast=float, default=10)
+REPLICA_LAG_CHECK_INTERVAL = config('REPLICA_LAG_CHECK_INTERVAL', cast=float, default=5)
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+# content versions, answer key invalidations and token revocations are written
+# to this cache, every process must share it: set CACHE_URL to redis://host:6379/0
+# (needs django-redis) or memcached://host:11211 in production, locmem:// is
+# private to each process and only fit for development, see eneza.checks
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'memcached': 'django.core.cache.backends.memcached.MemcachedCache',
+    'pylibmc': 'django.core.cache.backends.memcached.PyLibMCCache',
+    'redis': 'django_redis.cache.RedisCache',
+    'rediss': 'django_redis.cache.RedisCache',
 }
 
 
+def cache_config(url):
+    scheme, _, location = url.partition('://')
+    if scheme not in CACHE_BACKENDS:
+        raise ValueError("Unsupported CACHE_URL scheme {}".format(scheme))
+    if scheme.startswith('redis'):
+        # django-redis takes the whole url
+        location = url
+    elif scheme != 'locmem':
+        location = location.split(',')
+    return {'BACKEND': CACHE_BACKENDS[scheme], 'LOCATION': location}
+
+
+CACHES = {
+    'default': cache_config(config('CACHE_URL', default='locmem://eneza'))
+}
+
+# compiled quiz answer keys, see eneza.services.answer_keys
+ANSWER_KEY_CACHE_SIZE = config('ANSWER_KEY_CACHE_SIZE', cast=int, default=256)
+ANSWER_KEY_CACHE_TIMEOUT = config('ANSWER_KEY_CACHE_TIMEOUT', cast=int, default=24*60*60)
+
+# authentication caches, see eneza.authentication.authentication
+AUTH_CACHE_SIZE = config('AUTH_CACHE_SIZE', cast=int, default=10000)
+AUTH_CACHE_TIMEOUT = config('AUTH_CACHE_TIMEOUT', cast=int, default=5*60)
+AUTH_CACHE_LOCAL_TTL = config('AUTH_CACHE_LOCAL_TTL', cast=int, default=5)
+AUTH_BASIC_CACHE_TIMEOUT = config('AUTH_BASIC_CACHE_TIMEOUT', cast=int, default=60)
+AUTH_TOKEN_TTL = config('AUTH_TOKEN_TTL', cast=int, default=7*24*60*60)
+
+# rendered question and content payloads, see eneza.services.content_cache
+RENDERED_CONTENT_CACHE_SIZE = config('RENDERED_CONTENT_CACHE_SIZE', cast=int, default=512)
+RENDERED_CONTENT_CACHE_TIMEOUT = config('RENDERED_CONTENT_CACHE_TIMEOUT', cast=int, default=60*60)
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -129,12 +222,14 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR,'media')
 MAX_VIDEO_UPLOAD_SIZE= config('MAX_VIDEO_UPLOAD_SIZE', cast=int, default=104857600)
+# largest chunk of a resumable upload, see eneza.services.video_uploads
+VIDEO_UPLOAD_CHUNK_SIZE = config('VIDEO_UPLOAD_CHUNK_SIZE', cast=int, default=8388608)
 ALLOWED_VIDEO_EXTENSIONS = config('ALLOWED_VIDEO_EXTENSIONS', cast=Csv(), default=['mp4'])
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication'
+        'eneza.authentication.authentication.CachedBasicAuthentication',
+        'eneza.authentication.authentication.ExpiringTokenAuthentication'
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -148,7 +243,9 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
 
     ),
-    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'eneza.pagination.KeysetPagination',
+    'PAGE_SIZE': config('PAGE_SIZE', cast=int, default=50),
 }
 
 #cors
@@ -156,4 +253,34 @@ CORS_ORIGIN_ALLOW_ALL = True
 
 #sendgrid
 SENDGRID_API_KEY = config('SENDGRID_API_KEY')
+SENDGRID_API_HOST = config('SENDGRID_API_HOST', default='https://api.sendgrid.com')
+SENDGRID_POOL_SIZE = config('SENDGRID_POOL_SIZE', cast=int, default=10)
+SENDGRID_TIMEOUT = config('SENDGRID_TIMEOUT', cast=float, default=10)
+MAIL_TEMPLATE_CACHE_SIZE = config('MAIL_TEMPLATE_CACHE_SIZE', cast=int, default=64)
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
+
+# email outbox worker, see eneza.services.mailer.outbox
+MAIL_WORKER_BATCH_SIZE = config('MAIL_WORKER_BATCH_SIZE', cast=int, default=50)
+MAIL_WORKER_THREADS = config('MAIL_WORKER_THREADS', cast=int, default=8)
+MAIL_WORKER_MAX_ATTEMPTS = config('MAIL_WORKER_MAX_ATTEMPTS', cast=int, default=5)
+MAIL_WORKER_BACKOFF = config('MAIL_WORKER_BACKOFF', cast=int, default=30)
+MAIL_WORKER_LEASE = config('MAIL_WORKER_LEASE', cast=int, default=300)
+
+# solution telemetry, see eneza.services.activity_log
+# events are written in batches of ACTIVITY_BUFFER_SIZE or after ACTIVITY_FLUSH_INTERVAL
+# seconds, 0 writes them at once, rollover_solution_events removes the older ones
+ACTIVITY_BUFFER_SIZE = config('ACTIVITY_BUFFER_SIZE', cast=int, default=500)
+ACTIVITY_FLUSH_INTERVAL = config('ACTIVITY_FLUSH_INTERVAL', cast=float, default=2)
+ACTIVITY_MAX_BATCH = config('ACTIVITY_MAX_BATCH', cast=int, default=200)
+ACTIVITY_RETENTION_DAYS = config('ACTIVITY_RETENTION_DAYS', cast=int, default=90)
+
+# youtube embed links, see eneza.services.embeds
+# links that can not be parsed offline are resolved by the embed worker
+YOUTUBE_OEMBED_URL = config('YOUTUBE_OEMBED_URL', default='https://www.youtube.com/oembed')
+EMBED_OEMBED_TIMEOUT = config('EMBED_OEMBED_TIMEOUT', cast=float, default=3)
+EMBED_CACHE_SIZE = config('EMBED_CACHE_SIZE', cast=int, default=1024)
+EMBED_WORKER_BATCH_SIZE = config('EMBED_WORKER_BATCH_SIZE', cast=int, default=20)
+EMBED_WORKER_THREADS = config('EMBED_WORKER_THREADS', cast=int, default=4)
+EMBED_WORKER_MAX_ATTEMPTS = config('EMBED_WORKER_MAX_ATTEMPTS', cast=int, default=5)
+EMBED_WORKER_BACKOFF = config('EMBED_WORKER_BACKOFF', cast=int, default=30)
+EMBED_WORKER_LEASE = config('EMBED_WORKER_LEASE', cast=int, default=60)
@@ -16,8 +16,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from eneza.instrumentation import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('eneza.urls')),
-    path('api/v1/auth/', include('eneza.authentication.urls'))
+    path('api/v1/auth/', include('eneza.authentication.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class EnezaConfig(AppConfig):
     name = 'eneza'
+
+    def ready(self):
+        from eneza import checks, signals
+        from eneza.db import signals as db_signals
@@ -0,0 +1,174 @@
+import asyncio, logging, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseChannel:
+    '''
+    Hands the ASGI messages of one response from the worker thread to the event
+    loop. At most `size` messages are in flight so a slow client holds back a
+    streaming response instead of buffering it in memory.
+    '''
+
+    def __init__(self, loop, size=4):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.slots = threading.Semaphore(size)
+        self.closed = False
+
+    def put(self, message):
+        '''
+        Called from the worker thread, returns False once the client is gone.
+        '''
+        if self.closed:
+            return False
+        self.slots.acquire()
+        if self.closed:
+            return False
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+        return True
+
+    async def get(self):
+        message = await self.queue.get()
+        self.slots.release()
+        return message
+
+    def close(self):
+        self.closed = True
+        # wakes a worker waiting for a slot
+        self.slots.release()
+
+
+class ASGIHandler:
+    '''
+    ASGI application running a WSGI application, the Django handler, on a
+    bounded pool of threads.
+
+    The request body is read and the response sent on the event loop, so a
+    client on a slow connection only occupies a thread while the view runs.
+    Django 2.2 has no async views, every request runs start to end on one
+    thread, which keeps the thread local database connections, replica
+    routing and instrumentation working as under WSGI.
+    '''
+
+    def __init__(self, application, max_threads=None):
+        self.application = application
+        self.executor = ThreadPoolExecutor(max_workers=max_threads or settings.ASGI_THREADS,
+            thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError("Unsupported ASGI scope type {}".format(scope["type"]))
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        channel = ResponseChannel(asyncio.get_event_loop())
+        worker = asyncio.get_event_loop().run_in_executor(self.executor, self.run, scope, body, channel)
+        try:
+            while True:
+                message = await channel.get()
+                if message is None:
+                    break
+                await send(message)
+        finally:
+            channel.close()
+            await worker
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type":"lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type":"lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive):
+        '''
+        Returns the request body as a file, spooled to disk above
+        FILE_UPLOAD_MAX_MEMORY_SIZE, or None when the client disconnected.
+        '''
+        body = SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, mode="w+b")
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body.seek(0)
+        return body
+
+    def environ(self, scope, body):
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", ""),
+            # WSGI strings carry the raw bytes as latin-1
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": str(server[0]),
+            "SERVER_PORT": str(server[1]),
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "SERVER_PROTOCOL": "HTTP/{}".format(scope.get("http_version", "1.1")),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = "HTTP_" + name
+            environ[name] = environ[name] + "," + value if name in environ else value
+        return environ
+
+    def run(self, scope, body, channel):
+        '''
+        Runs the request on a worker thread, start to end.
+        '''
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started.append({
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            })
+
+        try:
+            response = self.application(self.environ(scope, body), start_response)
+            try:
+                if not channel.put(started[0]):
+                    return
+                for chunk in response:
+                    if chunk and not channel.put({"type":"http.response.body", "body":chunk, "more_body":True}):
+                        return
+                channel.put({"type":"http.response.body", "body":b""})
+            finally:
+                if hasattr(response, "close"):
+                    response.close()
+        except Exception:
+            logger.exception("Error serving %s %s", scope["method"], scope["path"])
+            if not started:
+                channel.put({"type":"http.response.start", "status":500,
+                    "headers":[(b"content-type", b"text/plain")]})
+                channel.put({"type":"http.response.body", "body":b"Internal Server Error"})
+        finally:
+            body.close()
+            if not channel.closed:
+                channel.put(None)
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class AuthenticationConfig(AppConfig):
-    name = 'authentication'
+    name = 'eneza.authentication'
+    label = 'authentication'
+
+    def ready(self):
+        from eneza.authentication import signals
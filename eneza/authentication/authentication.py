@@ -0,0 +1,155 @@
+import hashlib, hmac
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from eneza.authentication.models import ExpiringToken
+from eneza.checks import shared_cache
+from eneza.services.content_versions import get_version, bump_version
+from eneza.services.utils import LRUCache
+
+
+TOKEN_KEY = "eneza:auth-token:{key}"
+CREDENTIALS_KEY = "eneza:auth-basic:{digest}"
+USER_VERSION_KEY = "eneza:auth-user-version:{user_id}"
+REVOKED_KEY = "eneza:auth-revoked:{key}"
+
+# entries of the process local caches are not invalidated across processes,
+# their ttl bounds how long another process can serve a stale user
+local_tokens = LRUCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_LOCAL_TTL)
+local_credentials = LRUCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_CACHE_LOCAL_TTL)
+
+
+def invalidate_token(key):
+    local_tokens.delete(key)
+    cache.delete(TOKEN_KEY.format(key=key))
+
+
+def invalidate_user(user_id):
+    '''
+    Drops every cached authentication of the user, call when the user changes.
+    '''
+    for model in (Token, ExpiringToken):
+        for key in model.objects.filter(user_id=user_id).values_list("key", flat=True):
+            invalidate_token(key)
+    local_credentials.clear()
+    bump_version(USER_VERSION_KEY.format(user_id=user_id))
+
+
+def is_revoked(key):
+    '''
+    Checks the revocation set, only meaningful when the cache is shared.
+    '''
+    return cache.get(REVOKED_KEY.format(key=key)) is not None
+
+
+def revoke_token(token):
+    '''
+    Revokes an expiring token. Once the deletion commits the key is added to
+    the revocation set in the shared cache until the token would have expired,
+    so processes still holding it in their local cache reject it on the next
+    request. A rolled back revocation leaves the token valid.
+    '''
+    key = token.key
+
+    def revoked():
+        remaining = int((token.expires_at - timezone.now()).total_seconds())
+        if remaining > 0:
+            cache.set(REVOKED_KEY.format(key=key), True, timeout=remaining + 1)
+        invalidate_token(key)
+
+    invalidate_token(key)
+    ExpiringToken.objects.filter(pk=token.pk).delete()
+    transaction.on_commit(revoked)
+
+
+@transaction.atomic
+def issue_token(user, device=""):
+    '''
+    Issues a new token for the user's device, revoking the one it replaces.
+    '''
+    for token in ExpiringToken.objects.select_for_update().filter(user=user, device=device):
+        revoke_token(token)
+    return ExpiringToken.objects.create(key=ExpiringToken.generate_key(), user=user, device=device,
+        expires_at=timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''
+    TokenAuthentication that caches the (user, token) pair of a key in a
+    process local LRU in front of the shared django cache, so only the first
+    request with a key in AUTH_CACHE_TIMEOUT seconds reads the database.
+    '''
+
+    def authenticate_credentials(self, key):
+        credentials = local_tokens.get(key)
+        if credentials is not None:
+            return credentials
+        cache_key = TOKEN_KEY.format(key=key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials, timeout=settings.AUTH_CACHE_TIMEOUT)
+        local_tokens.set(key, credentials)
+        return credentials
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    '''
+    BasicAuthentication that remembers verified credentials for
+    AUTH_BASIC_CACHE_TIMEOUT seconds so the password hasher does not run on
+    every request. Credentials are cached under a keyed digest, never in clear,
+    and a setting of 0 disables the cache.
+    '''
+
+    def credentials_digest(self, userid, password):
+        message = "{}\0{}".format(userid, password).encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+    def authenticate_credentials(self, userid, password, request=None):
+        timeout = settings.AUTH_BASIC_CACHE_TIMEOUT
+        if not timeout:
+            return super().authenticate_credentials(userid, password, request=request)
+        digest = self.credentials_digest(userid, password)
+        cached = local_credentials.get(digest) or cache.get(CREDENTIALS_KEY.format(digest=digest))
+        if cached is not None:
+            user, version = cached
+            if version == get_version(USER_VERSION_KEY.format(user_id=user.pk)):
+                local_credentials.set(digest, cached)
+                return (user, None)
+        user = super().authenticate_credentials(userid, password, request=request)[0]
+        cached = (user, get_version(USER_VERSION_KEY.format(user_id=user.pk)))
+        cache.set(CREDENTIALS_KEY.format(digest=digest), cached, timeout=timeout)
+        local_credentials.set(digest, cached, ttl=min(timeout, settings.AUTH_CACHE_LOCAL_TTL))
+        return (user, None)
+
+
+class ExpiringTokenAuthentication(CachedTokenAuthentication):
+    '''
+    Authenticates ExpiringTokens. Expiry is checked on the cached token and
+    revocation against the revocation set, so neither costs a query.
+
+    Revoked tokens are deleted, so a key missing from the caches is checked
+    against its row. Cached tokens are only trusted when the cache is shared,
+    see eneza.checks: with a process local cache another worker never sees
+    the revocation set and every request reads the row.
+    '''
+    model = ExpiringToken
+
+    def authenticate_credentials(self, key):
+        if not shared_cache():
+            user, token = TokenAuthentication.authenticate_credentials(self, key)
+        elif is_revoked(key):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        else:
+            user, token = super().authenticate_credentials(key)
+        if token.is_expired:
+            invalidate_token(key)
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        return (user, token)
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from eneza.authentication.models import ExpiringToken
+
+
+class Command(BaseCommand):
+    help = "Deletes expired authentication tokens in small chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="tokens deleted per statement")
+        parser.add_argument('--sleep', type=float, default=0, help="seconds to wait between chunks")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            # each chunk is its own short transaction, selected through the
+            # expires_at index so the table is never locked for the whole purge
+            keys = list(ExpiringToken.objects.filter(expires_at__lte=now)
+                .values_list('key', flat=True)[:options['chunk_size']])
+            if not keys:
+                break
+            # delete() sends post_delete, which drops the cached tokens
+            deleted += ExpiringToken.objects.filter(key__in=keys).delete()[0]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write("Deleted {} expired tokens".format(deleted))
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.6 on 2026-10-18 16:40
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def copy_legacy_tokens(apps, schema_editor):
+    # existing clients keep their token, it now expires after AUTH_TOKEN_TTL
+    Token = apps.get_model('authtoken', 'Token')
+    ExpiringToken = apps.get_model('authentication', 'ExpiringToken')
+    expires_at = timezone.now() + timedelta(seconds=settings.AUTH_TOKEN_TTL)
+    ExpiringToken.objects.bulk_create(
+        ExpiringToken(key=token.key, user_id=token.user_id, expires_at=expires_at)
+        for token in Token.objects.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+        ('authtoken', '0002_auto_20160226_1747'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpiringToken',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False, verbose_name='key')),
+                ('device', models.CharField(blank=True, default='', max_length=64, verbose_name='device')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='issued at')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='expires at')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expiring_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'expiring token',
+                'verbose_name_plural': 'expiring tokens',
+                'db_table': 'expiring_tokens',
+                'unique_together': {('user', 'device')},
+            },
+        ),
+        migrations.RunPython(copy_legacy_tokens, migrations.RunPython.noop),
+    ]
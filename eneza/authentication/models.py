@@ -1,3 +1,4 @@
+import binascii, os
 from django.db import models
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import  PermissionsMixin
@@ -104,3 +105,32 @@ class AbstractUser(AbstractBaseUser, PermissionsMixin):
 
 class User(AbstractUser):
     confirm_email = models.BooleanField(default=False)
+
+
+class ExpiringToken(models.Model):
+    """
+    An authentication token with an expiry, one per user and device.
+    Logging in again from a device rotates its token.
+    """
+    key = models.CharField(_("key"), max_length=40, primary_key=True)
+    user = models.ForeignKey(User, related_name="expiring_tokens", on_delete=models.CASCADE)
+    device = models.CharField(_("device"), max_length=64, blank=True, default="")
+    created = models.DateTimeField(_("issued at"), auto_now_add=True)
+    expires_at = models.DateTimeField(_("expires at"), db_index=True)
+
+    class Meta:
+        db_table = "expiring_tokens"
+        verbose_name = _("expiring token")
+        verbose_name_plural = _("expiring tokens")
+        unique_together = [("user", "device")]
+
+    def __str__(self):
+        return self.key
+
+    @staticmethod
+    def generate_key():
+        return binascii.hexlify(os.urandom(20)).decode()
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
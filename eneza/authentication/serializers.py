@@ -50,6 +50,7 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False
     )
+    device = serializers.CharField(label=_("device"), max_length=64, required=False, allow_blank=True, default="")
 
     def validate(self, attrs):
         email = attrs.get('email')
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from eneza.authentication.authentication import invalidate_token, invalidate_user
+from eneza.authentication.models import User, ExpiringToken
+
+
+@receiver(post_save, sender=Token, dispatch_uid="auth-cache-token-save")
+@receiver(post_delete, sender=Token, dispatch_uid="auth-cache-token-delete")
+@receiver(post_delete, sender=ExpiringToken, dispatch_uid="auth-cache-expiring-token-delete")
+def invalidate_cached_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User, dispatch_uid="auth-cache-user-save")
+@receiver(pre_delete, sender=User, dispatch_uid="auth-cache-user-delete")
+def invalidate_cached_user(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_user(instance.pk)
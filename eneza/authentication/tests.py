@@ -1,3 +1,178 @@
-from django.test import TestCase
+import base64, os, tempfile
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from eneza.authentication import authentication
+from eneza.authentication.models import User, ExpiringToken
+
+# a cache every process of the host shares, cached tokens are only trusted with one
+SHARED_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'eneza-test-cache'),
+}}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class AuthenticationCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        authentication.local_tokens.clear()
+        authentication.local_credentials.clear()
+        self.user = User.objects.create_user(email="student@example.com", password="secret123",
+            first_name="Student", last_name="One")
+        self.token = authentication.issue_token(self.user)
+        self.client = APIClient()
+
+    def get_details(self):
+        return self.client.get("/api/v1/auth/users/details/")
+
+    def test_token_is_read_once(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        self.assertEqual(self.get_details().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_details().status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        self.assertEqual(self.get_details().status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.get_details().status_code, 401)
+
+    def test_user_change_invalidates_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token.key)
+        self.assertEqual(self.get_details().data["first_name"], "Student")
+        response = self.client.post("/api/v1/auth/users/%s/edit_user/" % self.user.pk, {"first_name":"Renamed"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_details().data["first_name"], "Renamed")
+
+    def test_basic_credentials_are_cached_until_password_change(self):
+        def basic(password):
+            raw = "student@example.com:" + password
+            return "Basic " + base64.b64encode(raw.encode()).decode()
+
+        self.client.credentials(HTTP_AUTHORIZATION=basic("secret123"))
+        self.assertEqual(self.get_details().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_details().status_code, 200)
+        self.assertEqual(len(queries), 0)
+
+        response = self.client.post("/api/v1/auth/users/%s/change_password/" % self.user.pk,
+            {"current_password":"secret123", "new_password":"secret456"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_details().status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION=basic("secret456"))
+        self.assertEqual(self.get_details().status_code, 200)
+
+
+class ExpiringTokenTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        authentication.local_tokens.clear()
+        self.user = User.objects.create_user(email="student@example.com", password="secret123",
+            first_name="Student", last_name="One")
+        self.client = APIClient()
+
+    def login(self, device=""):
+        response = self.client.post("/api/v1/auth/token/login",
+            {"email":"student@example.com", "password":"secret123", "device":device})
+        self.assertEqual(response.status_code, 200)
+        return response.data["token"]
+
+    def get_details(self, key):
+        return self.client.get("/api/v1/auth/users/details/", HTTP_AUTHORIZATION="Token " + key)
+
+    def test_tokens_are_per_device_and_rotate(self):
+        phone = self.login("phone")
+        laptop = self.login("laptop")
+        self.assertEqual(self.get_details(phone).status_code, 200)
+        rotated = self.login("phone")
+        self.assertEqual(self.get_details(phone).status_code, 401)
+        self.assertEqual(self.get_details(rotated).status_code, 200)
+        self.assertEqual(self.get_details(laptop).status_code, 200)
+
+    def test_expired_token_is_rejected(self):
+        key = self.login()
+        self.assertEqual(self.get_details(key).status_code, 200)
+        ExpiringToken.objects.filter(key=key).update(expires_at=timezone.now() - timedelta(seconds=1))
+        authentication.invalidate_token(key)
+        self.assertEqual(self.get_details(key).status_code, 401)
+
+    def test_logout_revokes_cached_token(self):
+        key = self.login()
+        self.assertEqual(self.get_details(key).status_code, 200)
+        response = self.client.post("/api/v1/auth/token/logout", HTTP_AUTHORIZATION="Token " + key)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ExpiringToken.objects.filter(key=key).exists())
+        # another process may still hold the token in its local cache
+        authentication.local_tokens.set(key, (self.user, ExpiringToken(key=key, user=self.user,
+            expires_at=timezone.now() + timedelta(hours=1))))
+        self.assertEqual(self.get_details(key).status_code, 401)
+
+    def test_process_local_cache_reads_token_row(self):
+        key = self.login()
+        self.assertEqual(self.get_details(key).status_code, 200)
+        # a revocation by another process only deleted the row
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM {} WHERE key = %s".format(ExpiringToken._meta.db_table), [key])
+        self.assertEqual(self.get_details(key).status_code, 401)
+
+    def test_purge_expired_tokens(self):
+        now = timezone.now()
+        for i in range(5):
+            ExpiringToken.objects.create(key=ExpiringToken.generate_key(), user=self.user, device=str(i),
+                expires_at=now + timedelta(hours=1 if i % 2 else -1))
+        call_command("purge_expired_tokens", chunk_size=2, stdout=open("/dev/null", "w"))
+        self.assertEqual(ExpiringToken.objects.count(), 2)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class TokenRevocationTestCase(TransactionTestCase):
+    '''
+    Revocations are written to the cache once their transaction commits,
+    TestCase never commits.
+    '''
+
+    def setUp(self):
+        cache.clear()
+        authentication.local_tokens.clear()
+        self.user = User.objects.create_user(email="student@example.com", password="secret123",
+            first_name="Student", last_name="One")
+        self.client = APIClient()
+
+    def get_details(self, key):
+        return self.client.get("/api/v1/auth/users/details/", HTTP_AUTHORIZATION="Token " + key)
+
+    def hold_in_local_cache(self, key):
+        # another process may still hold the token in its local cache
+        authentication.local_tokens.set(key, (self.user, ExpiringToken(key=key, user=self.user,
+            expires_at=timezone.now() + timedelta(hours=1))))
+
+    def test_logout_revokes_token_in_shared_cache(self):
+        key = authentication.issue_token(self.user).key
+        self.assertEqual(self.get_details(key).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_details(key).status_code, 200)
+        self.assertEqual(len(queries), 0)
+        response = self.client.post("/api/v1/auth/token/logout", HTTP_AUTHORIZATION="Token " + key)
+        self.assertEqual(response.status_code, 204)
+        self.hold_in_local_cache(key)
+        self.assertEqual(self.get_details(key).status_code, 401)
+
+    def test_rolled_back_revocation_keeps_token(self):
+        token = authentication.issue_token(self.user)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                authentication.revoke_token(token)
+                raise RuntimeError("rolled back")
+        self.assertFalse(authentication.is_revoked(token.key))
+        self.hold_in_local_cache(token.key)
+        self.assertEqual(self.get_details(token.key).status_code, 200)
@@ -1,6 +1,6 @@
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from eneza.authentication.views import UserView, ObtainAuthToken
+from eneza.authentication.views import UserView, ObtainAuthToken, LogoutView
 
 
 router =  DefaultRouter()
@@ -10,5 +10,6 @@ router.register(r'users',UserView,base_name="users-view")
 urlpatterns=[
    path("", include(router.urls)),
     path("token/login",ObtainAuthToken.as_view(), name="api-token-login"),
+    path("token/logout",LogoutView.as_view(), name="api-token-logout"),
 
 ]
\ No newline at end of file
@@ -1,6 +1,5 @@
 from django.shortcuts import get_object_or_404
 from rest_framework import parsers, renderers
-from rest_framework.authtoken.models import Token
 from rest_framework.compat import coreapi, coreschema
 from rest_framework.schemas import ManualSchema
 from rest_framework.views import APIView
@@ -10,9 +9,10 @@ from rest_framework.permissions import AllowAny, BasePermission,IsAuthenticated
 from rest_framework import status
 from rest_framework.decorators import action
 
+from eneza.authentication.authentication import issue_token, revoke_token
 from eneza.authentication.serializers import UserSerializer, AuthTokenSerializer,\
                              ChangePasswordSerializer, EditUserSerializer
-from eneza.authentication.models import User
+from eneza.authentication.models import User, ExpiringToken
 
 class IsCurrentUser(BasePermission):
     def has_permission(self, request, view):
@@ -106,6 +106,15 @@ class ObtainAuthToken(APIView):
                         description="Valid password for authentication",
                     ),
                 ),
+                coreapi.Field(
+                    name="device",
+                    required=False,
+                    location='form',
+                    schema=coreschema.String(
+                        title="device",
+                        description="Name of the device, logging in again from it rotates its token",
+                    ),
+                ),
             ],
             encoding="application/json",
         )
@@ -115,5 +124,14 @@ class ObtainAuthToken(APIView):
                                            context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
-        return Response({'token': token.key})
+        token = issue_token(user, device=serializer.validated_data['device'])
+        return Response({'token': token.key, 'expires_at': token.expires_at})
+
+class LogoutView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.auth, ExpiringToken):
+            return Response({"error":"Not logged in with a token"}, status=status.HTTP_400_BAD_REQUEST)
+        revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
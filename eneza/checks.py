@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# backends whose entries are only visible to the process that wrote them
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache():
+    '''
+    True when every process reads the same default cache, so a version bump or
+    a token revocation written by one worker is seen by all of them.
+    '''
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if shared_cache() or settings.DEBUG:
+        return []
+    return [Warning(
+        "The default cache is private to each process",
+        hint="Content versions, answer key invalidations and token revocations only reach the worker that "
+            "wrote them, set CACHE_URL to a redis:// or memcached:// url",
+        id="eneza.W001",
+    )]
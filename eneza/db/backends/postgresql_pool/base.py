@@ -0,0 +1,74 @@
+'''
+PostgreSQL backend that keeps connections in a per process pool instead of
+closing them, see eneza.db.pool.ConnectionPool.
+
+Configured from the POOL entry of the database settings:
+    {'MAX_SIZE': 10, 'TIMEOUT': 10, 'HEALTH_CHECK_INTERVAL': 10}
+CONN_MAX_AGE should be 0 so that Django hands the connection back to the
+pool at the end of every request.
+'''
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from eneza.db.pool import ConnectionPool, connection_stats, get_pool
+
+
+def reset_connection(connection):
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+def is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except base.Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pooled = True
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+
+        def connect():
+            connection = base.Database.connect(**conn_params)
+            if isolation_level is not None and isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=isolation_level)
+            return connection
+
+        def factory():
+            return ConnectionPool(
+                connect,
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10),
+                reset=reset_connection,
+                is_usable=is_usable,
+                health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 10),
+                stats=connection_stats[self.alias],
+            )
+        # keyed on the database name too, creating the test database renames it
+        return get_pool((self.alias, conn_params.get('database')), factory)
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        connection = pool.acquire()
+        self.pool = pool
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # the wrapper must not keep a connection another thread may now be using
+            connection, self.connection = self.connection, None
+            with self.wrap_database_errors:
+                self.pool.release(connection)
@@ -0,0 +1,145 @@
+import threading, time
+from collections import Counter, defaultdict, deque
+
+from django.db.utils import OperationalError
+
+# per alias counters: opened, health_closed and, for pooled aliases,
+# acquired, waited, wait_seconds and timeouts
+connection_stats = defaultdict(Counter)
+
+pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    '''
+    Thread safe pool of at most max_size open connections.
+
+    acquire hands out the most recently released idle connection, opens a new
+    one while the pool is below max_size, and otherwise waits up to timeout
+    seconds for a release. Idle connections older than health_check_interval
+    are checked with is_usable before they are handed out again. reset is
+    called on release and returns False when the connection must be dropped.
+    '''
+
+    def __init__(self, connect, max_size, timeout=10, reset=None, is_usable=None, health_check_interval=None,
+            stats=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.reset = reset
+        self.is_usable = is_usable
+        self.health_check_interval = health_check_interval
+        self.stats = stats if stats is not None else Counter()
+        self.idle = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _count(self, *names):
+        with self.condition:
+            for name in names:
+                self.stats[name] += 1
+
+    def _stale(self, released_at):
+        return bool(self.health_check_interval) and time.monotonic() - released_at > self.health_check_interval
+
+    def _discard(self, connection):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+        self._close(connection)
+
+    def _checkout(self, deadline):
+        '''
+        Returns (connection, released_at) of an idle connection, or (None, None)
+        after reserving a slot for a new one.
+        '''
+        waited_since = None
+        with self.condition:
+            try:
+                while True:
+                    if self.idle:
+                        return self.idle.pop()
+                    if self.size < self.max_size:
+                        self.size += 1
+                        return None, None
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self.stats["waited"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise PoolTimeout("No database connection available after {}s".format(self.timeout))
+                    self.condition.wait(remaining)
+            finally:
+                if waited_since is not None:
+                    self.stats["wait_seconds"] += time.monotonic() - waited_since
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection, released_at = self._checkout(deadline)
+            if connection is None:
+                break
+            # the health check runs outside the lock, it is a round trip to the server
+            if self._stale(released_at) and self.is_usable is not None and not self.is_usable(connection):
+                self._count("health_closed")
+                self._discard(connection)
+                continue
+            self._count("acquired")
+            return connection
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        self._count("opened", "acquired")
+        return connection
+
+    def release(self, connection):
+        try:
+            reusable = self.reset(connection) if self.reset is not None else True
+        except Exception:
+            reusable = False
+        if not reusable:
+            self._discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def close_all(self):
+        with self.condition:
+            idle, self.idle = self.idle, deque()
+            self.size -= len(idle)
+        for connection, released_at in idle:
+            self._close(connection)
+
+    @property
+    def in_use(self):
+        return self.size - len(self.idle)
+
+
+def get_pool(key, factory):
+    '''
+    Returns the process wide pool stored under key, created with factory() on first use.
+    '''
+    pool = pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = pools.get(key)
+            if pool is None:
+                pool = pools[key] = factory()
+    return pool
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from eneza.db.pool import connection_stats
+
+
+@receiver(connection_created, dispatch_uid="db-count-opened")
+def count_opened_connection(sender, connection, **kwargs):
+    # pooled backends count the connections they actually open themselves
+    if not getattr(connection, "pooled", False):
+        connection_stats[connection.alias]["opened"] += 1
+
+
+@receiver(request_started, dispatch_uid="db-health-check")
+def check_persistent_connections(**kwargs):
+    '''
+    Closes persistent connections the server dropped while they were idle,
+    checking each at most once per DATABASE_HEALTH_CHECK_INTERVAL seconds so a
+    request never starts on a dead connection.
+    '''
+    interval = settings.DATABASE_HEALTH_CHECK_INTERVAL
+    if not interval:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or not connection.settings_dict['CONN_MAX_AGE']:
+            continue
+        if getattr(connection, "pooled", False) or connection.in_atomic_block:
+            continue
+        if now - getattr(connection, "health_checked_at", 0) < interval:
+            continue
+        connection.health_checked_at = now
+        if not connection.is_usable():
+            connection_stats[connection.alias]["health_closed"] += 1
+            connection.close()
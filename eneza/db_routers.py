@@ -0,0 +1,154 @@
+import hashlib, logging, random, threading, time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+
+def reading_from_replica():
+    return getattr(_state, "replica", False)
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    '''
+    Routes the reads of the block to a replica, see ReplicaRouter.
+    '''
+    previous = reading_from_replica()
+    _state.replica = enabled
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def routed_stream(chunks):
+    '''
+    Iterates chunks with the read routing of the current request. The body of
+    a streaming response is read after ReplicaRoutingMiddleware reset it.
+    '''
+    replica = reading_from_replica()
+    with read_from_replica(replica):
+        yield from chunks
+
+
+class ReplicaLagMonitor:
+    '''
+    Remembers the replication lag of each replica for REPLICA_LAG_CHECK_INTERVAL
+    seconds. Lag is only measurable on PostgreSQL, other backends report none.
+    A replica that can not be reached counts as infinitely behind.
+    '''
+    POSTGRES_LAG_QUERY = (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+
+    def __init__(self):
+        self.lags = {}
+        self.lock = threading.Lock()
+
+    def measure(self, alias):
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            return 0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self.POSTGRES_LAG_QUERY)
+                return float(cursor.fetchone()[0] or 0)
+        except DatabaseError as error:
+            logger.warning("Replica %s is unavailable: %s", alias, error)
+            return float("inf")
+
+    def lag(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            lag, checked_at = self.lags.get(alias, (None, 0))
+        if lag is None or now - checked_at > settings.REPLICA_LAG_CHECK_INTERVAL:
+            lag = self.measure(alias)
+            with self.lock:
+                self.lags[alias] = (lag, now)
+        return lag
+
+
+lag_monitor = ReplicaLagMonitor()
+
+
+class ReplicaRouter:
+    '''
+    Sends reads to a replica while the current request allows it, everything
+    else goes to the primary: writes, reads inside a transaction on the primary
+    and reads of the authentication apps, which must see a token as soon as it
+    is issued. Replicas lagging more than REPLICA_MAX_LAG seconds are skipped.
+    '''
+    primary_apps = ("auth", "authentication", "authtoken", "contenttypes", "sessions")
+
+    def choose_replica(self):
+        replicas = settings.DATABASE_REPLICAS
+        if settings.REPLICA_MAX_LAG is not None:
+            replicas = [alias for alias in replicas if lag_monitor.lag(alias) <= settings.REPLICA_MAX_LAG]
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not reading_from_replica():
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in self.primary_apps or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self.choose_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    '''
+    Lets safe requests to the eneza viewsets read from a replica.
+
+    Actions that write on GET are listed in the viewset's `primary_actions`.
+    After a client writes, its reads stay on the primary for
+    REPLICA_STICKY_SECONDS so that it reads its own writes. Clients are told
+    apart by their Authorization header, or session cookie.
+    '''
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+    STICKY_KEY = "eneza:replica-sticky:{client}"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def client_key(self, request):
+        credentials = request.META.get("HTTP_AUTHORIZATION") or request.COOKIES.get(settings.SESSION_COOKIE_NAME, "")
+        client = hashlib.sha256(credentials.encode()).hexdigest()[:32]
+        return self.STICKY_KEY.format(client=client)
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        request._writes = request.method not in self.SAFE_METHODS
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.replica = False
+        if request._writes:
+            cache.set(self.client_key(request), True, timeout=settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DATABASE_REPLICAS or request._writes:
+            return
+        cls = getattr(view_func, "cls", None)
+        if cls is None or not cls.__module__.startswith("eneza."):
+            return
+        action = (getattr(view_func, "actions", None) or {}).get(request.method.lower())
+        if action in getattr(cls, "primary_actions", ()):
+            request._writes = True
+            return
+        if cache.get(self.client_key(request)) is None:
+            _state.replica = True
@@ -7,8 +7,23 @@ class InvalidPermissionsException(APIException):
     default_detail = _('Invalid Permissions')
     default_code = 'error'
 
+class ForbiddenException(APIException):
+    status_code = status.HTTP_403_FORBIDDEN
+    default_detail = _('Forbidden')
+    default_code = 'error'
+
 class SimpleValidationError(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = _('Invalid data')
     default_code = 'error'
 
+
+class ConflictException(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = _('Conflict')
+    default_code = 'error'
+
+class PayloadTooLargeException(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('Payload too large')
+    default_code = 'error'
@@ -0,0 +1,219 @@
+import hmac, random, threading, time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from eneza.db.pool import connection_stats, pools
+from eneza.services.activity_log import event_stats
+
+_local = threading.local()
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RequestMetrics:
+    '''
+    Measurements of a single sampled request.
+    '''
+
+    def __init__(self):
+        self.tag = "unresolved"
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = defaultdict(float)
+        self.depth = defaultdict(int)
+
+
+def current_metrics():
+    return getattr(_local, "metrics", None)
+
+
+@contextmanager
+def timer(kind):
+    '''
+    Adds the time spent in the block to the current request's `kind` timing.
+    Nested timers of the same kind only count once and outside of a sampled
+    request the block runs unmeasured.
+    '''
+    metrics = current_metrics()
+    if metrics is None or metrics.depth[kind]:
+        yield
+        return
+    metrics.depth[kind] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[kind] += time.perf_counter() - started
+        metrics.depth[kind] -= 1
+
+
+def query_wrapper(execute, sql, params, many, context):
+    metrics = current_metrics()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+class MetricsRegistry:
+    '''
+    Process wide aggregate of the sampled requests, keyed on the view tag.
+    '''
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = defaultdict(int)
+            self.durations = {}
+            self.queries = defaultdict(int)
+            self.db_time = defaultdict(float)
+            self.phases = defaultdict(float)
+
+    def record(self, metrics, status, duration):
+        with self.lock:
+            self.requests[(metrics.tag, status)] += 1
+            histogram = self.durations.setdefault(metrics.tag, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += duration
+            histogram[2] += 1
+            self.queries[metrics.tag] += metrics.queries
+            self.db_time[metrics.tag] += metrics.db_time
+            for kind, seconds in metrics.timings.items():
+                self.phases[(metrics.tag, kind)] += seconds
+
+    def render(self):
+        '''
+        Returns the metrics in the Prometheus text exposition format.
+        '''
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+
+        with self.lock:
+            metric("eneza_requests_total", "counter", "Sampled requests by view and status")
+            for (tag, status), count in sorted(self.requests.items()):
+                lines.append('eneza_requests_total{{view="{}",status="{}"}} {}'.format(tag, status, count))
+            metric("eneza_request_duration_seconds", "histogram", "Duration of sampled requests")
+            for tag, (counts, total, count) in sorted(self.durations.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append('eneza_request_duration_seconds_bucket{{view="{}",le="{}"}} {}'.format(
+                        tag, bound, bucket_count))
+                lines.append('eneza_request_duration_seconds_bucket{{view="{}",le="+Inf"}} {}'.format(tag, count))
+                lines.append('eneza_request_duration_seconds_sum{{view="{}"}} {:.6f}'.format(tag, total))
+                lines.append('eneza_request_duration_seconds_count{{view="{}"}} {}'.format(tag, count))
+            metric("eneza_db_queries_total", "counter", "Database queries of sampled requests")
+            for tag, count in sorted(self.queries.items()):
+                lines.append('eneza_db_queries_total{{view="{}"}} {}'.format(tag, count))
+            metric("eneza_db_duration_seconds_total", "counter", "Database time of sampled requests")
+            for tag, seconds in sorted(self.db_time.items()):
+                lines.append('eneza_db_duration_seconds_total{{view="{}"}} {:.6f}'.format(tag, seconds))
+            metric("eneza_phase_duration_seconds_total", "counter",
+                "Serializer, template and external http time of sampled requests")
+            for (tag, kind), seconds in sorted(self.phases.items()):
+                lines.append('eneza_phase_duration_seconds_total{{view="{}",phase="{}"}} {:.6f}'.format(
+                    tag, kind, seconds))
+        metric("eneza_db_connection_events_total", "counter",
+            "Database connections opened, acquired from a pool, waited for, timed out or closed by a health check")
+        for alias, stats in sorted(connection_stats.items()):
+            for event, count in sorted(stats.items()):
+                if event != "wait_seconds":
+                    lines.append('eneza_db_connection_events_total{{alias="{}",event="{}"}} {}'.format(alias, event, count))
+        metric("eneza_db_pool_wait_seconds_total", "counter", "Time spent waiting for a pooled connection")
+        for alias, stats in sorted(connection_stats.items()):
+            if "wait_seconds" in stats:
+                lines.append('eneza_db_pool_wait_seconds_total{{alias="{}"}} {:.6f}'.format(alias, stats["wait_seconds"]))
+        metric("eneza_db_pool_connections", "gauge", "Open pooled connections by state")
+        for (alias, database), pool in sorted(pools.items(), key=lambda item: str(item[0])):
+            lines.append('eneza_db_pool_connections{{alias="{}",state="in_use"}} {}'.format(alias, pool.in_use))
+            lines.append('eneza_db_pool_connections{{alias="{}",state="idle"}} {}'.format(alias, len(pool.idle)))
+        metric("eneza_activity_events_total", "counter", "Solution events buffered, flushed or dropped")
+        for event, count in sorted(event_stats.items()):
+            lines.append('eneza_activity_events_total{{event="{}"}} {}'.format(event, count))
+        metric("eneza_instrumentation_sample_rate", "gauge", "Fraction of requests that are measured")
+        lines.append("eneza_instrumentation_sample_rate {}".format(settings.INSTRUMENTATION_SAMPLE_RATE))
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def view_tag(request, view_func):
+    '''
+    Names the view as View.action, e.g. QuizView.submit_quiz.
+    '''
+    cls = getattr(view_func, "cls", None)
+    if cls is None:
+        return getattr(view_func, "__name__", "unknown")
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return "{}.{}".format(cls.__name__, action)
+
+
+class InstrumentationMiddleware:
+    '''
+    Measures a sampled fraction of requests: query count and database time
+    through an execute wrapper on every connection, plus the serializer,
+    template and external http timings recorded with `timer`. Sampled responses
+    carry a Server-Timing header and are aggregated in `registry`.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.INSTRUMENTATION_SAMPLE_RATE or random.random() >= settings.INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+        metrics = _local.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(query_wrapper))
+                response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        duration = time.perf_counter() - started
+        registry.record(metrics, response.status_code, duration)
+        response["Server-Timing"] = self.server_timing(metrics, duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.tag = view_tag(request, view_func)
+
+    def server_timing(self, metrics, duration):
+        entries = ['db;dur={:.2f};desc="{} queries"'.format(metrics.db_time * 1000, metrics.queries)]
+        for kind, seconds in sorted(metrics.timings.items()):
+            entries.append("{};dur={:.2f}".format(kind, seconds * 1000))
+        entries.append("total;dur={:.2f}".format(duration * 1000))
+        return ", ".join(entries)
+
+
+def metrics_view(request):
+    '''
+    Prometheus scrape endpoint, the scraper must send METRICS_TOKEN as a bearer
+    token. Without a token configured the endpoint is never served.
+    '''
+    expected = ("Bearer " + settings.METRICS_TOKEN).encode()
+    # compare_digest only takes ascii strings, a header with other characters must not raise
+    given = request.META.get("HTTP_AUTHORIZATION", "").encode("utf-8", "surrogateescape")
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(given, expected):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,34 @@
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+@contextmanager
+def benchmark_database(keepdb=False, alias='default', test_name=None):
+    '''
+    Runs the block against a freshly created test database so benchmarks never
+    write seed data into the configured database. test_name overrides the test
+    database name, e.g. a file so that SQLite can be shared between threads.
+    '''
+    connection = connections[alias]
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if test_name:
+        test_settings['NAME'] = test_name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        test_settings['NAME'] = old_test_name
+
+
+def percentile(values, p):
+    '''
+    Nearest rank percentile of a sorted list.
+    '''
+    if not values:
+        return None
+    index = max(int(round(p / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
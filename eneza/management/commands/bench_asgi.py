@@ -0,0 +1,205 @@
+import json, os, socket, tempfile, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import WSGIServer
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+
+from eneza.asgi import ASGIHandler
+from eneza.authentication.authentication import issue_token
+from eneza.authentication.models import User
+from eneza.models import VideoTutorial
+from .loadtest import QuietRequestHandler
+from ._utils import benchmark_database, percentile
+
+
+class PooledWSGIServer(WSGIServer):
+    '''
+    WSGI server handling connections on a fixed number of threads, like a
+    threaded gunicorn worker: a thread is held from the first byte of the
+    request to the last byte of the response.
+    '''
+
+    def __init__(self, *args, threads, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+class Command(BaseCommand):
+    help = ("Compares how the WSGI and ASGI deployments keep serving requests while slow clients, "
+        "e.g. phones on a poor connection, hold connections open")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="threads per deployment")
+        parser.add_argument('--slow-clients', type=int, default=32,
+            help="clients trickling a login request body over --slow-seconds")
+        parser.add_argument('--slow-seconds', type=float, default=3)
+        parser.add_argument('--probes', type=int, default=20,
+            help="tutorial listings requested while the slow clients are connected")
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument('--deployments', default="wsgi,asgi")
+        parser.add_argument('--output', default=None, help="write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        deployments = options['deployments'].split(",")
+        if "asgi" in deployments:
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                raise CommandError("The ASGI deployment is served with uvicorn, pip install uvicorn")
+        settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['127.0.0.1']
+        self.options = options
+        test_name = None
+        if connection.vendor == 'sqlite':
+            # an in memory database can not be shared with the server threads
+            test_name = os.path.join(tempfile.gettempdir(), "eneza_bench_asgi.sqlite3")
+            self.stderr.write("SQLite serializes writers, some of the slow clients' logins may fail with "
+                "'database is locked', use PostgreSQL for realistic numbers")
+        report = OrderedDict()
+        with benchmark_database(test_name=test_name):
+            token = self.seed(options['slow_clients'])
+            for deployment in deployments:
+                server = self.wsgi_server if deployment == "wsgi" else self.asgi_server
+                with server(options['threads']) as port:
+                    report[deployment] = self.run(port, token)
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write("results written to {}".format(options['output']))
+
+    def seed(self, slow_clients):
+        owner = User.objects.create_user("owner@bench.local", "password")
+        # copies the password hash, hashing it for every client would dominate the setup
+        User.objects.bulk_create([User(email="slow{}@bench.local".format(i), password=owner.password)
+            for i in range(slow_clients)])
+        VideoTutorial.objects.bulk_create([VideoTutorial(title="tutorial {}".format(i),
+            video_link="https://youtube.com/embed/x", embed_type=VideoTutorial.YOUTUBE_EMBED, created_by=owner)
+            for i in range(20)])
+        return issue_token(owner, device="bench").key
+
+    @contextmanager
+    def wsgi_server(self, threads):
+        server = PooledWSGIServer(('127.0.0.1', 0), QuietRequestHandler, threads=threads)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server.server_address[1]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    @contextmanager
+    def asgi_server(self, threads):
+        import uvicorn
+        application = ASGIHandler(get_wsgi_application(), max_threads=threads)
+        server = uvicorn.Server(uvicorn.Config(application, lifespan="off", log_level="warning", access_log=False))
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        thread = threading.Thread(target=server.run, kwargs={"sockets":[sock]}, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+        try:
+            yield sock.getsockname()[1]
+        finally:
+            server.should_exit = True
+            thread.join()
+            application.executor.shutdown(wait=True)
+
+    def slow_client(self, port, index, results):
+        '''
+        Sends a login request, trickling the body over --slow-seconds.
+        '''
+        body = json.dumps({"email":"slow{}@bench.local".format(index), "password":"password",
+            "device":"bench"}).encode()
+        head = ("POST /api/v1/auth/token/login HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+            "Content-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(len(body))).encode()
+        pieces = 10
+        size = len(body) // pieces + 1
+        started = time.perf_counter()
+        try:
+            with socket.create_connection(('127.0.0.1', port),
+                    timeout=self.options['slow_seconds'] + self.options['timeout']) as sock:
+                sock.sendall(head)
+                for offset in range(0, len(body), size):
+                    time.sleep(self.options['slow_seconds'] / pieces)
+                    sock.sendall(body[offset:offset + size])
+                response = b""
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        break
+                    response += data
+            status = int(response.split(b" ", 2)[1])
+        except (OSError, IndexError, ValueError):
+            status = None
+        results.append((time.perf_counter() - started, status))
+
+    def probe(self, port, token, results):
+        started = time.perf_counter()
+        try:
+            status = requests.get("http://127.0.0.1:{}/api/v1/video_tutorials/".format(port), timeout=self.options['timeout'],
+                headers={"Authorization":"Token " + token, "Connection":"close"}).status_code
+        except requests.RequestException:
+            status = None
+        results.append((time.perf_counter() - started, status))
+
+    def run(self, port, token):
+        '''
+        Starts the slow clients, then spreads the probes over the time they are connected.
+        '''
+        slow, probes = [], []
+        threads = [threading.Thread(target=self.slow_client, args=(port, i, slow))
+            for i in range(self.options['slow_clients'])]
+        for thread in threads:
+            thread.start()
+        interval = self.options['slow_seconds'] / max(self.options['probes'], 1)
+        for i in range(self.options['probes']):
+            time.sleep(interval)
+            thread = threading.Thread(target=self.probe, args=(port, token, probes))
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        latencies = sorted(elapsed * 1000 for elapsed, status in probes if status == 200)
+        return OrderedDict([
+            ("threads", self.options['threads']),
+            ("slow_clients", len(slow)),
+            ("slow_served", sum(1 for elapsed, status in slow if status is not None and status < 500)),
+            ("probes", len(probes)),
+            ("probes_ok", len(latencies)),
+            ("probe_p50_ms", percentile(latencies, 50)),
+            ("probe_p95_ms", percentile(latencies, 95)),
+            ("probe_max_ms", latencies[-1] if latencies else None),
+        ])
+
+    def print_report(self, report):
+        self.stdout.write("{:<12}{:>8}{:>14}{:>12}{:>10}{:>10}{:>10}".format(
+            "deployment", "threads", "slow served", "probes ok", "p50 ms", "p95 ms", "max ms"))
+        for deployment, stats in report.items():
+            values = [stats[k] if stats[k] is not None else float('nan')
+                for k in ("probe_p50_ms", "probe_p95_ms", "probe_max_ms")]
+            self.stdout.write("{:<12}{:>8}{:>14}{:>12}{:>10.1f}{:>10.1f}{:>10.1f}".format(deployment, stats["threads"],
+                "{slow_served}/{slow_clients}".format(**stats), "{probes_ok}/{probes}".format(**stats), *values))
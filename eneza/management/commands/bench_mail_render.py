@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template, render_to_string
+
+from eneza.services.mailer.mail_template_render import RenderJinjaMailTemplate
+
+
+class Command(BaseCommand):
+    help = "Measures per email render cost of the quiz results template"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help="recipients to render for")
+        parser.add_argument('--template', default='emails/quiz_results.html')
+
+    def handle(self, *args, **options):
+        template = options['template']
+        contexts = [{"user":{"first_name":"Student {}".format(i)}, "quiz":{"video_tutorial":{"title":"Tutorial"}},
+            "solution":{"total_points":i % 50}, "time_taken":"00d 00h 12m 30s"} for i in range(options['count'])]
+
+        started = time.perf_counter()
+        for context in contexts:
+            get_template(template)
+            render_to_string(template, context)
+        self.report("get_template + render_to_string", len(contexts), time.perf_counter() - started)
+
+        renderer = RenderJinjaMailTemplate()
+        started = time.perf_counter()
+        for context in contexts:
+            renderer.parse_mail_html_mail_template(template, context)
+        self.report("cached parse_mail_html_mail_template", len(contexts), time.perf_counter() - started)
+
+        started = time.perf_counter()
+        renderer.render_many(template, contexts)
+        self.report("cached render_many", len(contexts), time.perf_counter() - started)
+
+    def report(self, name, count, seconds):
+        self.stdout.write("{}: {} emails in {:.3f}s, {:.1f}us per email".format(
+            name, count, seconds, seconds / count * 1e6 if count else 0))
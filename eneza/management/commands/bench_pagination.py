@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from eneza.models import VideoTutorial
+from eneza.pagination import KeysetPagination
+from ._utils import benchmark_database
+
+
+class Command(BaseCommand):
+    help = "Compares keyset and offset page cost at increasing depths of the video tutorials table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.seed(options['rows'])
+            self.run(options['rows'], options['page_size'], options['repeat'])
+
+    def seed(self, rows, batch_size=10000):
+        for start in range(0, rows, batch_size):
+            VideoTutorial.objects.bulk_create([VideoTutorial(title="tutorial {}".format(i), video_link="https://youtube.com/embed/x",
+                embed_type=VideoTutorial.YOUTUBE_EMBED) for i in range(start, min(start + batch_size, rows))])
+        self.stdout.write("seeded {} rows".format(rows))
+
+    def timed(self, fn, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat * 1000
+
+    def run(self, rows, page_size, repeat):
+        paginator = KeysetPagination()
+        queryset = VideoTutorial.objects.all()
+        ordering = paginator.ordering
+        factory = RequestFactory()
+        for depth in (0, rows // 100, rows // 10, rows // 2, max(rows - page_size, 0)):
+            params = {"page_size":page_size}
+            if depth:
+                last = queryset.order_by(*ordering).values_list('updated_at', 'id')[depth - 1]
+                params["cursor"] = paginator.encode_cursor(last)
+            request = Request(factory.get("/", params))
+            keyset = self.timed(lambda: KeysetPagination().paginate_queryset(queryset, request), repeat)
+            offset = self.timed(lambda: list(queryset.order_by(*ordering)[depth:depth + page_size]), repeat)
+            self.stdout.write("depth {:>9}: keyset {:8.2f}ms  offset {:8.2f}ms".format(depth, keyset, offset))
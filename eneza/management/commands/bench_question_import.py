@@ -0,0 +1,75 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from eneza.authentication.models import User
+from eneza.models import Question, Quiz, VideoTutorial
+from ._utils import benchmark_database
+
+
+class Command(BaseCommand):
+    help = ("Compares authoring a quiz through the per object question and choice endpoints with "
+        "a single bulk import request")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--choices', type=int, default=4, help="choices per multi choice question")
+
+    def handle(self, *args, **options):
+        settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+        with benchmark_database():
+            owner = User.objects.create_user("owner@bench.local", "password")
+            self.client = APIClient()
+            self.client.force_authenticate(owner)
+            questions = self.document(options['questions'], options['choices'])
+            for name, run in (("per object", self.per_object), ("bulk import", self.bulk_import)):
+                tutorial = VideoTutorial.objects.create(title=name, video_link="https://youtube.com/embed/x",
+                    embed_type=VideoTutorial.YOUTUBE_EMBED, created_by=owner)
+                quiz = Quiz.objects.create(video_tutorial=tutorial, created_by=owner)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    requests = run(quiz, questions)
+                    elapsed = (time.perf_counter() - started) * 1000
+                created = Question.objects.filter(quiz=quiz).count()
+                self.stdout.write("{:<12}: {:9.1f}ms {:6} requests {:7} queries {:6} questions".format(
+                    name, elapsed, requests, len(queries), created))
+
+    def document(self, count, choices):
+        questions = []
+        for position in range(1, count + 1):
+            if position % 2:
+                questions.append({"question_type":Question.FREE_FORM_QUESTION_TYPE, "position":position,
+                    "content":"question {}".format(position), "answer":"answer"})
+            else:
+                questions.append({"question_type":Question.MULTI_CHOICE_QUESTION_TYPE, "position":position,
+                    "content":"question {}".format(position), "choices":[{"choice":"choice {}".format(i),
+                    "position":i, "answer":i == 1} for i in range(1, choices + 1)]})
+        return questions
+
+    def post(self, url, data):
+        response = self.client.post(url, data, format="json")
+        assert response.status_code == 201, response.content
+        return response
+
+    def per_object(self, quiz, questions):
+        requests = 0
+        for question in questions:
+            data = {"quiz":quiz.id, "position":question["position"], "content":question["content"]}
+            if question["question_type"] == Question.FREE_FORM_QUESTION_TYPE:
+                self.post("/api/v1/free-form-questions/", dict(data, answer=question["answer"]))
+                requests += 1
+                continue
+            question_id = self.post("/api/v1/multi-choice-questions/", data).data["id"]
+            requests += 1
+            for choice in question["choices"]:
+                self.post("/api/v1/multi-choices/", dict(choice, question=question_id))
+                requests += 1
+        return requests
+
+    def bulk_import(self, quiz, questions):
+        self.post("/api/v1/quiz/{}/import_questions/".format(quiz.id), {"questions":questions})
+        return 1
@@ -0,0 +1,60 @@
+import json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from eneza.services.mailer.sendgrid_mailer import SendGridMailer
+
+
+class StubSendGridHandler(BaseHTTPRequestHandler):
+    '''
+    Accepts mail/send requests the way SendGrid does and counts personalizations.
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.recipients += len(json.loads(body.decode()).get("personalizations", []))
+        time.sleep(self.server.latency)
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Measures SendGrid delivery throughput in recipients per second against a local stub"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=10000)
+        parser.add_argument('--single', type=int, default=200, help="recipients to send one request each")
+        parser.add_argument('--latency', type=float, default=0.01, help="seconds the stub waits per request")
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubSendGridHandler)
+        server.recipients = 0
+        server.latency = options['latency']
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        mailer = SendGridMailer(api_key="stub", api_host="http://127.0.0.1:{}".format(server.server_port))
+        message = "<p>Hi -first_name-, you scored -points- points</p>"
+        try:
+            started = time.perf_counter()
+            for i in range(options['single']):
+                mailer.send("from@example.com", ["student{}@example.com".format(i)], "Quiz Results", message)
+            self.report("single", options['single'], time.perf_counter() - started)
+
+            recipients = [("student{}@example.com".format(i), {"-first_name-":"Student", "-points-":i})
+                for i in range(options['recipients'])]
+            started = time.perf_counter()
+            timings = mailer.send_batch("from@example.com", recipients, "Quiz Results", message)
+            self.report("batch", len(recipients), time.perf_counter() - started)
+            self.stdout.write("batches: {}, slowest batch: {:.3f}s".format(len(timings),
+                max(t["seconds"] for t in timings) if timings else 0))
+        finally:
+            server.shutdown()
+
+    def report(self, name, recipients, seconds):
+        self.stdout.write("{}: {} recipients in {:.3f}s, {:.0f} recipients/s".format(
+            name, recipients, seconds, recipients / seconds if seconds else 0))
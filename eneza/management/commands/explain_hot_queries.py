@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from eneza.models import Question, QuizSolution, MultiChoiceQuestionChoice, SubmittedMultichoiceAnswer,\
+    SubmittedFreeformAnswer, VideoTutorial
+
+
+class Command(BaseCommand):
+    help = "Prints the query plans of the hot query shapes so index usage can be checked"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help="run EXPLAIN ANALYZE, PostgreSQL only")
+
+    def sample(self, Model, field, default=1):
+        value = Model.items.values_list(field, flat=True).first()
+        return default if value is None else value
+
+    def hot_queries(self):
+        quiz_id = self.sample(QuizSolution, 'quiz_id')
+        user_id = self.sample(QuizSolution, 'user_id')
+        question_id = self.sample(Question, 'id')
+        return [
+            ("QuizSolution by quiz and user", "unique constraint user-quiz",
+                QuizSolution.objects.filter(quiz_id=quiz_id, user_id=user_id)),
+            ("Questions of a quiz by position", "questions_quiz_position",
+                Question.objects.filter(quiz_id=quiz_id).order_by('position')),
+            ("Submitted multichoice answer by question and creator", "unique constraint multichoice_question_creator",
+                SubmittedMultichoiceAnswer.objects.filter(question_id=question_id, created_by_id=user_id)),
+            ("Submitted freeform answer by question and creator", "unique constraint freeform_question_creator",
+                SubmittedFreeformAnswer.objects.filter(question_id=question_id, created_by_id=user_id)),
+            ("Correct choices of a question", "choices_question_answer",
+                MultiChoiceQuestionChoice.objects.filter(question_id=question_id, answer=True)),
+            ("Choices of a quiz, answer key", "the quiz and question foreign key indexes",
+                MultiChoiceQuestionChoice.objects.filter(question__quiz_id=quiz_id).order_by()),
+            ("Active video tutorials, first keyset page", "tutorials_updated_idx",
+                VideoTutorial.objects.order_by('-updated_at', '-id')[:50]),
+        ]
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                self.stderr.write("--analyze is only supported on PostgreSQL")
+                return
+            explain_options = {"analyze":True, "buffers":True}
+        for name, index, queryset in self.hot_queries():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            # SQLite names the index of a unique constraint sqlite_autoindex_<table>_<n>
+            self.stdout.write("expected index: %s" % index)
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write("")
@@ -0,0 +1,230 @@
+import json, os, subprocess, tempfile, threading, time
+from collections import Counter, defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.utils import timezone
+
+from eneza.authentication.models import User
+from eneza.models import VideoTutorial, Quiz, Question, MultiChoiceQuestion, FreeFormQuestion,\
+    MultiChoiceQuestionChoice, OutboxEmail
+from eneza.services.mailer import Mailer
+from eneza.services.mailer.outbox import OutboxWorker
+from ._utils import benchmark_database, percentile
+
+
+STEP_HEADER = "X-Loadtest-Step"
+STEPS = ("sign_up", "login", "start_quiz", "quiz_questions", "submit_quiz", "quiz_solution")
+
+
+class QueryCountingApplication:
+    '''
+    WSGI wrapper recording the number of queries of every request, keyed on the
+    step the load test client sends in the X-Loadtest-Step header.
+    '''
+
+    def __init__(self, application):
+        self.application = application
+        self.queries = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        step = environ.get("HTTP_" + STEP_HEADER.upper().replace("-", "_"), "other")
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(counter):
+            response = self.application(environ, start_response)
+        with self.lock:
+            self.queries[step].append(count[0])
+        return response
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubTransport:
+    '''
+    Stands in for SendGridMailer, optionally sleeping to mimic the API latency.
+    '''
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.sent = 0
+        self.lock = threading.Lock()
+
+    def send(self, from_email, to_emails, subject, message, message_type="html"):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.sent += 1
+
+
+class Command(BaseCommand):
+    help = "Replays an exam session, sign up to quiz solution, for concurrent students against a local server"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50)
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=10, help="students running their session at once")
+        parser.add_argument('--mail-latency', type=float, default=0.05,
+            help="seconds the stubbed mailer takes per email when the outbox is drained")
+        parser.add_argument('--output', default=None, help="write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['127.0.0.1']
+        test_name = None
+        if connection.vendor == 'sqlite':
+            # an in memory database can not be shared with the server threads
+            test_name = os.path.join(tempfile.gettempdir(), "eneza_loadtest.sqlite3")
+            if options['concurrency'] > 1:
+                self.stderr.write("SQLite serializes writers, concurrent sessions will fail with 'database is locked', "
+                    "use PostgreSQL for realistic numbers")
+        with benchmark_database(test_name=test_name):
+            quiz = self.seed(options['questions'])
+            application = QueryCountingApplication(get_wsgi_application())
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+            server.daemon_threads = True
+            server.set_app(application)
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+                results = self.run(base_url, quiz, options['students'], options['concurrency'])
+            finally:
+                server.shutdown()
+                server.server_close()
+            results["mail"] = self.drain_outbox(options['mail_latency'])
+        results["queries"] = application.queries
+        report = self.report(results, options)
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write("results written to {}".format(options['output']))
+
+    def seed(self, questions):
+        owner = User.objects.create_user("owner@loadtest.local", "password")
+        tutorial = VideoTutorial.objects.create(title="load test", video_link="https://youtube.com/embed/x",
+            embed_type=VideoTutorial.YOUTUBE_EMBED, created_by=owner)
+        quiz = Quiz.objects.create(video_tutorial=tutorial, created_by=owner)
+        for position in range(1, questions + 1):
+            if position % 2:
+                FreeFormQuestion.objects.create(quiz=quiz, position=position, content="question", answer="answer",
+                    question_type=Question.FREE_FORM_QUESTION_TYPE, created_by=owner)
+            else:
+                question = MultiChoiceQuestion.objects.create(quiz=quiz, position=position, content="question",
+                    question_type=Question.MULTI_CHOICE_QUESTION_TYPE, created_by=owner)
+                MultiChoiceQuestionChoice.objects.bulk_create([MultiChoiceQuestionChoice(question=question,
+                    choice="choice", position=p, answer=p == 1, created_by=owner) for p in range(1, 5)])
+        return quiz
+
+    def session(self, base_url, quiz, student, timings):
+        '''
+        One student's exam, every request is timed under its step name.
+        '''
+        http = requests.Session()
+        email = "student{}@loadtest.local".format(student)
+        quiz_url = "{}/api/v1/quiz/{}/".format(base_url, quiz.id)
+
+        def call(step, method, url, **kwargs):
+            started = time.perf_counter()
+            response = http.request(method, url, headers={STEP_HEADER:step}, **kwargs)
+            timings[step].append((time.perf_counter() - started, response.status_code))
+            if response.status_code >= 400:
+                raise RuntimeError("{} returned {}".format(step, response.status_code))
+            return response
+
+        try:
+            call("sign_up", "POST", base_url + "/api/v1/auth/users/sign_up/", json={"email":email,
+                "first_name":"Student", "last_name":str(student), "password":"password", "password_confirm":"password"})
+            token = call("login", "POST", base_url + "/api/v1/auth/token/login",
+                json={"email":email, "password":"password", "device":"loadtest"}).json()["token"]
+            http.headers["Authorization"] = "Token " + token
+            call("start_quiz", "GET", quiz_url + "start_quiz/")
+            questions = call("quiz_questions", "GET", quiz_url + "quiz_questions/").json()
+            answers = [{"question":q["id"], "answer":str(q["choices"][0]["id"]) if q.get("choices") else "answer"}
+                for q in questions]
+            call("submit_quiz", "POST", quiz_url + "submit_quiz/", json=answers)
+            call("quiz_solution", "GET", quiz_url + "quiz_solution/")
+        except (RuntimeError, requests.RequestException):
+            # the failed step is already recorded, the rest of the session is skipped
+            pass
+        finally:
+            http.close()
+
+    def run(self, base_url, quiz, students, concurrency):
+        timings = defaultdict(list)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for student in range(students):
+                executor.submit(self.session, base_url, quiz, student, timings)
+        return {"timings":timings, "wall_time":time.perf_counter() - started}
+
+    def drain_outbox(self, latency):
+        transport = StubTransport(latency=latency)
+        queued = OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count()
+        started = time.perf_counter()
+        OutboxWorker(mailer=Mailer(transport=transport)).run(once=True)
+        return {"queued":queued, "sent":transport.sent, "wall_time":round(time.perf_counter() - started, 3)}
+
+    def git_commit(self):
+        try:
+            return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, results, options):
+        endpoints = OrderedDict()
+        requests_total = 0
+        for step in STEPS:
+            samples = results["timings"].get(step, [])
+            latencies = sorted(elapsed * 1000 for elapsed, status in samples)
+            queries = results["queries"].get(step, [])
+            requests_total += len(samples)
+            endpoints[step] = OrderedDict([
+                ("requests", len(samples)),
+                ("errors", sum(1 for elapsed, status in samples if status >= 400)),
+                ("status_codes", dict(Counter(str(status) for elapsed, status in samples))),
+                ("p50_ms", percentile(latencies, 50)),
+                ("p95_ms", percentile(latencies, 95)),
+                ("p99_ms", percentile(latencies, 99)),
+                ("mean_ms", sum(latencies) / len(latencies) if latencies else None),
+                ("queries_mean", sum(queries) / len(queries) if queries else None),
+                ("queries_max", max(queries) if queries else None),
+            ])
+        return OrderedDict([
+            ("commit", self.git_commit()),
+            ("created_at", timezone.now().isoformat()),
+            ("database", connection.vendor),
+            ("students", options['students']),
+            ("questions", options['questions']),
+            ("concurrency", options['concurrency']),
+            ("wall_time_s", round(results["wall_time"], 3)),
+            ("throughput_rps", round(requests_total / results["wall_time"], 2) if results["wall_time"] else None),
+            ("endpoints", endpoints),
+            ("mail", results["mail"]),
+        ])
+
+    def print_report(self, report):
+        self.stdout.write("{students} students, {questions} questions, concurrency {concurrency} on {database}"
+            .format(**report))
+        self.stdout.write("{:<15}{:>9}{:>8}{:>10}{:>10}{:>10}{:>10}".format(
+            "endpoint", "requests", "errors", "p50 ms", "p95 ms", "p99 ms", "queries"))
+        for step, stats in report["endpoints"].items():
+            values = [stats[k] if stats[k] is not None else float('nan') for k in ("p50_ms", "p95_ms", "p99_ms", "queries_mean")]
+            self.stdout.write("{:<15}{:>9}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}".format(
+                step, stats["requests"], stats["errors"], *values))
+        self.stdout.write("throughput {throughput_rps} requests/s over {wall_time_s}s".format(**report))
+        self.stdout.write("outbox: {sent}/{queued} emails sent in {wall_time}s".format(**report["mail"]))
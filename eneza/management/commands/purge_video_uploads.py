@@ -0,0 +1,29 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from eneza.exceptions import ConflictException
+from eneza.models import VideoUpload
+from eneza.services.video_uploads import VideoUploadService
+
+
+class Command(BaseCommand):
+    help = "Deletes resumable video uploads that received no chunk for a while, with their partial files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, default=24, help="hours since the last chunk")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(hours=options['older_than'])
+        service = VideoUploadService()
+        uploads = VideoUpload.objects.filter(status=VideoUpload.UPLOADING, updated_at__lt=cutoff)
+        deleted = skipped = 0
+        for upload in uploads.iterator():
+            try:
+                service.abort(upload)
+            except ConflictException:
+                # a late chunk or a complete holds the upload, it is not abandoned
+                skipped += 1
+                continue
+            deleted += 1
+        self.stdout.write("Deleted {} abandoned uploads, skipped {} in use".format(deleted, skipped))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from eneza.models import QuizSolution
+from eneza.services.item_stats import ItemStatsService
+
+
+class Command(BaseCommand):
+    help = "Recomputes the per question and per choice analytics, with discrimination indices, from the answer tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, action='append', help="quiz to rebuild, every graded quiz by default")
+
+    def handle(self, *args, **options):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise CommandError("Discrimination indices are computed with numpy, pip install numpy")
+        quiz_ids = options['quiz'] or QuizSolution.objects.filter(complete=True).order_by("quiz_id")\
+            .values_list("quiz_id", flat=True).distinct()
+        service = ItemStatsService()
+        for quiz_id in quiz_ids:
+            started = time.perf_counter()
+            solutions = service.rebuild(quiz_id)
+            self.stdout.write("quiz {}: {} graded solutions in {:.1f}ms".format(quiz_id, solutions,
+                (time.perf_counter() - started) * 1000))
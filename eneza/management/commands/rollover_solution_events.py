@@ -0,0 +1,25 @@
+import datetime, gzip
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from eneza.services.activity_log import rollover
+
+
+class Command(BaseCommand):
+    help = "Deletes solution events older than the retention period, optionally archiving them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="defaults to ACTIVITY_RETENTION_DAYS")
+        parser.add_argument('--archive', default=None, help="append the removed events to this gzipped NDJSON file")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.ACTIVITY_RETENTION_DAYS
+        cutoff = timezone.now() - datetime.timedelta(days=days)
+        if options['archive']:
+            with gzip.open(options['archive'], "at") as archive:
+                removed = rollover(cutoff, archive=archive, batch_size=options['batch_size'])
+        else:
+            removed = rollover(cutoff, batch_size=options['batch_size'])
+        self.stdout.write("Removed {} events recorded before {}".format(removed, cutoff.isoformat()))
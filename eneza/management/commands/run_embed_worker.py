@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from eneza.services.embeds import EmbedWorker
+
+
+class Command(BaseCommand):
+    help = "Resolves queued YouTube links to embed links through oEmbed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="links claimed per batch")
+        parser.add_argument('--threads', type=int, default=None, help="lookup threads")
+        parser.add_argument('--max-attempts', type=int, default=None, help="attempts before a link is marked failed")
+        parser.add_argument('--sleep', type=float, default=1, help="seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="exit once the queue is drained")
+
+    def handle(self, *args, **options):
+        worker = EmbedWorker(batch_size=options['batch_size'], workers=options['threads'],
+            max_attempts=options['max_attempts'])
+        self.stdout.write("Embed worker started")
+        worker.run(once=options['once'], sleep=options['sleep'])
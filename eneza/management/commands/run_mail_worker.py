@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from eneza.services.mailer.outbox import OutboxWorker
+
+
+class Command(BaseCommand):
+    help = "Delivers queued emails from the email outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="emails claimed per batch")
+        parser.add_argument('--threads', type=int, default=None, help="delivery threads")
+        parser.add_argument('--max-attempts', type=int, default=None, help="attempts before an email is marked failed")
+        parser.add_argument('--sleep', type=float, default=1, help="seconds to wait when the outbox is empty")
+        parser.add_argument('--once', action='store_true', help="exit once the outbox is drained")
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'], workers=options['threads'],
+            max_attempts=options['max_attempts'])
+        self.stdout.write("Mail worker started")
+        worker.run(once=options['once'], sleep=options['sleep'])
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.6 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eneza', '0003_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='multichoicequestionchoice',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='choices_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='questions_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='quizes_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizsolution',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='quiz_solutions_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submittedfreeformanswer',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='ff_answers_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submittedmultichoiceanswer',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='mc_answers_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='videos_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='videotutorial',
+            index=models.Index(condition=models.Q(is_active=True), fields=['updated_at', 'id'], name='tutorials_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.6 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eneza', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='multichoicequestionchoice',
+            index=models.Index(condition=models.Q(('is_active', True), ('answer', True)), fields=['question'], name='choices_question_answer'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(is_active=True), fields=['quiz', 'position'], name='questions_quiz_position'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.6 on 2026-10-18 16:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eneza', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoEmbed',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_hash', models.CharField(max_length=64, unique=True)),
+                ('url', models.TextField()),
+                ('embed_url', models.TextField(blank=True, default='')),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('RESOLVED', 'RESOLVED'), ('FAILED', 'FAILED')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'VideoEmbeds',
+                'db_table': 'video_embeds',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='videoembed',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='video_embeds_due'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.6 on 2026-10-18 17:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.manager
+import eneza.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('eneza', '0006_video_embeds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoUpload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('checksum', models.CharField(blank=True, default='', max_length=64)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('UPLOADING', 'UPLOADING'), ('COMPLETE', 'COMPLETE')], default='UPLOADING', max_length=20)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='eneza_videouploads_creator', related_query_name='eneza_videouploads_updater', to=settings.AUTH_USER_MODEL)),
+                ('updated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='eneza_videouploads_updated_by', related_query_name='eneza_videouploads_updated_by', to=settings.AUTH_USER_MODEL)),
+                ('video', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload', to='eneza.Video')),
+            ],
+            options={
+                'verbose_name_plural': 'VideoUploads',
+                'db_table': 'video_uploads',
+            },
+            managers=[
+                ('items', django.db.models.manager.Manager()),
+                ('objects', eneza.models.AbstractBaseManager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.6 on 2026-10-18 17:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eneza', '0007_video_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='QuizVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveIntegerField()),
+                ('snapshot', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versions', to='eneza.Quiz')),
+            ],
+            options={
+                'verbose_name_plural': 'QuizVersions',
+                'db_table': 'quiz_versions',
+            },
+        ),
+        migrations.AddField(
+            model_name='quizsolution',
+            name='version',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='solutions', to='eneza.QuizVersion'),
+        ),
+        migrations.AddConstraint(
+            model_name='quizversion',
+            constraint=models.UniqueConstraint(fields=('quiz', 'revision'), name='quiz-version-revision'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.6 on 2026-10-18 17:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eneza', '0008_quiz_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolutionEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('question_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'viewed'), (2, 'answered'), (3, 'changed'), (4, 'focus_lost'), (5, 'focus_gained')])),
+                ('occurred_at', models.DateTimeField()),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('solution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='eneza.QuizSolution')),
+            ],
+            options={
+                'verbose_name_plural': 'SolutionEvents',
+                'db_table': 'solution_events',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='solutionevent',
+            index=models.Index(fields=['solution', 'occurred_at'], name='solution_events_solution'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.6 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eneza', '0009_solution_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceStats',
+            fields=[
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='eneza.MultiChoiceQuestionChoice')),
+                ('selections', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'ChoiceStats',
+                'db_table': 'choice_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='eneza.Question')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('timed', models.PositiveIntegerField(default=0)),
+                ('total_time_ms', models.BigIntegerField(default=0)),
+                ('discrimination', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_stats', to='eneza.Quiz')),
+            ],
+            options={
+                'verbose_name_plural': 'QuestionStats',
+                'db_table': 'question_stats',
+            },
+        ),
+    ]
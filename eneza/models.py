@@ -1,9 +1,14 @@
 from django.db import models
 from django.core.validators import FileExtensionValidator
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy
 
 
+# condition of the partial indexes matching AbstractBaseManager's implicit filter
+ACTIVE = models.Q(is_active=True)
+
+
 class AbstractBaseManager(models.Manager):
     use_in_migrations = True
     def get_queryset(self):
@@ -60,6 +65,33 @@ class Video(AbstractModel):
     class Meta:
         verbose_name_plural = gettext_lazy('Videos')
         db_table = 'videos'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='videos_updated_idx', condition=ACTIVE),
+        ]
+
+
+class VideoUpload(AbstractModel):
+    '''
+    Resumable upload of a Video. Chunks are appended to a partial file under
+    MEDIA_ROOT, `offset` counts the bytes that arrived with a valid checksum,
+    see eneza.services.video_uploads.
+    '''
+    UPLOADING="UPLOADING"
+    COMPLETE="COMPLETE"
+    STATUSES=[
+        (UPLOADING, UPLOADING),
+        (COMPLETE, COMPLETE),
+    ]
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    checksum = models.CharField(max_length=64, blank=True, default="")
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUSES, default=UPLOADING)
+    video = models.OneToOneField(Video, related_name="upload", on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = gettext_lazy('VideoUploads')
+        db_table = 'video_uploads'
 
 
 class VideoTutorial(AbstractModel):
@@ -77,14 +109,22 @@ class VideoTutorial(AbstractModel):
     class Meta:
         verbose_name_plural = gettext_lazy('VideoTutorials')
         db_table = 'video_tutorials'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='tutorials_updated_idx', condition=ACTIVE),
+        ]
 
 
 class Quiz(AbstractModel):
     video_tutorial = models.OneToOneField('VideoTutorial', related_name='quiz', on_delete=models.CASCADE)
+    # incremented with every write to the questions or choices, see QuizVersion
+    revision = models.PositiveIntegerField(default=0)
 
     class Meta:
         verbose_name_plural = gettext_lazy('Quizes')
         db_table = 'quizes'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='quizes_updated_idx', condition=ACTIVE),
+        ]
 
 
 class Question(AbstractModel):
@@ -102,6 +142,10 @@ class Question(AbstractModel):
 
     class Meta:
         db_table='questions'
+        indexes = [
+            models.Index(fields=['quiz', 'position'], name='questions_quiz_position', condition=ACTIVE),
+            models.Index(fields=['updated_at', 'id'], name='questions_updated_idx', condition=ACTIVE),
+        ]
         constraints = [
                 models.UniqueConstraint(fields=['position', 'quiz_id'], name="quiz-question-position")
                 ]
@@ -113,6 +157,7 @@ class MultiChoiceQuestion(Question):
   
     class Meta(Question.Meta):
         db_table='multi_choice_questions'
+        indexes = []
         verbose_name_plural = 'MultiChoiceQuestions'
 
 
@@ -124,6 +169,10 @@ class MultiChoiceQuestionChoice(AbstractModel):
 
     class Meta:
         db_table='multi_choice_question_choices'
+        indexes = [
+            models.Index(fields=['question'], name='choices_question_answer', condition=ACTIVE & models.Q(answer=True)),
+            models.Index(fields=['updated_at', 'id'], name='choices_updated_idx', condition=ACTIVE),
+        ]
         constraints = [
                 models.UniqueConstraint(fields=['position', 'question_id'], name="question-position-choice")
                 ]
@@ -136,12 +185,35 @@ class FreeFormQuestion(Question):
 
     class Meta(Question.Meta):
         db_table='free_form_questions'
+        indexes = []
         verbose_name_plural = 'FreeFormQuestions'
 
 
+class QuizVersion(models.Model):
+    '''
+    Immutable snapshot of the questions, choices and answers of a quiz at a
+    revision. Versions are copy on write: a solution started while the quiz
+    is unchanged shares the latest version, the next one is only taken after
+    a write, see eneza.services.quiz_versions.
+    '''
+    quiz = models.ForeignKey(Quiz, related_name="versions", on_delete=models.CASCADE)
+    revision = models.PositiveIntegerField()
+    snapshot = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table='quiz_versions'
+        constraints = [
+                models.UniqueConstraint(fields=['quiz', 'revision'], name="quiz-version-revision")
+                ]
+        verbose_name_plural = gettext_lazy('QuizVersions')
+
+
 class QuizSolution(AbstractModel):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="user_submitted_solutions", on_delete=models.PROTECT)
     quiz = models.ForeignKey(Quiz, related_name="quiz_submitted_solutions", on_delete=models.PROTECT)
+    # the version the solution is graded against, null for solutions started before versions existed
+    version = models.ForeignKey(QuizVersion, related_name="solutions", on_delete=models.PROTECT, null=True, blank=True)
     start = models.DateTimeField()
     stop = models.DateTimeField(null=True)
     retake = models.BooleanField(default=False)
@@ -151,6 +223,9 @@ class QuizSolution(AbstractModel):
 
     class Meta:
         db_table='quiz_solutions'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='quiz_solutions_updated_idx', condition=ACTIVE),
+        ]
         constraints = [
                 models.UniqueConstraint(fields=['user', 'quiz'], name="user-quiz")
                 ]
@@ -177,6 +252,42 @@ class QuizSolutionActivity(AbstractModel):
         verbose_name_plural = gettext_lazy('QuizSolutionActivies')
 
 
+class SolutionEvent(models.Model):
+    '''
+    Append only telemetry of a student working through a quiz. Rows are never
+    updated, carry typed columns instead of the AbstractModel bookkeeping and
+    are written in batches, see eneza.services.activity_log.
+    '''
+    VIEWED=1
+    ANSWERED=2
+    CHANGED=3
+    FOCUS_LOST=4
+    FOCUS_GAINED=5
+    KINDS=[
+        (VIEWED, "viewed"),
+        (ANSWERED, "answered"),
+        (CHANGED, "changed"),
+        (FOCUS_LOST, "focus_lost"),
+        (FOCUS_GAINED, "focus_gained"),
+    ]
+    id = models.BigAutoField(primary_key=True)
+    solution = models.ForeignKey(QuizSolution, related_name="events", on_delete=models.CASCADE)
+    # no foreign key, the question is checked against the answer key when the event is taken
+    question_id = models.PositiveIntegerField(null=True, blank=True)
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    # client clock, recorded_at is the server clock used for the rollover
+    occurred_at = models.DateTimeField()
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table='solution_events'
+        indexes = [
+            models.Index(fields=['solution', 'occurred_at'], name='solution_events_solution'),
+        ]
+        verbose_name_plural = gettext_lazy('SolutionEvents')
+
+
 class SubmittedMultichoiceAnswer(AbstractModel):
     solution = models.ForeignKey(QuizSolution, related_name='quiz_multichoice_answers', on_delete=models.PROTECT)
     question = models.ForeignKey(MultiChoiceQuestion, related_name="multichoice_answers", on_delete=models.PROTECT)
@@ -185,6 +296,9 @@ class SubmittedMultichoiceAnswer(AbstractModel):
 
     class Meta:
         db_table='submitted_multichoice_answers'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='mc_answers_updated_idx', condition=ACTIVE),
+        ]
         constraints = [
                 models.UniqueConstraint(fields=['solution', 'question'], name="multichoice_solution_question"),
                 models.UniqueConstraint(fields=['question', 'created_by'], name="multichoice_question_creator"),
@@ -200,8 +314,145 @@ class SubmittedFreeformAnswer(AbstractModel):
 
     class Meta:
         db_table='submitted_freeform_answers'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='ff_answers_updated_idx', condition=ACTIVE),
+        ]
         constraints = [
                 models.UniqueConstraint(fields=['solution', 'question'], name="freeform_solution_question"),
                 models.UniqueConstraint(fields=['question', 'created_by'], name="freeform_question_creator"),
             ]
         verbose_name_plural = gettext_lazy('SubmittedFreeformAnswers')
+
+
+class OutboxEmail(AbstractModel):
+    PENDING="PENDING"
+    SENT="SENT"
+    FAILED="FAILED"
+    STATUSES=[
+        (PENDING, PENDING),
+        (SENT, SENT),
+        (FAILED, FAILED),
+    ]
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    to_email = models.CharField(max_length=255)
+    template = models.CharField(max_length=255)
+    solution = models.ForeignKey(QuizSolution, related_name="outbox_emails", on_delete=models.PROTECT, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table='email_outbox'
+        verbose_name_plural = gettext_lazy('OutboxEmails')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_outbox_due'),
+        ]
+
+
+class LeaderboardEntry(models.Model):
+    '''
+    Denormalized ranking row kept up to date when a solution is graded,
+    so ranking a quiz never scans the solutions table.
+    '''
+    quiz = models.ForeignKey(Quiz, related_name="leaderboard_entries", on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="leaderboard_entries", on_delete=models.CASCADE)
+    solution = models.OneToOneField(QuizSolution, related_name="leaderboard_entry", on_delete=models.CASCADE)
+    total_points = models.PositiveIntegerField(default=0)
+    time_taken = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table='leaderboard_entries'
+        constraints = [
+                models.UniqueConstraint(fields=['quiz', 'user'], name="leaderboard-quiz-user")
+                ]
+        indexes = [
+            models.Index(fields=['quiz', '-total_points', 'time_taken', 'id'], name='leaderboard_rank'),
+        ]
+        verbose_name_plural = gettext_lazy('LeaderboardEntries')
+
+
+class ScoreBucket(models.Model):
+    '''
+    Number of graded solutions of a quiz that scored exactly `points`.
+    '''
+    quiz = models.ForeignKey(Quiz, related_name="score_buckets", on_delete=models.CASCADE)
+    points = models.PositiveIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table='score_buckets'
+        constraints = [
+                models.UniqueConstraint(fields=['quiz', 'points'], name="score-bucket-quiz-points")
+                ]
+        ordering = ('points',)
+        verbose_name_plural = gettext_lazy('ScoreBuckets')
+
+
+class QuestionStats(models.Model):
+    '''
+    Item analytics of a question, counted when a solution is graded and
+    recomputed by rebuild_item_stats, see eneza.services.item_stats.
+    '''
+    question = models.OneToOneField(Question, related_name="stats", on_delete=models.CASCADE, primary_key=True)
+    quiz = models.ForeignKey(Quiz, related_name="question_stats", on_delete=models.CASCADE)
+    attempts = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    # graded solutions that reported time spent on the question, and that time
+    timed = models.PositiveIntegerField(default=0)
+    total_time_ms = models.BigIntegerField(default=0)
+    # item-rest correlation, only computed by the rebuild
+    discrimination = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table='question_stats'
+        verbose_name_plural = gettext_lazy('QuestionStats')
+
+
+class ChoiceStats(models.Model):
+    '''
+    Number of graded solutions that selected a choice.
+    '''
+    choice = models.OneToOneField(MultiChoiceQuestionChoice, related_name="stats", on_delete=models.CASCADE,
+        primary_key=True)
+    selections = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table='choice_stats'
+        verbose_name_plural = gettext_lazy('ChoiceStats')
+
+
+class VideoEmbed(models.Model):
+    '''
+    Embed link of a YouTube url that can not be parsed offline. The table is
+    both the persistent cache of resolved urls and the queue the embed worker
+    resolves through oEmbed, see eneza.services.embeds.
+    '''
+    PENDING="PENDING"
+    RESOLVED="RESOLVED"
+    FAILED="FAILED"
+    STATUSES=[
+        (PENDING, PENDING),
+        (RESOLVED, RESOLVED),
+        (FAILED, FAILED),
+    ]
+    url_hash = models.CharField(max_length=64, unique=True)
+    url = models.TextField()
+    embed_url = models.TextField(blank=True, default="")
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table='video_embeds'
+        verbose_name_plural = gettext_lazy('VideoEmbeds')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='video_embeds_due'),
+        ]
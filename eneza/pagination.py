@@ -0,0 +1,105 @@
+import base64, json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    '''
+    Cursor pagination on a composite key, (updated_at, id) by default.
+
+    The cursor holds the key of the last row of the page and the next page is
+    read with a row comparison against it, so fetching a page costs the same
+    however deep into the table it is. Views can override the key with a
+    `cursor_ordering` attribute, the last field must be unique.
+    '''
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    ordering = ('-updated_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            page_size = self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def encode_cursor(self, values):
+        data = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, queryset, ordering, encoded):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if len(values) != len(ordering):
+                raise ValueError
+            fields = [queryset.model._meta.get_field(f.lstrip('-')) for f in ordering]
+            return [field.to_python(value) for field, value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, ordering, values):
+        '''
+        Builds the lexicographic "comes after" filter for the key values.
+        '''
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = '__lt' if field.startswith('-') else '__gt'
+            condition |= equal & Q(**{name + lookup:value})
+            equal &= Q(**{name:value})
+        # the redundant bound on the leading field lets the database use an index
+        # range scan instead of evaluating the OR for every row
+        first = ordering[0]
+        bound = Q(**{first.lstrip('-') + ('__lte' if first.startswith('-') else '__gte'):values[0]})
+        return bound & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(view)
+        queryset = queryset.order_by(*ordering)
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.after(ordering, self.decode_cursor(queryset, ordering, encoded)))
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            last = rows[-1]
+            self.next_cursor = self.encode_cursor([getattr(last, f.lstrip('-')) for f in ordering])
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -1,28 +1,51 @@
-import datetime
+import datetime, logging
+from functools import partial
 from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import NotFound
-from eneza.models import VideoTutorial, Question, MultiChoiceQuestion,\
+from eneza.models import Video, VideoUpload, VideoTutorial, Question, MultiChoiceQuestion,\
         FreeFormQuestion, Quiz, MultiChoiceQuestionChoice, QuizSolution,\
-        QuizSolutionActivity, SubmittedFreeformAnswer,SubmittedMultichoiceAnswer
+        QuizSolutionActivity, SubmittedFreeformAnswer,SubmittedMultichoiceAnswer, SolutionEvent
     
 from eneza.exceptions import InvalidPermissionsException, SimpleValidationError
 
-from django.core.validators import URLValidator
+from django.conf import settings
+from django.core.files import File
+from django.core.validators import FileExtensionValidator, URLValidator
 from django.core.exceptions import ValidationError
 import pytz
 from eneza.services.utils import strfdelta
+from eneza.services.embeds import EmbedError, embed_resolver
+from eneza.services.video_uploads import parse_checksum
+from eneza.services.quiz_versions import QuizVersionService
+from eneza.instrumentation import timer
 
+logger = logging.getLogger(__name__)
 
 
 
-class AbstractSerializersMixin:
+
+class SparseFieldsetMixin:
+    '''
+    Accepts a `fields` keyword argument limiting the fields that are rendered,
+    used for the `?fields=` query parameter.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class AbstractSerializersMixin(SparseFieldsetMixin):
    
     @transaction.atomic
     def create(self, validated_data):
         if self.context["request"].user:
             validated_data["created_by"]=self.context["request"].user
-        print(validated_data)
+        logger.debug("Creating %s", self.Meta.model.__name__)
         return super().create(validated_data)
     @transaction.atomic
     def update(self, instance, validated_data):
@@ -30,6 +53,10 @@ class AbstractSerializersMixin:
             validated_data["updated_by"]=self.context["request"].user
         return super().update(instance, validated_data)
 
+    def to_representation(self, instance):
+        with timer("serializer"):
+            return super().to_representation(instance)
+
 class AbstractModelSerializerMeta:
     DEFAULT_FIELDS = ["id","created_by","updated_by","is_active","created_at","updated_at"]
     read_ony_fields = ["created_by","updated_by","created_at","updated_at","is_active"]
@@ -40,14 +67,22 @@ def create_private_field(serializer_class,field_name):
             return obj
 
         def to_representation(self, obj):
-            # for read functionality
-            if obj.created_by != self.context['request'].user:
+            # a payload rendered for the shared content cache hides the field and
+            # records whose it is, see RenderedContentCache
+            private_owners = self.context.get('private_owners')
+            if private_owners is not None:
+                private_owners.add(obj.created_by_id)
+                return None
+            # for read functionality, compare ids so that rendering a list does not fetch every creator
+            user = self.context['request'].user
+            if not user.is_authenticated or obj.created_by_id != user.pk:
                 return None
             else:
                 return getattr(obj,field_name)
     return PrivateField
 
 class QuizSerializer(AbstractSerializersMixin, serializers.ModelSerializer):
+    revision = serializers.ReadOnlyField()
 
     def save(self, *args, **kwargs):
         validated_data = self.validated_data
@@ -64,33 +99,22 @@ class VideoTutorialSerializer(AbstractSerializersMixin, serializers.ModelSeriali
 
     quiz = QuizSerializer(read_only=True)
     def simple_validate_youtube_embed(self,url):
-        from urllib import parse as urlparse
-        import requests
-        import re
-        parsed_url = urlparse.urlparse(url)
-        youtube_url_netlocs = ["youtube.com","youtu.be"]
-        is_youtube_url = False
-        for i in youtube_url_netlocs:
-            if i in parsed_url.netloc:
-                is_youtube_url = True
-                break
-        if not is_youtube_url:
-            raise SimpleValidationError(detail='Provided link is not a valid youtube link')
-        if "/embed" in parsed_url.path:
-            return url 
-        if parsed_url.path =="/watch" and parsed_url.query.startswith("v="):
-            return "https://youtube.com/embed/"+parsed_url.query[2:]
-        # hopefully it doesnt get here
-        api_url = 'https://www.youtube.com/oembed'
-        r = requests.get(api_url, params={"url":url})
-        if r.status_code != 200:
-            raise SimpleValidationError(detail='Unable to process link, check that video exists')
-        results = r.json()
-        m = re.search('''(<iframe[^>]+src=")([^"]*)(".*)''', result["html"])
-        if not m:
-            raise SimpleValidationError(detail='Unable to process link, check that video exists')
-        return m.groups()[1]
-        
+        # never blocks on the network, links that need oEmbed are saved as given
+        # and rewritten by the embed worker, see eneza.services.embeds
+        try:
+            embed_url = embed_resolver.resolve(url)
+        except EmbedError as e:
+            raise SimpleValidationError(detail=str(e))
+        if embed_url is None:
+            self.pending_embed = True
+            return url.strip()
+        return embed_url
+
+    def save(self, **kwargs):
+        instance = super().save(**kwargs)
+        if getattr(self, "pending_embed", False):
+            transaction.on_commit(partial(embed_resolver.refresh, instance.video_link))
+        return instance
 
     def validate(self, data):
         url = data.get("video_link",None)
@@ -123,6 +147,42 @@ class VideoTutorialSerializer(AbstractSerializersMixin, serializers.ModelSeriali
 
 
 
+class VideoSerializer(AbstractSerializersMixin, serializers.ModelSerializer):
+
+    class Meta(AbstractModelSerializerMeta):
+        model = Video
+        fields = "__all__"
+
+
+class VideoUploadSerializer(AbstractSerializersMixin, serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+
+    def get_chunk_size(self, obj):
+        return settings.VIDEO_UPLOAD_CHUNK_SIZE
+
+    def validate_filename(self, value):
+        try:
+            FileExtensionValidator(Video.ALLOWED_VIDEO_EXTENSIONS)(File(None, name=value))
+        except ValidationError:
+            raise SimpleValidationError(detail="Allowed video extensions are {}".format(
+                ", ".join(Video.ALLOWED_VIDEO_EXTENSIONS)))
+        return value
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise SimpleValidationError(detail="Size must be positive")
+        return value
+
+    def validate_checksum(self, value):
+        return parse_checksum("sha256 " + value) if value else ""
+
+    class Meta(AbstractModelSerializerMeta):
+        model = VideoUpload
+        fields = ["id", "filename", "size", "checksum", "offset", "status", "video", "chunk_size", "created_at",
+            "updated_at"]
+        read_only_fields = ["offset", "status", "video"]
+
+
 class QuestionsSerializerMixin:
     def validate(self, data):
         if not self.partial:
@@ -236,10 +296,47 @@ class FreeFormQuestionSerializer(AbstractSerializersMixin, QuestionsSerializerMi
         model = FreeFormQuestion
         fields = "__all__"
 
+class ChoiceImportSerializer(serializers.Serializer):
+    choice = serializers.CharField()
+    position = serializers.IntegerField(min_value=1, required=False)
+    answer = serializers.BooleanField(default=False)
+
+
+class QuestionImportSerializer(serializers.Serializer):
+    '''
+    One question of a bulk import, validated without touching the database.
+    Choices without a position are numbered in the order they are listed.
+    '''
+    question_type = serializers.ChoiceField(choices=Question.QUESTION_TYPE)
+    position = serializers.IntegerField(min_value=1)
+    content = serializers.CharField()
+    points = serializers.IntegerField(min_value=0, default=1)
+    answer = serializers.CharField(required=False)
+    choices = ChoiceImportSerializer(many=True, required=False)
+
+    def validate(self, data):
+        if data["question_type"] == Question.FREE_FORM_QUESTION_TYPE:
+            if "answer" not in data:
+                raise serializers.ValidationError("Free form questions need an answer")
+            data.pop("choices", None)
+            return data
+        choices = data.get("choices")
+        if not choices:
+            raise serializers.ValidationError("Multi choice questions need choices")
+        for i, choice in enumerate(choices, 1):
+            choice.setdefault("position", i)
+        positions = [choice["position"] for choice in choices]
+        if len(set(positions)) != len(positions):
+            raise serializers.ValidationError("Choice positions must be unique")
+        data.pop("answer", None)
+        return data
+
+
 class QuizSolutionSerializer(AbstractSerializersMixin, serializers.ModelSerializer):
 
     start = serializers.ReadOnlyField()
     user = serializers.ReadOnlyField(source='user.id')
+    version = serializers.ReadOnlyField(source='version_id')
     time_taken = serializers.SerializerMethodField()
 
     def get_time_taken(self, obj):
@@ -260,12 +357,13 @@ class QuizSolutionSerializer(AbstractSerializersMixin, serializers.ModelSerializ
     def create(self,validated_data):
         validated_data["start"]=datetime.datetime.utcnow()
         validated_data["user"]=self.context["request"].user
+        validated_data["version"]=QuizVersionService().current_version(validated_data["quiz"])
         return super().create(validated_data)
 
     class Meta(AbstractModelSerializerMeta):
         model = QuizSolution
-        fields = AbstractModelSerializerMeta.DEFAULT_FIELDS + ["start","stop","retake","complete","total_points","user","time_taken","quiz"]
-        read_ony_fields = AbstractModelSerializerMeta.read_ony_fields+["start","stop","retake","complete","total_points","user","time_taken","quiz"]
+        fields = AbstractModelSerializerMeta.DEFAULT_FIELDS + ["start","stop","retake","complete","total_points","user","time_taken","quiz","version"]
+        read_ony_fields = AbstractModelSerializerMeta.read_ony_fields+["start","stop","retake","complete","total_points","user","time_taken","quiz","version"]
  
 
 class AbstractSubmittedAnswerMixin:
@@ -293,14 +391,14 @@ class AbstractSubmittedAnswerMixin:
             raise NotFound(detail="Quiz does not have a solution")
 
 class SubmittedMultichoiceAnswerSerializer(AbstractSerializersMixin, AbstractSubmittedAnswerMixin, serializers.ModelSerializer):
-    solution = serializers.ReadOnlyField(source="solution.id")
+    solution = serializers.ReadOnlyField(source="solution_id")
     class Meta(AbstractModelSerializerMeta):
         model = SubmittedMultichoiceAnswer
         fields = "__all__"
         read_ony_fields = AbstractModelSerializerMeta.read_ony_fields + ["solution"]
 
 class SubmittedFreeformAnswerSerializer(AbstractSerializersMixin, AbstractSubmittedAnswerMixin, serializers.ModelSerializer):
-    solution = serializers.ReadOnlyField(source="solution.id")
+    solution = serializers.ReadOnlyField(source="solution_id")
     class Meta(AbstractModelSerializerMeta):
         model = SubmittedFreeformAnswer
         fields = "__all__"
@@ -308,18 +406,25 @@ class SubmittedFreeformAnswerSerializer(AbstractSerializersMixin, AbstractSubmit
 
 
 class SubmitQuizSerializer(serializers.Serializer):
+    '''
+    Validates the shape of one submitted answer, questions and choices are
+    resolved for the whole submission by QuizSubmissionService.
+    '''
     answer = serializers.CharField(max_length=255)
     question = serializers.IntegerField()
-    solution =serializers.IntegerField()
 
-    def validate(self, data):
-        question = data["question"]
-        solution = QuizSolution.objects.get(id=data["solution"])
-        try:
-            question:Question = Question.objects.get(id=question)
-        except Question.DoesNotExist:
-            raise NotFound(detail="Question with that id does not exist")
-        model_mapper = {Question.FREE_FORM_QUESTION_TYPE:SubmittedFreeformAnswer,Question.MULTI_CHOICE_QUESTION_TYPE:SubmittedMultichoiceAnswer}
-        if model_mapper[question.question_type].objects.filter(solution=solution,question_id=question.id):
-            raise SimpleValidationError(detail="Question {_id} already has an answer".format(_id=question.id))
-        return data
+
+class SolutionEventSerializer(serializers.Serializer):
+    '''
+    Validates the shape of one telemetry event, questions are checked for the
+    whole batch against the answer key of the solution.
+    '''
+    kinds = {name:value for value, name in SolutionEvent.KINDS}
+
+    kind = serializers.ChoiceField(choices=list(kinds))
+    question = serializers.IntegerField(required=False, allow_null=True)
+    occurred_at = serializers.DateTimeField()
+    duration_ms = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+
+    def validate_kind(self, value):
+        return self.kinds[value]
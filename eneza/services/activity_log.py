@@ -0,0 +1,132 @@
+import atexit, json, logging, threading, time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Sum
+
+from eneza.models import SolutionEvent
+
+logger = logging.getLogger(__name__)
+
+# events buffered, flushed and dropped by this process, see eneza.instrumentation
+event_stats = defaultdict(int)
+
+
+class EventBuffer:
+    '''
+    Process local buffer of SolutionEvents written with bulk_create.
+
+    Events are flushed by the request that fills the buffer to max_size, or by
+    a background thread once the oldest one waited max_age seconds. A process
+    that is killed loses what it buffered, at most max_size events or
+    max_age seconds of telemetry. max_age 0 writes every batch at once.
+    '''
+
+    def __init__(self, max_size=None, max_age=None):
+        self.max_size = max_size or settings.ACTIVITY_BUFFER_SIZE
+        self.max_age = settings.ACTIVITY_FLUSH_INTERVAL if max_age is None else max_age
+        self.lock = threading.Lock()
+        self.events = []
+        self.oldest = None
+        self.flusher = None
+
+    def add(self, events):
+        with self.lock:
+            if not self.events:
+                self.oldest = time.monotonic()
+            self.events.extend(events)
+            event_stats["buffered"] += len(events)
+            due = len(self.events) >= self.max_size or not self.max_age
+            if not due and self.flusher is None:
+                self.start_flusher()
+        if due:
+            self.flush()
+
+    def buffered(self, solution_id):
+        '''
+        Returns the events of a solution that were not written yet.
+        '''
+        with self.lock:
+            return [event for event in self.events if event.solution_id == solution_id]
+
+    def take(self):
+        with self.lock:
+            events, self.events, self.oldest = self.events, [], None
+        return events
+
+    def flush(self):
+        '''
+        Writes the buffered events, returns how many were written.
+        '''
+        events = self.take()
+        try:
+            SolutionEvent.objects.bulk_create(events, batch_size=self.max_size)
+        except Exception:
+            # telemetry never fails the request that happens to flush
+            logger.exception("Unable to write %s solution events", len(events))
+            event_stats["dropped"] += len(events)
+            return 0
+        event_stats["flushed"] += len(events)
+        return len(events)
+
+    def start_flusher(self):
+        self.flusher = threading.Thread(target=self.run_flusher, name="activity-log-flusher", daemon=True)
+        self.flusher.start()
+        atexit.register(self.flush)
+
+    def run_flusher(self):
+        while True:
+            time.sleep(self.max_age)
+            oldest = self.oldest
+            if oldest is not None and time.monotonic() - oldest >= self.max_age:
+                try:
+                    self.flush()
+                finally:
+                    # the thread outlives requests, its connection is not closed by them
+                    connection.close()
+
+
+event_buffer = EventBuffer()
+
+
+def question_durations(solution_id, buffer=event_buffer):
+    '''
+    Returns the total duration_ms of each question of a solution, from the
+    written events and the ones still in this process' buffer. Events buffered
+    by other processes are only counted by ItemStatsService.rebuild.
+    '''
+    durations = defaultdict(int, SolutionEvent.objects.filter(solution_id=solution_id, question_id__isnull=False,
+        duration_ms__isnull=False).order_by().values("question_id").annotate(total=Sum("duration_ms"))
+        .values_list("question_id", "total"))
+    for event in buffer.buffered(solution_id):
+        if event.question_id is not None and event.duration_ms is not None:
+            durations[event.question_id] += event.duration_ms
+    return dict(durations)
+
+
+def rollover(cutoff, archive=None, batch_size=5000):
+    '''
+    Deletes the events recorded before cutoff, oldest first, writing them as
+    NDJSON lines to the archive file when one is given. Returns the number
+    of events removed.
+
+    Ids grow with recorded_at, so batches are found by walking the primary
+    key from its start and removed with id range deletes, no index on the
+    time column is needed.
+    '''
+    removed = 0
+    while True:
+        rows = list(SolutionEvent.objects.order_by("id").values("id", "solution_id", "question_id", "kind",
+            "occurred_at", "duration_ms", "recorded_at")[:batch_size])
+        expired = [row for row in rows if row["recorded_at"] < cutoff]
+        if not expired:
+            return removed
+        if archive is not None:
+            archive.write("".join(json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in expired))
+        SolutionEvent.objects.filter(id__gte=expired[0]["id"], id__lte=expired[-1]["id"],
+            recorded_at__lt=cutoff).delete()
+        removed += len(expired)
+        if len(expired) < len(rows):
+            return removed
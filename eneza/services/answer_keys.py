@@ -0,0 +1,159 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from eneza.db_routers import read_from_replica
+from eneza.models import Question, MultiChoiceQuestionChoice, QuizVersion
+from .content_versions import get_quiz_version, bump_quiz_version
+from .utils import LRUCache
+
+
+def normalize_freeform_answer(answer):
+    return (answer or "").strip().lower()
+
+
+class AnswerKey:
+    '''
+    Compiled answer key for a quiz.
+
+    questions maps question id -> (question_type, points)
+    choices maps multichoice question id -> frozenset of all its choice ids
+    correct_choices maps multichoice question id -> frozenset of correct choice ids
+    freeform_answers maps freeform question id -> normalized answer
+    '''
+
+    def __init__(self, quiz_id, questions, choices, correct_choices, freeform_answers, version=None):
+        self.quiz_id = quiz_id
+        self.questions = questions
+        self.choices = choices
+        self.correct_choices = correct_choices
+        self.freeform_answers = freeform_answers
+        self.version = version
+
+    @classmethod
+    def compile(cls, quiz_id, version=None):
+        '''
+        Loads the key for a quiz in two queries regardless of the number of questions.
+        '''
+        questions = {}
+        freeform_answers = {}
+        rows = Question.objects.filter(quiz_id=quiz_id).order_by().values_list(
+            "id", "question_type", "points", "freeformquestion__answer")
+        for question_id, question_type, points, freeform_answer in rows:
+            questions[question_id] = (question_type, points)
+            if question_type == Question.FREE_FORM_QUESTION_TYPE:
+                freeform_answers[question_id] = normalize_freeform_answer(freeform_answer)
+
+        choices = {}
+        correct_choices = {}
+        rows = MultiChoiceQuestionChoice.objects.filter(question__quiz_id=quiz_id).order_by()\
+            .values_list("question_id", "id", "answer")
+        for question_id, choice_id, answer in rows:
+            choices.setdefault(question_id, set()).add(choice_id)
+            if answer:
+                correct_choices.setdefault(question_id, set()).add(choice_id)
+        choices = {k: frozenset(v) for k, v in choices.items()}
+        correct_choices = {k: frozenset(v) for k, v in correct_choices.items()}
+        return cls(quiz_id, questions, choices, correct_choices, freeform_answers, version=version)
+
+    @classmethod
+    def from_snapshot(cls, quiz_id, snapshot, version=None):
+        '''
+        Builds the key from the snapshot of a QuizVersion, see eneza.services.quiz_versions.
+        '''
+        questions, choices, correct_choices, freeform_answers = {}, {}, {}, {}
+        for question in snapshot["questions"]:
+            questions[question["id"]] = (question["question_type"], question["points"])
+            if question["question_type"] == Question.FREE_FORM_QUESTION_TYPE:
+                freeform_answers[question["id"]] = normalize_freeform_answer(question["answer"])
+                continue
+            choices[question["id"]] = frozenset(choice["id"] for choice in question["choices"])
+            correct_choices[question["id"]] = frozenset(choice["id"] for choice in question["choices"]
+                if choice["answer"])
+        return cls(quiz_id, questions, choices, correct_choices, freeform_answers, version=version)
+
+    def question_type(self, question_id):
+        question = self.questions.get(question_id)
+        return question[0] if question else None
+
+    def points(self, question_id):
+        question = self.questions.get(question_id)
+        return question[1] if question else 0
+
+    def has_choice(self, question_id, choice_id):
+        return choice_id in self.choices.get(question_id, ())
+
+    def is_correct_choice(self, question_id, choice_id):
+        return choice_id in self.correct_choices.get(question_id, ())
+
+    def is_correct_freeform(self, question_id, answer):
+        if question_id not in self.freeform_answers:
+            return False
+        return normalize_freeform_answer(answer) == self.freeform_answers[question_id]
+
+
+class AnswerKeyCache:
+    '''
+    Process local LRU of compiled answer keys backed by the shared django cache.
+
+    Entries are keyed on the quiz content version, so a version bump from any
+    process makes every older entry unreachable without having to delete it.
+    '''
+    KEY = "eneza:answer-key:{quiz_id}:{version}"
+    VERSION_KEY = "eneza:answer-key:version:{version_id}"
+
+    def __init__(self, maxsize=None, timeout=None):
+        self.local = LRUCache(maxsize=maxsize or settings.ANSWER_KEY_CACHE_SIZE)
+        self.timeout = timeout or settings.ANSWER_KEY_CACHE_TIMEOUT
+
+    def get(self, quiz_id):
+        version = get_quiz_version(quiz_id)
+        answer_key = self.local.get(quiz_id)
+        if answer_key is not None and answer_key.version == version:
+            return answer_key
+        key = self.KEY.format(quiz_id=quiz_id, version=version)
+        answer_key = cache.get(key)
+        if answer_key is None:
+            with read_from_replica(False):
+                answer_key = AnswerKey.compile(quiz_id, version=version)
+            cache.set(key, answer_key, timeout=self.timeout)
+        self.local.set(quiz_id, answer_key)
+        return answer_key
+
+    def get_version(self, version_id):
+        '''
+        Returns the key of a QuizVersion. Versions never change, their keys are
+        cached without a version lookup and never invalidated.
+        '''
+        local_key = ("version", version_id)
+        answer_key = self.local.get(local_key)
+        if answer_key is not None:
+            return answer_key
+        key = self.VERSION_KEY.format(version_id=version_id)
+        answer_key = cache.get(key)
+        if answer_key is None:
+            version = QuizVersion.objects.get(pk=version_id)
+            answer_key = AnswerKey.from_snapshot(version.quiz_id, json.loads(version.snapshot), version=local_key)
+            cache.set(key, answer_key, timeout=self.timeout)
+        self.local.set(local_key, answer_key)
+        return answer_key
+
+    def for_solution(self, solution):
+        '''
+        Returns the key of the version the solution was started on, the live key
+        of its quiz for solutions that predate versions.
+        '''
+        if solution.version_id is not None:
+            return self.get_version(solution.version_id)
+        return self.get(solution.quiz_id)
+
+    def invalidate(self, quiz_id):
+        self.local.delete(quiz_id)
+        bump_quiz_version(quiz_id)
+        # a key compiled from the old rows before the commit must not survive it
+        transaction.on_commit(lambda: bump_quiz_version(quiz_id))
+
+
+answer_keys = AnswerKeyCache()
@@ -0,0 +1,53 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+from eneza.db_routers import read_from_replica
+from .utils import LRUCache
+
+
+class RenderedContentCache:
+    '''
+    Process local LRU of rendered payloads backed by the shared django cache.
+
+    Payloads are keyed on a content version and the request url, so a version
+    bump makes every older payload unreachable. The shared variant is rendered
+    with private fields hidden and remembers the creators of the objects those
+    fields belong to. A creator gets a variant of their own, everyone else
+    shares one.
+    '''
+    KEY = "eneza:rendered:{name}:{version}:{digest}"
+
+    def __init__(self, maxsize=None, timeout=None):
+        self.local = LRUCache(maxsize=maxsize or settings.RENDERED_CONTENT_CACHE_SIZE)
+        self.timeout = timeout or settings.RENDERED_CONTENT_CACHE_TIMEOUT
+
+    def _get_or_render(self, key, render, private_owners):
+        entry = self.local.get(key)
+        if entry is None:
+            entry = cache.get(key)
+            if entry is None:
+                # a lagging replica would store old rows under the new version
+                with read_from_replica(False):
+                    entry = (render(private_owners), private_owners)
+                cache.set(key, entry, timeout=self.timeout)
+            self.local.set(key, entry)
+        return entry
+
+    def get(self, name, version, params, user, render):
+        '''
+        Returns (payload, etag).
+        render(private_owners) must return the payload. private_owners is a set
+        collecting the creators of hidden private fields for the shared variant
+        and None when rendering a creator's own variant.
+        '''
+        digest = hashlib.md5(repr(params).encode()).hexdigest()
+        key = self.KEY.format(name=name, version=version, digest=digest)
+        payload, owners = self._get_or_render(key, render, set())
+        if user.pk in owners:
+            key = "{}:user:{}".format(key, user.pk)
+            payload, owners = self._get_or_render(key, render, None)
+        return payload, '"{}"'.format(hashlib.md5(key.encode()).hexdigest())
+
+
+rendered_content = RenderedContentCache()
@@ -0,0 +1,56 @@
+import time
+from django.core.cache import cache
+
+
+QUIZ_VERSION_KEY = "eneza:quiz-content-version:{quiz_id}"
+CONTENT_VERSION_KEY = "eneza:content-version"
+
+
+def _initial_version():
+    # versions are seeded from the clock so that a counter evicted from the cache
+    # never comes back with a value that older cache entries were keyed on
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    '''
+    Returns the version counter stored in the shared cache under key.
+    '''
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_quiz_version(quiz_id):
+    '''
+    Returns the content version of a quiz held in the shared cache.
+    The version changes whenever a question or choice of the quiz is written.
+    '''
+    return get_version(QUIZ_VERSION_KEY.format(quiz_id=quiz_id))
+
+
+def bump_quiz_version(quiz_id):
+    return bump_version(QUIZ_VERSION_KEY.format(quiz_id=quiz_id))
+
+
+def get_content_version():
+    '''
+    Returns the version of all published content, it changes whenever a video
+    tutorial, quiz, question or choice is written.
+    '''
+    return get_version(CONTENT_VERSION_KEY)
+
+
+def bump_content_version():
+    return bump_version(CONTENT_VERSION_KEY)
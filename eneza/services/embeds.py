@@ -0,0 +1,228 @@
+import hashlib, logging, re
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from eneza.instrumentation import timer
+from eneza.models import VideoEmbed, VideoTutorial
+from .content_versions import bump_content_version
+from .leased_queue import LeasedQueueWorker
+from .utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com",
+    "youtube-nocookie.com", "www.youtube-nocookie.com")
+SHORT_HOSTS = ("youtu.be", "www.youtu.be")
+# path prefixes followed by the video id, e.g. /shorts/<id>
+VIDEO_PATH_PREFIXES = ("embed", "shorts", "live", "v", "e")
+VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+PLAYLIST_ID = re.compile(r"^[A-Za-z0-9_-]{2,64}$")
+START_TIME = re.compile(r"^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$")
+IFRAME_SRC = re.compile(r'<iframe[^>]+src="([^"]*)"')
+EMBED_URL = "https://youtube.com/embed/{}"
+
+
+class EmbedError(Exception):
+    pass
+
+
+class PermanentEmbedError(EmbedError):
+    '''
+    oEmbed does not know the url, retrying will not help.
+    '''
+
+
+def is_youtube_url(url):
+    host = (urlparse(url.strip()).hostname or "").lower()
+    return host in YOUTUBE_HOSTS or host in SHORT_HOSTS
+
+
+def parse_start(value):
+    '''
+    Seconds of a t= or start= parameter, e.g. 90, 90s or 1m30s.
+    '''
+    match = START_TIME.match(value or "")
+    if not match:
+        return None
+    hours, minutes, seconds = (int(group or 0) for group in match.groups())
+    return hours * 3600 + minutes * 60 + seconds or None
+
+
+def parse_youtube_url(url):
+    '''
+    Returns the embed link of a YouTube video or playlist url without a network
+    round trip, or None for the url shapes that need oEmbed. Handles watch,
+    youtu.be, embed, shorts and live links, playlists and start times.
+    '''
+    parsed = urlparse(url.strip())
+    host = (parsed.hostname or "").lower()
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    # youtu.be links may carry the start time in the fragment
+    params = dict(parse_qs(parsed.fragment), **parse_qs(parsed.query))
+
+    def param(name):
+        return params.get(name, [None])[0]
+
+    video_id = None
+    if host in SHORT_HOSTS and len(segments) == 1:
+        video_id = segments[0]
+    elif host in YOUTUBE_HOSTS:
+        if segments == ["watch"]:
+            video_id = param("v")
+        elif segments in (["playlist"], ["embed", "videoseries"]):
+            video_id = "videoseries"
+        elif len(segments) == 2 and segments[0] in VIDEO_PATH_PREFIXES:
+            video_id = segments[1]
+    if video_id is None:
+        return None
+
+    playlist = param("list")
+    if playlist is not None and not PLAYLIST_ID.match(playlist):
+        playlist = None
+    if video_id == "videoseries" and playlist is None:
+        return None
+    if video_id != "videoseries" and not VIDEO_ID.match(video_id):
+        return None
+    query = []
+    if playlist:
+        query.append(("list", playlist))
+    start = parse_start(param("t") or param("start"))
+    if start:
+        query.append(("start", start))
+    return EMBED_URL.format(video_id) + ("?" + urlencode(query) if query else "")
+
+
+def hash_url(url):
+    return hashlib.sha256(url.strip().encode()).hexdigest()
+
+
+def update_tutorial_links(url, embed_url):
+    '''
+    Points the YouTube tutorials that were saved with url at its embed link.
+    '''
+    updated = VideoTutorial.items.filter(embed_type=VideoTutorial.YOUTUBE_EMBED, video_link=url)\
+        .update(video_link=embed_url)
+    if updated:
+        # queryset updates send no signals, see eneza.signals.invalidate_rendered_content
+        bump_content_version()
+        transaction.on_commit(bump_content_version)
+    return updated
+
+
+class EmbedResolver:
+    '''
+    Resolves YouTube urls to embed links without blocking on the network.
+
+    Known url shapes are parsed offline. Any other url is looked up in a
+    process local LRU backed by the video_embeds table, and queued there for
+    the embed worker when it has not been seen before.
+    '''
+
+    def __init__(self, maxsize=None):
+        self.local = LRUCache(maxsize=maxsize or settings.EMBED_CACHE_SIZE)
+
+    def resolve(self, url):
+        '''
+        Returns the embed link, or None while the url waits for the embed worker.
+        Raises EmbedError for links that are not YouTube videos.
+        '''
+        if not is_youtube_url(url):
+            raise EmbedError("Provided link is not a valid youtube link")
+        embed_url = parse_youtube_url(url)
+        if embed_url:
+            return embed_url
+        url_hash = hash_url(url)
+        embed_url = self.local.get(url_hash)
+        if embed_url:
+            return embed_url
+        embed, created = VideoEmbed.objects.get_or_create(url_hash=url_hash, defaults={"url":url.strip()})
+        if embed.status == VideoEmbed.FAILED:
+            raise EmbedError("Unable to process link, check that video exists")
+        if embed.status == VideoEmbed.RESOLVED:
+            self.local.set(url_hash, embed.embed_url)
+            return embed.embed_url
+        return None
+
+    def refresh(self, url):
+        '''
+        Updates the tutorials linking url if the worker resolved it meanwhile,
+        called once a tutorial saved with a pending url is committed.
+        '''
+        embed = VideoEmbed.objects.filter(url_hash=hash_url(url), status=VideoEmbed.RESOLVED).first()
+        if embed is not None:
+            update_tutorial_links(embed.url, embed.embed_url)
+
+
+embed_resolver = EmbedResolver()
+
+
+class EmbedWorker(LeasedQueueWorker):
+    '''
+    Resolves the queued urls through the oEmbed API.
+
+    Batches are claimed in leases like the email outbox, see
+    LeasedQueueWorker. Lookups run on a thread pool with a strict timeout.
+    Urls oEmbed does not know fail at once, other errors are retried.
+    '''
+    model = VideoEmbed
+
+    def __init__(self, batch_size=None, workers=None, max_attempts=None, backoff=None, lease=None, timeout=None):
+        super().__init__(batch_size=batch_size or settings.EMBED_WORKER_BATCH_SIZE,
+            workers=workers or settings.EMBED_WORKER_THREADS,
+            max_attempts=max_attempts or settings.EMBED_WORKER_MAX_ATTEMPTS,
+            backoff=backoff or settings.EMBED_WORKER_BACKOFF,
+            lease=lease or settings.EMBED_WORKER_LEASE)
+        self.timeout = timeout or settings.EMBED_OEMBED_TIMEOUT
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.workers))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=self.workers))
+
+    def fetch(self, url):
+        with timer("http"):
+            response = self.session.get(settings.YOUTUBE_OEMBED_URL, params={"url":url, "format":"json"},
+                timeout=(self.timeout, self.timeout))
+        if response.status_code in (400, 401, 403, 404):
+            raise PermanentEmbedError("oEmbed responded {}".format(response.status_code))
+        if response.status_code >= 400:
+            raise EmbedError("oEmbed responded {}".format(response.status_code))
+        try:
+            html = response.json().get("html", "")
+        except ValueError:
+            raise EmbedError("oEmbed responded with invalid json")
+        match = IFRAME_SRC.search(html)
+        if not match:
+            raise PermanentEmbedError("oEmbed response has no iframe")
+        return parse_youtube_url(match.group(1)) or match.group(1)
+
+    def process_batch(self):
+        '''
+        Returns the number of urls that were attempted.
+        '''
+        embeds = self.claim_batch()
+        futures = [(embed, self.executor.submit(self.fetch, embed.url)) for embed in embeds]
+        resolved, failed = [], []
+        for embed, future in futures:
+            try:
+                resolved.append((embed, future.result()))
+            except Exception as e:
+                logger.warning("Unable to resolve embed %s: %s", embed.url, e)
+                failed.append((embed, e))
+        self.mark_resolved(resolved)
+        self.mark_failed(failed)
+        return len(embeds)
+
+    def mark_resolved(self, resolved):
+        with transaction.atomic():
+            for embed, embed_url in resolved:
+                VideoEmbed.objects.filter(id=embed.id).update(status=VideoEmbed.RESOLVED, embed_url=embed_url,
+                    attempts=F('attempts') + 1, last_error="", updated_at=timezone.now())
+                update_tutorial_links(embed.url, embed_url)
+
+    def is_permanent(self, error):
+        return isinstance(error, PermanentEmbedError)
@@ -0,0 +1,110 @@
+import csv, json
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from eneza.models import Question, QuizSolution, SubmittedFreeformAnswer, SubmittedMultichoiceAnswer
+
+SOLUTION_FIELDS = ("id", "user_id", "user__email", "user__first_name", "user__last_name", "start", "stop",
+    "complete", "total_points")
+SOLUTION_COLUMNS = ("solution", "user", "email", "first_name", "last_name", "start", "stop", "complete",
+    "total_points")
+
+
+class Buffer:
+    '''
+    File like object csv.writer writes into, drained once per yielded chunk.
+    '''
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def drain(self):
+        value, self.parts = "".join(self.parts), []
+        return value
+
+
+class Gradebook:
+    '''
+    Every solution of a quiz with the answers pivoted into one row per student.
+
+    Solutions and both answer tables are read with chunked iterators ordered
+    on the solution id, server side cursors on PostgreSQL, and merge joined.
+    Only the question list and one chunk per query are held in memory,
+    whatever the number of solutions.
+    '''
+
+    def __init__(self, quiz, chunk_size=None):
+        self.quiz = quiz
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+        self.questions = list(Question.objects.filter(quiz=quiz).order_by("position").values_list("id", "position"))
+
+    def answers(self, model, value_field):
+        return model.objects.filter(solution__quiz=self.quiz).order_by("solution_id")\
+            .values_list("solution_id", "question_id", value_field, "is_valid").iterator(chunk_size=self.chunk_size)
+
+    def rows(self):
+        '''
+        Yields (solution values, {question_id: (answer, is_valid)}) ordered by solution id.
+        '''
+        solutions = QuizSolution.objects.filter(quiz=self.quiz).order_by("id").values_list(*SOLUTION_FIELDS)\
+            .iterator(chunk_size=self.chunk_size)
+        sources = [self.answers(SubmittedFreeformAnswer, "answer"),
+            self.answers(SubmittedMultichoiceAnswer, "selected_choice__choice")]
+        heads = [next(source, None) for source in sources]
+        for solution in solutions:
+            answers = {}
+            for i, source in enumerate(sources):
+                # answers of solutions that are not listed, e.g. inactive ones, are skipped
+                while heads[i] is not None and heads[i][0] <= solution[0]:
+                    solution_id, question_id, answer, is_valid = heads[i]
+                    if solution_id == solution[0]:
+                        answers[question_id] = (answer, is_valid)
+                    heads[i] = next(source, None)
+            yield solution, answers
+
+    def header(self):
+        columns = list(SOLUTION_COLUMNS)
+        for question_id, position in self.questions:
+            columns += ["q{}_answer".format(position), "q{}_correct".format(position)]
+        return columns
+
+    def as_csv(self, rows_per_chunk=500):
+        '''
+        Yields the CSV in chunks of rows_per_chunk rows, the header on its own.
+        '''
+        buffer = Buffer()
+        writer = csv.writer(buffer)
+        writer.writerow(self.header())
+        yield buffer.drain()
+        count = 0
+        for solution, answers in self.rows():
+            row = list(solution)
+            for question_id, position in self.questions:
+                row += answers.get(question_id, ("", ""))
+            writer.writerow(row)
+            count += 1
+            if count % rows_per_chunk == 0:
+                yield buffer.drain()
+        yield buffer.drain()
+
+    def as_ndjson(self, rows_per_chunk=500):
+        '''
+        Yields one JSON object per solution and line, with the answers in question order.
+        '''
+        lines = []
+        for solution, answers in self.rows():
+            data = dict(zip(SOLUTION_COLUMNS, solution))
+            data["answers"] = []
+            for question_id, position in self.questions:
+                answer, correct = answers.get(question_id, (None, None))
+                data["answers"].append({"question":question_id, "position":position, "answer":answer,
+                    "correct":correct})
+            lines.append(json.dumps(data, cls=DjangoJSONEncoder))
+            if len(lines) == rows_per_chunk:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
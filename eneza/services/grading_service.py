@@ -0,0 +1,57 @@
+from eneza.models import SubmittedMultichoiceAnswer, SubmittedFreeformAnswer
+from .answer_keys import answer_keys
+
+
+class GradingService:
+    '''
+    Scores a solution in memory against a compiled answer key.
+
+    The number of queries per solution is constant: one read per submitted answer
+    table and one bulk update per table for the valid answers. The answer key
+    comes from the answer key cache and touches no question tables once warm.
+    '''
+
+    def get_answer_key(self, solution):
+        return answer_keys.for_solution(solution)
+
+    def grade(self, solution, answer_key=None):
+        '''
+        Marks the valid answers of a solution and returns the total points.
+        '''
+        return self.grade_answers(solution, answer_key)[0]
+
+    def grade_answers(self, solution, answer_key=None):
+        '''
+        Marks the valid answers of a solution. Returns the total points and a
+        (question_id, selected choice_id or None, is_valid) tuple per answer.
+        '''
+        if answer_key is None:
+            answer_key = self.get_answer_key(solution)
+        points = 0
+        graded = []
+
+        valid_freeform_ids = []
+        freeform_answers = SubmittedFreeformAnswer.objects.filter(solution_id=solution.id)\
+            .values_list("id", "question_id", "answer")
+        for answer_id, question_id, answer in freeform_answers:
+            is_valid = answer_key.is_correct_freeform(question_id, answer)
+            if is_valid:
+                valid_freeform_ids.append(answer_id)
+                points += answer_key.points(question_id)
+            graded.append((question_id, None, is_valid))
+
+        valid_multichoice_ids = []
+        multichoice_answers = SubmittedMultichoiceAnswer.objects.filter(solution_id=solution.id)\
+            .values_list("id", "question_id", "selected_choice_id")
+        for answer_id, question_id, choice_id in multichoice_answers:
+            is_valid = answer_key.is_correct_choice(question_id, choice_id)
+            if is_valid:
+                valid_multichoice_ids.append(answer_id)
+                points += answer_key.points(question_id)
+            graded.append((question_id, choice_id, is_valid))
+
+        for Model, ids in ((SubmittedFreeformAnswer, valid_freeform_ids),
+                           (SubmittedMultichoiceAnswer, valid_multichoice_ids)):
+            if ids:
+                Model.objects.filter(id__in=ids).update(is_valid=True)
+        return points, graded
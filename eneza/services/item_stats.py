@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from eneza.models import Question, QuizSolution, QuestionStats, ChoiceStats, MultiChoiceQuestionChoice,\
+    SubmittedFreeformAnswer, SubmittedMultichoiceAnswer, SolutionEvent
+
+ANSWER_MODELS = (SubmittedFreeformAnswer, SubmittedMultichoiceAnswer)
+
+
+def discrimination_indices(rows, columns, correct, points):
+    '''
+    Returns the item-rest correlation of every question, None where it is
+    undefined because everybody or nobody got the question right.
+
+    rows is the number of graded solutions, correct the (row, column) cells of
+    the valid answers and points the points of the question of each column.
+    '''
+    import numpy as np
+    if not rows:
+        return [None] * columns
+    matrix = np.zeros((rows, columns), dtype=np.float32)
+    if correct:
+        matrix[tuple(np.array(correct).T)] = 1
+    weighted = matrix * np.array(points, dtype=np.float32)
+    # score of the rest of the quiz, the question itself is left out
+    rest = weighted.sum(axis=1, keepdims=True) - weighted
+    items = matrix - matrix.mean(axis=0)
+    rest = rest - rest.mean(axis=0)
+    numerator = (items * rest).sum(axis=0, dtype=np.float64)
+    denominator = np.sqrt((items ** 2).sum(axis=0, dtype=np.float64) * (rest ** 2).sum(axis=0, dtype=np.float64))
+    return [float(n / d) if d > 0 else None for n, d in zip(numerator, denominator)]
+
+
+class ItemStatsService:
+    '''
+    Per question and per choice counters of the graded solutions.
+
+    Grading a solution adds to the counters with a constant number of bulk
+    statements, whatever the number of questions: missing rows are inserted
+    ignoring conflicts, then incremented in place. rebuild() recomputes a
+    quiz from the answer tables with aggregate queries, and the
+    discrimination indices with NumPy.
+    '''
+
+    def record(self, solution, graded, durations=None):
+        '''
+        Adds a graded solution, graded as returned by GradingService.grade_answers
+        and durations the time spent on each question as returned by
+        eneza.services.activity_log.question_durations.
+        '''
+        if not graded:
+            return
+        now = timezone.now()
+        # rows are inserted and locked in question id order, so concurrent
+        # gradings of the same quiz cannot deadlock on each other's rows
+        question_ids = sorted({question_id for question_id, choice_id, is_valid in graded})
+        valid_ids = [question_id for question_id, choice_id, is_valid in graded if is_valid]
+        times = {question_id:total for question_id, total in (durations or {}).items() if question_id in question_ids}
+        QuestionStats.objects.bulk_create([QuestionStats(question_id=question_id, quiz_id=solution.quiz_id)
+            for question_id in question_ids], ignore_conflicts=True)
+        QuestionStats.objects.filter(question_id__in=question_ids).update(attempts=F("attempts") + 1,
+            correct=F("correct") + Case(When(question_id__in=valid_ids, then=Value(1)), default=Value(0),
+            output_field=IntegerField()),
+            timed=F("timed") + Case(When(question_id__in=list(times), then=Value(1)), default=Value(0),
+            output_field=IntegerField()),
+            total_time_ms=F("total_time_ms") + Case(*[When(question_id=question_id, then=Value(total))
+            for question_id, total in times.items()], default=Value(0), output_field=BigIntegerField()),
+            updated_at=now)
+
+        choice_ids = sorted(choice_id for question_id, choice_id, is_valid in graded if choice_id is not None)
+        if choice_ids:
+            ChoiceStats.objects.bulk_create([ChoiceStats(choice_id=choice_id) for choice_id in choice_ids],
+                ignore_conflicts=True)
+            ChoiceStats.objects.filter(choice_id__in=choice_ids).update(selections=F("selections") + 1)
+
+    def rebuild(self, quiz_id):
+        '''
+        Recomputes the stats of a quiz, returns the number of graded solutions.
+        Increments of solutions graded while the rebuild runs may be lost, run
+        it when the quiz is quiet.
+        '''
+        questions = list(Question.objects.filter(quiz_id=quiz_id).order_by("position").values_list("id", "points"))
+        solutions = QuizSolution.objects.filter(quiz_id=quiz_id, complete=True)
+        stats = {question_id:QuestionStats(question_id=question_id, quiz_id=quiz_id) for question_id, _ in questions}
+
+        for Model in ANSWER_MODELS:
+            rows = Model.objects.filter(solution__in=solutions).order_by().values("question_id")\
+                .annotate(attempts=Count("id"), correct=Count("id", filter=Q(is_valid=True)))
+            # answers of questions that were deleted since are skipped
+            for row in rows:
+                if row["question_id"] not in stats:
+                    continue
+                stats[row["question_id"]].attempts = row["attempts"]
+                stats[row["question_id"]].correct = row["correct"]
+        rows = SolutionEvent.objects.filter(solution__in=solutions, question_id__isnull=False, duration_ms__isnull=False)\
+            .order_by().values("question_id").annotate(timed=Count("solution_id", distinct=True),
+            total=Sum("duration_ms"))
+        for row in rows:
+            if row["question_id"] not in stats:
+                continue
+            stats[row["question_id"]].timed = row["timed"]
+            stats[row["question_id"]].total_time_ms = row["total"]
+        choices = dict(SubmittedMultichoiceAnswer.objects.filter(solution__in=solutions).order_by()
+            .values("selected_choice_id").annotate(selections=Count("id")).values_list("selected_choice_id", "selections"))
+
+        columns = {question_id:i for i, (question_id, _) in enumerate(questions)}
+        solution_ids = {solution_id:i for i, solution_id in enumerate(solutions.values_list("id", flat=True))}
+        correct = []
+        for Model in ANSWER_MODELS:
+            rows = Model.objects.filter(solution__in=solutions, is_valid=True).order_by()\
+                .values_list("solution_id", "question_id").iterator()
+            # solutions graded since the ids were read are skipped
+            correct.extend((solution_ids[solution_id], columns[question_id]) for solution_id, question_id in rows
+                if question_id in columns and solution_id in solution_ids)
+        indices = discrimination_indices(len(solution_ids), len(columns), correct,
+            [points for _, points in questions])
+        for (question_id, _), index in zip(questions, indices):
+            stats[question_id].discrimination = index
+
+        choice_ids = MultiChoiceQuestionChoice.objects.filter(question__quiz_id=quiz_id).values_list("id", flat=True)
+        with transaction.atomic():
+            QuestionStats.objects.filter(quiz_id=quiz_id).delete()
+            ChoiceStats.objects.filter(choice__question__quiz_id=quiz_id).delete()
+            QuestionStats.objects.bulk_create(stats.values())
+            ChoiceStats.objects.bulk_create([ChoiceStats(choice_id=choice_id, selections=choices.get(choice_id, 0))
+                for choice_id in choice_ids])
+        return len(solution_ids)
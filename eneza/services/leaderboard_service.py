@@ -0,0 +1,121 @@
+import pytz
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from eneza.db_routers import read_from_replica
+from eneza.models import QuizSolution, LeaderboardEntry, ScoreBucket
+from .content_versions import get_version, bump_version
+
+
+class LeaderboardService:
+    '''
+    Incrementally maintained per quiz leaderboard and score histogram.
+
+    Rankings are read from the leaderboard_rank index on
+    (quiz, -total_points, time_taken, id): a page of the top of the board is an
+    index range scan. A rank adds up the score buckets above the user's
+    points and counts the entries tied on points only. Pages, ranks and
+    histograms are cached per quiz and dropped whenever a solution of the quiz
+    is recorded.
+    '''
+    VERSION_KEY = "eneza:leaderboard-version:{quiz_id}"
+    PAGE_KEY = "eneza:leaderboard:{quiz_id}:{version}:{offset}:{limit}"
+    RANK_KEY = "eneza:leaderboard-rank:{quiz_id}:{version}:{user_id}"
+    DISTRIBUTION_KEY = "eneza:score-distribution:{quiz_id}:{version}"
+    CACHE_TIMEOUT = 60 * 60
+    ORDERING = ('-total_points', 'time_taken', 'id')
+
+    def _version(self, quiz_id):
+        return get_version(self.VERSION_KEY.format(quiz_id=quiz_id))
+
+    def _invalidate(self, quiz_id):
+        bump_version(self.VERSION_KEY.format(quiz_id=quiz_id))
+
+    def time_taken(self, solution:QuizSolution):
+        if not solution.stop:
+            return 0
+        delta = solution.stop.replace(tzinfo=pytz.UTC) - solution.start.replace(tzinfo=pytz.UTC)
+        return max(int(delta.total_seconds()), 0)
+
+    def _increment_bucket(self, quiz_id, points, amount):
+        updated = ScoreBucket.objects.filter(quiz_id=quiz_id, points=points).update(count=F('count') + amount)
+        if updated or amount < 0:
+            return
+        try:
+            with transaction.atomic():
+                ScoreBucket.objects.create(quiz_id=quiz_id, points=points, count=amount)
+        except IntegrityError:
+            ScoreBucket.objects.filter(quiz_id=quiz_id, points=points).update(count=F('count') + amount)
+
+    @transaction.atomic
+    def record(self, solution:QuizSolution):
+        '''
+        Adds or updates the solution's entry, call after the solution has been graded.
+        '''
+        previous = LeaderboardEntry.objects.select_for_update()\
+            .filter(quiz_id=solution.quiz_id, user_id=solution.user_id).first()
+        if previous is not None:
+            self._increment_bucket(solution.quiz_id, previous.total_points, -1)
+            previous.solution = solution
+            previous.total_points = solution.total_points
+            previous.time_taken = self.time_taken(solution)
+            previous.save()
+        else:
+            LeaderboardEntry.objects.create(quiz_id=solution.quiz_id, user_id=solution.user_id, solution=solution,
+                total_points=solution.total_points, time_taken=self.time_taken(solution))
+        self._increment_bucket(solution.quiz_id, solution.total_points, 1)
+        transaction.on_commit(lambda: self._invalidate(solution.quiz_id))
+
+    def _serialize_entries(self, rows, first_rank):
+        return [{"rank":first_rank + i, "user":row["user_id"], "first_name":row["user__first_name"],
+            "total_points":row["total_points"], "time_taken":row["time_taken"]} for i, row in enumerate(rows)]
+
+    def top(self, quiz_id, offset=0, limit=10):
+        key = self.PAGE_KEY.format(quiz_id=quiz_id, version=self._version(quiz_id), offset=offset, limit=limit)
+        entries = cache.get(key)
+        if entries is None:
+            with read_from_replica(False):
+                rows = list(LeaderboardEntry.objects.filter(quiz_id=quiz_id).order_by(*self.ORDERING)
+                    .values("user_id", "user__first_name", "total_points", "time_taken")[offset:offset+limit])
+            entries = self._serialize_entries(rows, offset + 1)
+            cache.set(key, entries, timeout=self.CACHE_TIMEOUT)
+        return entries
+
+    def rank(self, quiz_id, user):
+        '''
+        Returns the user's entry with its 1 based rank, or None when the user has no graded solution.
+        '''
+        version = self._version(quiz_id)
+        key = self.RANK_KEY.format(quiz_id=quiz_id, version=version, user_id=user.id)
+        ranked = cache.get(key)
+        if ranked is not None:
+            return ranked or None
+        # a lagging replica must not cache a stale rank under the new version
+        with read_from_replica(False):
+            entry = LeaderboardEntry.objects.filter(quiz_id=quiz_id, user_id=user.id)\
+                .values("id", "user_id", "user__first_name", "total_points", "time_taken").first()
+            if entry is None:
+                # cached as an empty dict so a user without a solution is not looked up again
+                cache.set(key, {}, timeout=self.CACHE_TIMEOUT)
+                return None
+            points = entry["total_points"]
+            ahead = sum(bucket["count"] for bucket in self.distribution(quiz_id) if bucket["points"] > points)
+            ahead += LeaderboardEntry.objects.filter(quiz_id=quiz_id, total_points=points).filter(
+                Q(time_taken__lt=entry["time_taken"]) | Q(time_taken=entry["time_taken"], id__lt=entry["id"])
+            ).count()
+        ranked = self._serialize_entries([entry], ahead + 1)[0]
+        cache.set(key, ranked, timeout=self.CACHE_TIMEOUT)
+        return ranked
+
+    def distribution(self, quiz_id):
+        key = self.DISTRIBUTION_KEY.format(quiz_id=quiz_id, version=self._version(quiz_id))
+        buckets = cache.get(key)
+        if buckets is None:
+            with read_from_replica(False):
+                buckets = list(ScoreBucket.objects.filter(quiz_id=quiz_id, count__gt=0).values("points", "count"))
+            cache.set(key, buckets, timeout=self.CACHE_TIMEOUT)
+        return buckets
+
+    def count(self, quiz_id):
+        return sum(bucket["count"] for bucket in self.distribution(quiz_id))
@@ -0,0 +1,78 @@
+import datetime, time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+class LeasedQueueWorker:
+    '''
+    Drains a queue table whose rows have a status, a next_attempt_at, an
+    attempts counter and a last_error, e.g. OutboxEmail and VideoEmbed.
+
+    Due rows are claimed in batches by pushing their next attempt time past a
+    lease, so concurrent workers skip them and a crashed worker's rows are
+    picked up again once the lease runs out. Failed rows are retried with
+    exponential backoff until max_attempts is reached. Subclasses set model
+    and implement process_batch.
+    '''
+    model = None
+
+    def __init__(self, batch_size, workers, max_attempts, backoff, lease):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def claimed(self, ids):
+        return self.model.objects.filter(id__in=ids)
+
+    def claim_batch(self):
+        now = timezone.now()
+        with transaction.atomic():
+            queryset = self.model.objects.filter(status=self.model.PENDING, next_attempt_at__lte=now)\
+                .order_by('next_attempt_at', 'id')
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            ids = list(queryset.values_list('id', flat=True)[:self.batch_size])
+            self.model.objects.filter(id__in=ids).update(next_attempt_at=now + datetime.timedelta(seconds=self.lease))
+        return list(self.claimed(ids))
+
+    def process_batch(self):
+        '''
+        Returns the number of rows that were attempted.
+        '''
+        raise NotImplementedError("Not Implemented")
+
+    def is_permanent(self, error):
+        '''
+        True when retrying cannot help, the row fails at once.
+        '''
+        return False
+
+    def mark_failed(self, failures):
+        now = timezone.now()
+        for row, error in failures:
+            row.attempts += 1
+            row.last_error = str(error)
+            if self.is_permanent(error) or row.attempts >= self.max_attempts:
+                row.status = self.model.FAILED
+            else:
+                row.next_attempt_at = now + datetime.timedelta(seconds=self.backoff * 2 ** (row.attempts - 1))
+            row.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+
+    def run(self, once=False, sleep=1):
+        '''
+        Processes batches until the queue is empty when once is set, forever otherwise.
+        '''
+        try:
+            while True:
+                processed = self.process_batch()
+                if once and not processed:
+                    return
+                if not processed:
+                    time.sleep(sleep)
+        finally:
+            self.executor.shutdown(wait=True)
@@ -13,15 +13,32 @@ class AbstractMailer(abc.ABC):
 
 class Mailer(AbstractMailer):
 
-    def __init__(self):
+    def __init__(self, transport=None):
         self.mail_renderer = RenderJinjaMailTemplate()
-        self.mailer  = SendGridMailer()
+        self.mailer  = transport if transport is not None else SendGridMailer()
+
+    def render_email(self, template, context, text=False):
+        if text:
+            return self.mail_renderer.parse_mail_text_mail_template(template, context)
+        return self.mail_renderer.parse_mail_html_mail_template(template, context)
+
+    def send_rendered_email(self, subject, from_email, to_emails, content, text=False):
+        message_type = "text" if text else "html"
+        self.mailer.send(from_email, to_emails, subject, content, message_type=message_type)
 
     def send_email(self, subject,from_email, to_emails, template, context, text=False):
         '''
         Params:
             subject, from_email, to_emailsm template, context, text=False
         '''
-        html_content =  self.mail_renderer.parse_mail_html_mail_template(template, context)
-        self.mailer.send(from_email,to_emails, subject, html_content, message_type="html")
+        content = self.render_email(template, context, text=text)
+        self.send_rendered_email(subject, from_email, to_emails, content, text=text)
 
+    def send_batch_email(self, subject, from_email, recipients, template, context, text=False):
+        '''
+        Renders the template once and sends it to all recipients in batched requests.
+        recipients is a list of (email, substitutions), see SendGridMailer.send_batch
+        '''
+        content = self.render_email(template, context, text=text)
+        message_type = "text" if text else "html"
+        return self.mailer.send_batch(from_email, recipients, subject, content, message_type=message_type)
@@ -1,26 +1,69 @@
-import abc
-from django.template import Context
-from django.template.loader import get_template, render_to_string
+import abc, os
+from django.conf import settings
+from django.template import engines
+from django.template.loader import get_template
+
+from eneza.instrumentation import timer
+from eneza.services.utils import LRUCache
 
 class AbstractRenderJinjaMailTemplate(abc.ABC):
     @abc.abstractmethod
     def parse_mail_html_mail_template(self, template, context):
         raise NotImplementedError("Not Implemented")
-    
+
     @abc.abstractmethod
     def parse_mail_text_mail_template(self, template, context):
         raise NotImplementedError("Not Implemented")
 
 class RenderJinjaMailTemplate(AbstractRenderJinjaMailTemplate):
+    '''
+    Renders mail templates compiled once per process.
+
+    Compiled templates are kept in a bounded LRU keyed by template name and
+    invalidated when the modification time of the template file changes.
+    '''
+    templates = LRUCache(maxsize=settings.MAIL_TEMPLATE_CACHE_SIZE)
+
     def __init__(self, *args, **kwargs):
         pass
 
+    def _mtime(self, path):
+        try:
+            return os.path.getmtime(path)
+        except (OSError, TypeError):
+            return None
+
+    def _reset_loaders(self):
+        # with DEBUG off django's cached loader would hand back the stale template
+        for engine in engines.all():
+            for loader in getattr(getattr(engine, "engine", None), "template_loaders", []):
+                if hasattr(loader, "reset"):
+                    loader.reset()
+
+    def get_compiled_template(self, template):
+        cached = self.templates.get(template)
+        if cached is not None:
+            compiled, path, mtime = cached
+            if path is None or self._mtime(path) == mtime:
+                return compiled
+            self._reset_loaders()
+        compiled = get_template(template)
+        path = getattr(compiled.origin, "name", None)
+        self.templates.set(template, (compiled, path, self._mtime(path)))
+        return compiled
+
+    def render_many(self, template, contexts):
+        '''
+        Renders one template for many contexts, e.g. one results email per recipient.
+        '''
+        compiled = self.get_compiled_template(template)
+        with timer("template"):
+            return [compiled.render(context) for context in contexts]
+
     def parse_mail_html_mail_template(self, template, context):
-        html_template =  get_template(template)
-        html_content = render_to_string(template,context)
-        return html_content
-    
+        with timer("template"):
+            return self.get_compiled_template(template).render(context)
+
     def parse_mail_text_mail_template(self, template, context):
-        text_template =  get_template(template)
-        text_content = render_to_string(text_content,context)
-        return text_content
+        with timer("template"):
+            return self.get_compiled_template(template).render(context)
@@ -0,0 +1,86 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from eneza.models import OutboxEmail, QuizSolution
+from eneza.services.leased_queue import LeasedQueueWorker
+from eneza.services.quiz_service import QuizService
+from . import Mailer
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker(LeasedQueueWorker):
+    '''
+    Drains the email outbox.
+
+    Due emails are claimed in leased batches, see LeasedQueueWorker, rendered
+    on the calling thread (rendering touches the ORM) and delivered by a
+    thread pool.
+    '''
+    model = OutboxEmail
+
+    def __init__(self, mailer=None, batch_size=None, workers=None, max_attempts=None, backoff=None, lease=None):
+        super().__init__(batch_size=batch_size or settings.MAIL_WORKER_BATCH_SIZE,
+            workers=workers or settings.MAIL_WORKER_THREADS,
+            max_attempts=max_attempts or settings.MAIL_WORKER_MAX_ATTEMPTS,
+            backoff=backoff or settings.MAIL_WORKER_BACKOFF,
+            lease=lease or settings.MAIL_WORKER_LEASE)
+        self.mailer = mailer or Mailer()
+
+    def claimed(self, ids):
+        return super().claimed(ids).select_related('solution__user', 'solution__quiz__video_tutorial')
+
+    def render(self, email):
+        context = {}
+        if email.solution_id:
+            context = QuizService().quiz_results_context(email.solution)
+        return self.mailer.render_email(email.template, context)
+
+    def deliver(self, email, content):
+        self.mailer.send_rendered_email(email.subject, email.from_email, [email.to_email], content)
+
+    def process_batch(self):
+        '''
+        Returns the number of emails that were attempted.
+        '''
+        emails = self.claim_batch()
+        if not emails:
+            return 0
+        futures = []
+        for email in emails:
+            try:
+                content = self.render(email)
+            except Exception as e:
+                futures.append((email, None, e))
+                continue
+            futures.append((email, self.executor.submit(self.deliver, email, content), None))
+
+        sent, failed = [], []
+        for email, future, error in futures:
+            if future is not None:
+                try:
+                    future.result()
+                except Exception as e:
+                    error = e
+            if error is None:
+                sent.append(email)
+            else:
+                logger.warning("Unable to send outbox email %s: %s", email.id, error)
+                failed.append((email, error))
+        self.mark_sent(sent)
+        self.mark_failed(failed)
+        return len(emails)
+
+    def mark_sent(self, emails):
+        if not emails:
+            return
+        with transaction.atomic():
+            OutboxEmail.objects.filter(id__in=[e.id for e in emails])\
+                .update(status=OutboxEmail.SENT, sent_at=timezone.now(), attempts=F('attempts') + 1)
+            solution_ids = [e.solution_id for e in emails if e.solution_id]
+            if solution_ids:
+                QuizSolution.objects.filter(id__in=solution_ids).update(sent_notification=True)
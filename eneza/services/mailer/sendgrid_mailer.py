@@ -1,21 +1,92 @@
-from sendgrid import  SendGridAPIClient
-from sendgrid.helpers.mail import Mail 
+import logging, threading, time
+import requests
+from requests.adapters import HTTPAdapter
+from sendgrid.helpers.mail import Mail, Personalization, To, Substitution
 from django.conf import settings
 
+from eneza.instrumentation import timer
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    '''
+    Returns the process wide pooled http session used for all SendGrid requests.
+    '''
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.SENDGRID_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class SendGridError(Exception):
+    pass
+
+
 class SendGridMailer:
-    def __init__(self, *args, **kwargs):
-        self.client = SendGridAPIClient(settings.SENDGRID_API_KEY)
+    # SendGrid accepts at most 1000 personalizations per mail/send request
+    MAX_PERSONALIZATIONS = 1000
 
-    def send(self, from_email, to_emails, subject, message, message_type="html"):
-        # if type(to_emails) == list:
-        #     to_emails = ",".join(to_emails)
-        context = {"from_email":from_email, "to_emails":to_emails,"subject":subject}
+    def __init__(self, *args, api_key=None, api_host=None, **kwargs):
+        self.api_key = api_key or settings.SENDGRID_API_KEY
+        self.api_host = api_host or settings.SENDGRID_API_HOST
+        self.session = get_session()
+
+    def _content(self, message, message_type):
         if message_type=="html":
-            context["html_content"] = message
+            return {"html_content":message}
         elif message_type=="text":
-            context["plain_text_content"] = message
-        message = Mail(**context)
-        response=self.client.send(message)
-        print(response.status_code)
-        print(response.body)
-        print(response.headers)
\ No newline at end of file
+            return {"plain_text_content":message}
+        raise ValueError("Unknown message type {}".format(message_type))
+
+    def _post(self, mail):
+        with timer("http"):
+            response = self.session.post(self.api_host.rstrip("/") + "/v3/mail/send", json=mail.get(),
+                headers={"Authorization":"Bearer {}".format(self.api_key)},
+                timeout=settings.SENDGRID_TIMEOUT)
+        if response.status_code >= 400:
+            raise SendGridError("SendGrid responded {}: {}".format(response.status_code, response.text))
+        return response
+
+    def send(self, from_email, to_emails, subject, message, message_type="html"):
+        mail = Mail(from_email=from_email, to_emails=to_emails, subject=subject, **self._content(message, message_type))
+        response = self._post(mail)
+        logger.debug("SendGrid send to %s responded %s", to_emails, response.status_code)
+        return response
+
+    def send_batch(self, from_email, recipients, subject, message, message_type="html", batch_size=None):
+        '''
+        Sends one message to many recipients packing up to MAX_PERSONALIZATIONS
+        recipients in each request.
+
+        recipients is a list of (email, substitutions) where substitutions maps
+        tags in the message, e.g. "-first_name-", to the recipient's value.
+        Returns a list of {"recipients", "status", "seconds"} per batch.
+        '''
+        batch_size = min(batch_size or self.MAX_PERSONALIZATIONS, self.MAX_PERSONALIZATIONS)
+        timings = []
+        for start in range(0, len(recipients), batch_size):
+            batch = recipients[start:start+batch_size]
+            mail = Mail(from_email=from_email, subject=subject, **self._content(message, message_type))
+            for email, substitutions in batch:
+                personalization = Personalization()
+                personalization.add_to(To(email))
+                for key, value in (substitutions or {}).items():
+                    personalization.add_substitution(Substitution(key, str(value)))
+                mail.add_personalization(personalization)
+            started = time.perf_counter()
+            response = self._post(mail)
+            timing = {"recipients":len(batch), "status":response.status_code,
+                "seconds":time.perf_counter() - started}
+            logger.info("SendGrid batch of %(recipients)s recipients responded %(status)s in %(seconds).3fs", timing)
+            timings.append(timing)
+        return timings
@@ -0,0 +1,99 @@
+import csv, io
+from collections import OrderedDict
+
+from django.db import IntegrityError, connection, transaction
+
+from eneza.exceptions import SimpleValidationError
+from eneza.models import Question, MultiChoiceQuestion, FreeFormQuestion, MultiChoiceQuestionChoice
+from .quiz_versions import quiz_content_changed
+from .content_versions import bump_content_version
+
+CSV_COLUMNS = ("position", "question_type", "content", "points", "answer")
+
+
+def parse_question_csv(text):
+    '''
+    Turns a CSV with the columns position, question_type, content, points,
+    answer, choice and choice_answer into import documents. A multi choice
+    question takes one row per choice, the rows share its position.
+    '''
+    questions = OrderedDict()
+    for row in csv.DictReader(io.StringIO(text)):
+        row = {key.strip():(value or "").strip() for key, value in row.items() if key}
+        question = questions.get(row.get("position"))
+        if question is None:
+            question = questions[row.get("position")] = {k:row[k] for k in CSV_COLUMNS if row.get(k)}
+        if row.get("choice"):
+            choice = {"choice":row["choice"]}
+            if row.get("choice_answer"):
+                choice["answer"] = row["choice_answer"]
+            question.setdefault("choices", []).append(choice)
+    return list(questions.values())
+
+
+class QuestionImportService:
+    '''
+    Creates the questions and choices of a quiz from validated import
+    documents, see QuestionImportSerializer.
+
+    Positions are checked in memory against a single query of the quiz's
+    existing positions. Everything is then written in one transaction with
+    batched inserts: the parent question rows, the multi table child rows
+    through the manager's _insert (bulk_create refuses inherited models) and
+    the choices. Bulk inserts send no signals, the quiz revision, the answer
+    key and the rendered content are updated here instead.
+    '''
+    BATCH_SIZE = 500
+
+    def __init__(self, quiz, user):
+        self.quiz = quiz
+        self.user = user
+
+    def check_positions(self, questions):
+        positions = [question["position"] for question in questions]
+        duplicates = sorted({position for position in positions if positions.count(position) > 1})
+        if duplicates:
+            raise SimpleValidationError(detail="Duplicate positions {}".format(duplicates))
+        taken = sorted(set(positions) & set(Question.items.filter(quiz=self.quiz).values_list("position", flat=True)))
+        if taken:
+            raise SimpleValidationError(detail="Unique together constraint quiz_position violated for positions {}"
+                .format(taken))
+
+    def insert_children(self, model, rows):
+        # bulk_create raises for multi table inheritance and save() would run
+        # one UPDATE and one INSERT per row. _insert is the private method behind
+        # both, its signature has been stable since Django 1.10: it writes only
+        # the child table's own columns, question_ptr_id is the parent's pk.
+        # QuestionImportTestCase.test_child_rows_match_parent_rows checks it.
+        fields = model._meta.local_concrete_fields
+        batch_size = max(min(connection.ops.bulk_batch_size(fields, rows), self.BATCH_SIZE), 1)
+        for start in range(0, len(rows), batch_size):
+            model._base_manager._insert(rows[start:start + batch_size], fields=fields)
+
+    def import_questions(self, questions):
+        '''
+        Returns {position: question id} of the created questions.
+        '''
+        self.check_positions(questions)
+        try:
+            with transaction.atomic():
+                Question.items.bulk_create([Question(quiz=self.quiz, question_type=q["question_type"],
+                    position=q["position"], content=q["content"], points=q["points"], created_by=self.user)
+                    for q in questions], batch_size=self.BATCH_SIZE)
+                # ids are only returned by bulk inserts on PostgreSQL, positions are unique per quiz
+                ids = dict(Question.items.filter(quiz=self.quiz).values_list("position", "id"))
+                self.insert_children(FreeFormQuestion, [FreeFormQuestion(question_ptr_id=ids[q["position"]],
+                    answer=q["answer"]) for q in questions if q["question_type"] == Question.FREE_FORM_QUESTION_TYPE])
+                multi_choice = [q for q in questions if q["question_type"] == Question.MULTI_CHOICE_QUESTION_TYPE]
+                self.insert_children(MultiChoiceQuestion, [MultiChoiceQuestion(question_ptr_id=ids[q["position"]])
+                    for q in multi_choice])
+                MultiChoiceQuestionChoice.items.bulk_create([MultiChoiceQuestionChoice(
+                    question_id=ids[q["position"]], choice=c["choice"], position=c["position"], answer=c["answer"],
+                    created_by=self.user) for q in multi_choice for c in q["choices"]], batch_size=self.BATCH_SIZE)
+                quiz_content_changed(self.quiz.id)
+                bump_content_version()
+                transaction.on_commit(bump_content_version)
+        except IntegrityError:
+            # a concurrent write took one of the positions after they were checked
+            raise SimpleValidationError(detail="Unique together constraint quiz_position violated")
+        return {q["position"]:ids[q["position"]] for q in questions}
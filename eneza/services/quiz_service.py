@@ -1,9 +1,13 @@
 import abc, json, datetime
 from django.conf import settings
 from eneza.models import SubmittedMultichoiceAnswer, SubmittedFreeformAnswer,\
-    MultiChoiceQuestion,QuizSolution, MultiChoiceQuestionChoice, FreeFormQuestion, QuizSolutionActivity
+    MultiChoiceQuestion,QuizSolution, MultiChoiceQuestionChoice, FreeFormQuestion, QuizSolutionActivity, OutboxEmail
 from eneza.exceptions import SimpleValidationError
 from eneza.services.mailer import Mailer
+from .grading_service import GradingService
+from .leaderboard_service import LeaderboardService
+from .item_stats import ItemStatsService
+from .activity_log import event_buffer, question_durations
 from .utils import strfdelta
 import pytz
 
@@ -24,9 +28,15 @@ class AbstractQuizService(abc.ABC):
 
 class QuizService(AbstractQuizService):
 
+    QUIZ_RESULTS_SUBJECT = "Quiz Results"
+    QUIZ_RESULTS_TEMPLATE = 'emails/quiz_results.html'
+
     def __init__(self, *args, **kwargs):
         self._errors={}
-        self.mailer = Mailer()
+        self.grading_service = GradingService()
+        self.leaderboard_service = LeaderboardService()
+        self.item_stats_service = ItemStatsService()
+        self.event_buffer = event_buffer
 
     @property
     def errors(self):
@@ -48,43 +58,39 @@ class QuizService(AbstractQuizService):
     def process_solution(self, solution:QuizSolution, stop=True):
         # if solution.complete:
         #     raise SimpleValidationError(detail="Solution already submitted")
-        points = 0
-        mutichoice_answers = SubmittedMultichoiceAnswer.objects.filter(solution_id=solution.id)
-        freeform_answers = SubmittedFreeformAnswer.objects.filter(solution_id=solution.id)
-        for answer in freeform_answers:
-            if self.validate_freeform_answer(answer):
-                answer.is_valid=True
-                answer.save()
-                points += answer.question.points
-        for answer in mutichoice_answers:
-            if self.validate_multichoice_answer(answer):
-                answer.is_valid=True
-                answer.save()
-                points += answer.question.points
+        points, graded = self.grading_service.grade_answers(solution)
         solution.total_points= points
         solution.complete=True
         if stop:
             stop = datetime.datetime.utcnow()
             solution.stop = stop
-            solution.save()
             context = {"time":stop.isoformat(),"points":points}
             end_activity = QuizSolutionActivity(solution=solution,
                     activity=QuizSolutionActivity.END_TEST, context=json.dumps(context)
                 )
             end_activity.save()
         solution.save()
+        self.leaderboard_service.record(solution)
+        self.item_stats_service.record(solution, graded, question_durations(solution.id, buffer=self.event_buffer))
         return solution
 
-    def send_quiz_results_email(self, solution:QuizSolution):
-        template = 'emails/quiz_results.html'
-        user = solution.created_by
+    def quiz_results_context(self, solution:QuizSolution):
+        user = solution.user
         time_taken = solution.stop.replace(tzinfo=pytz.UTC) - solution.start.replace(tzinfo=pytz.UTC)
-        context = {"quiz":solution.quiz, "solution":solution, "user":user, "time_taken":strfdelta(time_taken)}
-        mailer = Mailer()
-        mailer.send_email("Quiz Results",settings.DEFAULT_FROM_EMAIL,[user.email],template,context)
-        solution.sent_notification =True
-        solution.save()
+        return {"quiz":solution.quiz, "solution":solution, "user":user, "time_taken":strfdelta(time_taken)}
 
+    def queue_quiz_results_email(self, solution:QuizSolution):
+        '''
+        Writes the results email to the outbox, call inside the grading transaction.
+        The email is delivered by the run_mail_worker command.
+        '''
+        return OutboxEmail.objects.create(subject=self.QUIZ_RESULTS_SUBJECT, from_email=settings.DEFAULT_FROM_EMAIL,
+            to_email=solution.user.email, template=self.QUIZ_RESULTS_TEMPLATE, solution=solution)
 
-
-        
+    def send_quiz_results_email(self, solution:QuizSolution, mailer=None):
+        mailer = mailer or Mailer()
+        context = self.quiz_results_context(solution)
+        mailer.send_email(self.QUIZ_RESULTS_SUBJECT,settings.DEFAULT_FROM_EMAIL,[solution.user.email],
+            self.QUIZ_RESULTS_TEMPLATE,context)
+        solution.sent_notification =True
+        solution.save()
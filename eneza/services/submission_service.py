@@ -0,0 +1,69 @@
+from rest_framework.exceptions import NotFound
+
+from eneza.models import Question, QuizSolution, SubmittedFreeformAnswer, SubmittedMultichoiceAnswer
+from eneza.exceptions import SimpleValidationError
+from .answer_keys import answer_keys
+
+
+class QuizSubmissionService:
+    '''
+    Validates and stores a whole list of submitted answers for a solution.
+
+    Questions and choices are resolved against the cached answer key and
+    existing answers are checked with one query per answer model, so the number
+    of queries does not depend on the number of answers.
+    '''
+    models_mapper = {Question.FREE_FORM_QUESTION_TYPE:SubmittedFreeformAnswer,
+                Question.MULTI_CHOICE_QUESTION_TYPE:SubmittedMultichoiceAnswer}
+
+    def build_answers(self, solution:QuizSolution, validated_data, user):
+        '''
+        Returns unsaved answer instances grouped by answer model.
+        validated_data is a list of {"question":int, "answer":str}
+        '''
+        answer_key = answer_keys.for_solution(solution)
+        seen = set()
+        for d in validated_data:
+            question_id = d["question"]
+            if answer_key.question_type(question_id) is None:
+                raise NotFound(detail="Question with that id does not exist")
+            if question_id in seen:
+                raise SimpleValidationError(detail="Question {_id} already has an answer".format(_id=question_id))
+            seen.add(question_id)
+
+        for _M in self.models_mapper.values():
+            answered = _M.objects.filter(solution=solution, question_id__in=seen)\
+                .values_list("question_id", flat=True)[:1]
+            for question_id in answered:
+                raise SimpleValidationError(detail="Question {_id} already has an answer".format(_id=question_id))
+
+        answers = {_M:[] for _M in self.models_mapper.values()}
+        for d in validated_data:
+            question_id = d["question"]
+            question_type = answer_key.question_type(question_id)
+            _M = self.models_mapper[question_type]
+            if question_type==Question.MULTI_CHOICE_QUESTION_TYPE:
+                try:
+                    choice = int(d["answer"])
+                except Exception:
+                    raise SimpleValidationError(detail="Choice must be an integer")
+                if not answer_key.has_choice(question_id, choice):
+                    raise NotFound(detail="Choice does not exist")
+                answers[_M].append(_M(selected_choice_id=choice, solution=solution,
+                    question_id=question_id, created_by=user))
+            if question_type==Question.FREE_FORM_QUESTION_TYPE:
+                answers[_M].append(_M(solution=solution, question_id=question_id,
+                    answer=d["answer"], created_by=user))
+        return answers
+
+    def create_answers(self, solution:QuizSolution, validated_data, user):
+        '''
+        Bulk inserts the answers, must be called inside the grading transaction.
+        '''
+        answers = self.build_answers(solution, validated_data, user)
+        for _M, instances in answers.items():
+            try:
+                _M.objects.bulk_create(instances)
+            except Exception as e:
+                raise SimpleValidationError(detail="Unable to create answers"+str(e))
+        return answers
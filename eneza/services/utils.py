@@ -1,3 +1,5 @@
+import threading, time
+from collections import OrderedDict
 from string import Formatter
 from datetime import timedelta
 
@@ -46,4 +48,47 @@ def strfdelta(tdelta, fmt='{D:02}d {H:02}h {M:02}m {S:02}s', inputtype='timedelt
     for field in possible_fields:
         if field in desired_fields and field in constants:
             values[field], remainder = divmod(remainder, constants[field])
-    return f.format(fmt, **values)
\ No newline at end of file
+    return f.format(fmt, **values)
+
+class LRUCache:
+    '''
+    Thread safe, process local least recently used cache with an optional ttl in seconds.
+    '''
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
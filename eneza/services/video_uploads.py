@@ -0,0 +1,170 @@
+import fcntl, hashlib, os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from eneza.exceptions import ConflictException, PayloadTooLargeException, SimpleValidationError
+from eneza.models import Video, VideoUpload
+
+# bytes read from the request or the partial file at a time
+READ_SIZE = 64 * 1024
+PARTIAL_DIR = "video_uploads"
+
+
+def partial_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, PARTIAL_DIR, "{}.part".format(upload.pk))
+
+
+def parse_checksum(header):
+    '''
+    Returns the digest of an Upload-Checksum header, `sha256 <hex digest>`.
+    '''
+    algorithm, _, digest = header.strip().partition(" ")
+    digest = digest.strip().lower()
+    if algorithm.lower() != "sha256" or len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        raise SimpleValidationError(detail="Upload-Checksum must be 'sha256 <hex digest>'")
+    return digest
+
+
+def file_checksum(f):
+    digest = hashlib.sha256()
+    f.seek(0)
+    for data in iter(lambda: f.read(READ_SIZE), b""):
+        digest.update(data)
+    return digest.hexdigest()
+
+
+@contextmanager
+def locked_partial(upload, missing_ok=False):
+    '''
+    Opens the partial file of upload, only one request at a time may hold it.
+    Yields None for a missing file when missing_ok is set.
+    '''
+    try:
+        f = open(partial_path(upload), "r+b")
+    except FileNotFoundError:
+        if missing_ok:
+            yield None
+            return
+        raise ConflictException(detail="Upload is no longer available, start it again")
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ConflictException(detail="Another request is writing to this upload")
+        # closing the file releases the lock
+        yield f
+
+
+class VideoUploadService:
+    '''
+    Resumable chunked uploads streamed to disk.
+
+    Chunks are copied from the request to the partial file READ_SIZE bytes at a
+    time, so memory stays bounded whatever the chunk size. The offset only
+    moves once a whole chunk arrived and matched its checksum, a client that
+    lost its connection asks for the offset and resends from there.
+    '''
+
+    def start(self, user, filename, size, checksum=""):
+        if size > settings.MAX_VIDEO_UPLOAD_SIZE:
+            raise PayloadTooLargeException(detail="Videos are limited to {} bytes".format(settings.MAX_VIDEO_UPLOAD_SIZE))
+        upload = VideoUpload.objects.create(filename=os.path.basename(filename), size=size, checksum=checksum,
+            created_by=user)
+        os.makedirs(os.path.dirname(partial_path(upload)), exist_ok=True)
+        open(partial_path(upload), "wb").close()
+        return upload
+
+    def append(self, upload, offset, stream, length, checksum=None):
+        '''
+        Writes the length bytes read from stream at offset and returns the new offset.
+        '''
+        if upload.status != VideoUpload.UPLOADING:
+            raise ConflictException(detail="Upload is already complete")
+        if length > settings.VIDEO_UPLOAD_CHUNK_SIZE:
+            raise PayloadTooLargeException(
+                detail="Chunks are limited to {} bytes".format(settings.VIDEO_UPLOAD_CHUNK_SIZE))
+        if offset + length > upload.size:
+            raise PayloadTooLargeException(detail="Chunk ends past the size of the upload")
+        with locked_partial(upload) as f:
+            upload.refresh_from_db(fields=["offset"])
+            if offset != upload.offset:
+                raise ConflictException(detail="Upload is at offset {}".format(upload.offset))
+            # drops what a request that failed midway wrote past the offset
+            f.truncate(offset)
+            f.seek(offset)
+            digest = hashlib.sha256()
+            received = 0
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+                received += len(data)
+            if received != length or (checksum and digest.hexdigest() != checksum):
+                f.truncate(offset)
+                raise SimpleValidationError(detail="Chunk is incomplete" if received != length
+                    else "Chunk checksum does not match")
+            f.flush()
+            os.fsync(f.fileno())
+            upload.offset = offset + length
+            VideoUpload.objects.filter(pk=upload.pk).update(offset=upload.offset, updated_at=timezone.now())
+        return upload.offset
+
+    def complete(self, upload):
+        '''
+        Verifies the whole file and moves it to the Video storage, returns the Video.
+        Completing an upload twice returns the same Video.
+        '''
+        if upload.status == VideoUpload.COMPLETE:
+            return upload.video
+        try:
+            with locked_partial(upload) as f:
+                upload.refresh_from_db()
+                # a concurrent complete finished while this one waited for the file
+                if upload.status == VideoUpload.COMPLETE:
+                    return upload.video
+                if upload.offset != upload.size:
+                    raise ConflictException(detail="Upload is at offset {} of {}".format(upload.offset, upload.size))
+                if upload.checksum and file_checksum(f) != upload.checksum:
+                    f.truncate(0)
+                    VideoUpload.objects.filter(pk=upload.pk).update(offset=0, updated_at=timezone.now())
+                    raise SimpleValidationError(detail="File checksum does not match, upload it again")
+                field = Video._meta.get_field("video")
+                name = default_storage.get_available_name(field.generate_filename(None, upload.filename))
+                path = default_storage.path(name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with transaction.atomic():
+                    video = Video.objects.create(video=name, created_by=upload.created_by)
+                    upload.status = VideoUpload.COMPLETE
+                    upload.video = video
+                    upload.save(update_fields=["status", "video", "updated_at"])
+                    os.replace(partial_path(upload), path)
+        except ConflictException:
+            # the partial file is gone or locked once another request completed the upload
+            upload.refresh_from_db()
+            if upload.status == VideoUpload.COMPLETE:
+                return upload.video
+            raise
+        return video
+
+    def abort(self, upload):
+        '''
+        Deletes an unfinished upload with its partial file. Raises
+        ConflictException while another request holds the file or once the
+        upload is complete.
+        '''
+        with locked_partial(upload, missing_ok=True):
+            upload.refresh_from_db()
+            if upload.status == VideoUpload.COMPLETE:
+                raise ConflictException(detail="Upload is already complete")
+            with transaction.atomic():
+                upload.delete()
+                try:
+                    os.remove(partial_path(upload))
+                except FileNotFoundError:
+                    pass
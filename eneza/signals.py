@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from eneza.models import VideoTutorial, Quiz, Question, MultiChoiceQuestion, FreeFormQuestion, MultiChoiceQuestionChoice
+from eneza.services.quiz_versions import quiz_content_changed
+from eneza.services.content_versions import bump_content_version
+
+
+QUESTION_MODELS = (Question, MultiChoiceQuestion, FreeFormQuestion)
+CONTENT_MODELS = (VideoTutorial, Quiz) + QUESTION_MODELS + (MultiChoiceQuestionChoice,)
+
+
+def invalidate_question_quiz(sender, instance, **kwargs):
+    quiz_content_changed(instance.quiz_id)
+
+for model in QUESTION_MODELS:
+    post_save.connect(invalidate_question_quiz, sender=model, dispatch_uid="answer-key-%s-save" % model.__name__)
+    post_delete.connect(invalidate_question_quiz, sender=model, dispatch_uid="answer-key-%s-delete" % model.__name__)
+
+
+@receiver(post_save, sender=MultiChoiceQuestionChoice, dispatch_uid="answer-key-choice-save")
+@receiver(post_delete, sender=MultiChoiceQuestionChoice, dispatch_uid="answer-key-choice-delete")
+def invalidate_choice_quiz(sender, instance, **kwargs):
+    quiz_id = Question.items.filter(pk=instance.question_id).values_list("quiz_id", flat=True).first()
+    if quiz_id is not None:
+        quiz_content_changed(quiz_id)
+
+
+def invalidate_rendered_content(sender, instance, **kwargs):
+    # bumped again on commit so that a payload rendered from the old rows by a
+    # concurrent request before the commit is not kept under the new version
+    bump_content_version()
+    transaction.on_commit(bump_content_version)
+
+for model in CONTENT_MODELS:
+    post_save.connect(invalidate_rendered_content, sender=model, dispatch_uid="content-%s-save" % model.__name__)
+    post_delete.connect(invalidate_rendered_content, sender=model, dispatch_uid="content-%s-delete" % model.__name__)
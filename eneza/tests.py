@@ -1,3 +1,1217 @@
-from django.test import TestCase
+import asyncio, csv, datetime, hashlib, io, json, os, shutil, subprocess, sys, tempfile, threading
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+from django.db import connection
+from django.utils import timezone
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from eneza.authentication.models import User
+from eneza.models import VideoTutorial, Quiz, Question, MultiChoiceQuestion, FreeFormQuestion,\
+    MultiChoiceQuestionChoice, QuizSolution, SubmittedMultichoiceAnswer, SubmittedFreeformAnswer, OutboxEmail, VideoEmbed, Video, VideoUpload,\
+    QuizVersion, SolutionEvent, QuestionStats, ChoiceStats, LeaderboardEntry
+from eneza.asgi import ASGIHandler
+from eneza.checks import check_shared_cache
+from education.settings import cache_config
+from eneza.services.video_uploads import VideoUploadService, locked_partial, partial_path
+from eneza.services.embeds import EmbedWorker, parse_youtube_url
+from eneza.db.pool import ConnectionPool, PoolTimeout
+from eneza.db_routers import ReplicaRouter, ReplicaRoutingMiddleware, read_from_replica, reading_from_replica
+from eneza.instrumentation import registry
+from eneza.exceptions import ConflictException, SimpleValidationError
+from eneza.services import quiz_service
+from eneza.services.quiz_service import QuizService
+from eneza.views import QuizView
+from eneza.services.answer_keys import answer_keys
+from eneza.services.activity_log import EventBuffer, rollover
+from eneza.services.item_stats import ItemStatsService
+from eneza.services.leaderboard_service import LeaderboardService
+from eneza.services.mailer import Mailer
+from eneza.services.mailer.outbox import OutboxWorker
+from eneza.services.mailer import mail_template_render, sendgrid_mailer
+from eneza.services.mailer.mail_template_render import RenderJinjaMailTemplate
+from eneza.services.mailer.sendgrid_mailer import SendGridMailer, SendGridError
+
+
+def create_quiz(owner, questions=10):
+    '''
+    Creates a quiz alternating freeform and multichoice questions, choice position 1 is the answer.
+    '''
+    # ids are reused once a test rolls back, answer keys of quiz versions cached by
+    # an earlier test would be served for the new rows
+    cache.clear()
+    answer_keys.local.clear()
+    tutorial = VideoTutorial.objects.create(title="tutorial", video_link="https://youtube.com/embed/x",
+        embed_type=VideoTutorial.YOUTUBE_EMBED, created_by=owner)
+    quiz = Quiz.objects.create(video_tutorial=tutorial, created_by=owner)
+    for position in range(1, questions+1):
+        if position % 2:
+            FreeFormQuestion.objects.create(quiz=quiz, position=position, content="q", answer="Answer",
+                question_type=Question.FREE_FORM_QUESTION_TYPE, created_by=owner)
+        else:
+            question = MultiChoiceQuestion.objects.create(quiz=quiz, position=position, content="q",
+                question_type=Question.MULTI_CHOICE_QUESTION_TYPE, created_by=owner)
+            for choice_position in range(1, 4):
+                MultiChoiceQuestionChoice.objects.create(question=question, choice="c", position=choice_position,
+                    answer=choice_position == 1, created_by=owner)
+    return quiz
+
+
+def submit_answers(quiz, user, correct=True):
+    solution = QuizSolution.objects.create(quiz=quiz, user=user, created_by=user, start=timezone.now())
+    for question in FreeFormQuestion.objects.filter(quiz=quiz):
+        SubmittedFreeformAnswer.objects.create(solution=solution, question=question, created_by=user,
+            answer=" answer " if correct else "wrong")
+    for question in MultiChoiceQuestion.objects.filter(quiz=quiz):
+        choice = question.choices.get(position=1 if correct else 2)
+        SubmittedMultichoiceAnswer.objects.create(solution=solution, question=question, created_by=user,
+            selected_choice=choice)
+    return solution
+
+
+class QuizServiceTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.student = User.objects.create_user("student@example.com", "password")
+
+    def test_process_solution_scores_answers(self):
+        quiz = create_quiz(self.owner, questions=6)
+        solution = QuizService().process_solution(submit_answers(quiz, self.student))
+        self.assertTrue(solution.complete)
+        self.assertEqual(solution.total_points, 6)
+        self.assertEqual(SubmittedFreeformAnswer.objects.filter(solution=solution, is_valid=True).count(), 3)
+        self.assertEqual(SubmittedMultichoiceAnswer.objects.filter(solution=solution, is_valid=True).count(), 3)
+
+    def test_process_solution_wrong_answers(self):
+        quiz = create_quiz(self.owner, questions=6)
+        solution = QuizService().process_solution(submit_answers(quiz, self.student, correct=False))
+        self.assertEqual(solution.total_points, 0)
+
+    def test_process_solution_query_count_is_constant(self):
+        counts = []
+        for questions in (4, 50):
+            quiz = create_quiz(self.owner, questions=questions)
+            solution = submit_answers(quiz, self.student)
+            with CaptureQueriesContext(connection) as context:
+                QuizService().process_solution(solution)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class AnswerKeyCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+
+    def test_answer_key_is_cached_until_content_changes(self):
+        quiz = create_quiz(self.owner, questions=2)
+        answer_key = answer_keys.get(quiz.id)
+        with self.assertNumQueries(0):
+            self.assertIs(answer_keys.get(quiz.id), answer_key)
+        choice = MultiChoiceQuestionChoice.objects.get(question__quiz=quiz, position=2)
+        choice.answer = True
+        choice.save()
+        answer_key = answer_keys.get(quiz.id)
+        self.assertTrue(answer_key.is_correct_choice(choice.question_id, choice.id))
+
+
+class SubmitQuizTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.student = User.objects.create_user("student@example.com", "password")
+        self.quiz = create_quiz(self.owner, questions=4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def answers(self):
+        data = []
+        for question in Question.objects.filter(quiz=self.quiz):
+            if question.question_type == Question.FREE_FORM_QUESTION_TYPE:
+                data.append({"question":question.id, "answer":"answer"})
+            else:
+                choice = MultiChoiceQuestionChoice.objects.get(question_id=question.id, position=1)
+                data.append({"question":question.id, "answer":choice.id})
+        return data
+
+    def test_submit_quiz(self):
+        self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id))
+        response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id), self.answers(), format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["total_points"], 4)
+        self.assertTrue(response.data["complete"])
+        self.assertEqual(OutboxEmail.objects.filter(solution__user=self.student, status=OutboxEmail.PENDING).count(), 1)
+
+    def test_submit_quiz_duplicate_question(self):
+        self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id))
+        answers = self.answers()
+        response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id),
+            answers + answers[:1], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(QuizSolution.objects.get(quiz=self.quiz, user=self.student).complete)
+        self.assertFalse(SubmittedFreeformAnswer.objects.exists())
+
+    def test_submit_quiz_query_count_is_constant(self):
+        counts = []
+        for questions in (4, 40):
+            quiz = create_quiz(self.owner, questions=questions)
+            self.quiz = quiz
+            self.client.get("/api/v1/quiz/{}/start_quiz/".format(quiz.id))
+            answers = self.answers()
+            answer_keys.get(quiz.id)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(quiz.id), answers, format="json")
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.data["total_points"], questions)
+            counts.append(len(context.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_submit_quiz_invalid_answer_errors(self):
+        answers = self.answers()
+        del answers[1]["answer"]
+        self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id))
+        response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id), answers, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data), ["answer"])
+
+    def test_submit_quiz_unknown_question(self):
+        self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id))
+        response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id),
+            [{"question":0, "answer":"answer"}], format="json")
+        self.assertEqual(response.status_code, 404)
+
+    def test_submit_quiz_unknown_choice(self):
+        self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id))
+        question = MultiChoiceQuestion.objects.filter(quiz=self.quiz).first()
+        response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id),
+            [{"question":question.id, "answer":0}], format="json")
+        self.assertEqual(response.status_code, 404)
+
+
+class QuestionRenderingTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.student = User.objects.create_user("student@example.com", "password")
+        self.quiz = create_quiz(self.owner, questions=100)
+        submit_answers(self.quiz, self.student)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_quiz_questions_query_count(self):
+        # solution lookup, quiz lookup, questions, choices and one query per submitted answer model
+        with self.assertNumQueries(6):
+            response = self.client.get("/api/v1/quiz/{}/quiz_questions/".format(self.quiz.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 100)
+        self.assertEqual(response.data[0]["user_answer"]["answer"], " answer ")
+        self.assertIsNone(response.data[0]["answer"])
+        self.assertEqual(len(response.data[1]["choices"]), 3)
+        self.assertIsNotNone(response.data[1]["user_answer"])
+
+    def test_question_list_query_count(self):
+        # quiz filter lookup, questions and choices
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/v1/questions/", {"quiz":self.quiz.id, "page_size":100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 100)
+
+
+class RenderedContentCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.students = [User.objects.create_user("student%s@example.com" % i, "password") for i in range(2)]
+        self.quiz = create_quiz(self.owner, questions=4)
+        self.url = "/api/v1/quiz/{}/quiz_questions/".format(self.quiz.id)
+        for student in self.students:
+            submit_answers(self.quiz, student)
+        self.client = APIClient()
+
+    def get(self, user, **extra):
+        self.client.force_authenticate(user)
+        return self.client.get(self.url, **extra)
+
+    def test_questions_are_rendered_once_for_all_students(self):
+        self.get(self.students[0])
+        # solution lookup, quiz lookup and one query per submitted answer model
+        self.client.force_authenticate(self.students[1])
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data[0]["user_answer"]["solution"],
+            QuizSolution.objects.get(user=self.students[1]).id)
+
+    def test_private_fields_are_only_merged_for_the_creator(self):
+        self.assertIsNone(self.get(self.students[0]).data[0]["answer"])
+        self.assertEqual(self.get(self.owner).data[0]["answer"], "Answer")
+        choices = self.get(self.students[1]).data[1]["choices"]
+        self.assertEqual([c["answer"] for c in choices], [None, None, None])
+
+    def test_etag_and_invalidation(self):
+        response = self.get(self.students[0])
+        etag = response["ETag"]
+        self.assertEqual(self.get(self.students[0], HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.get(self.students[1])["ETag"], etag)
+        question = FreeFormQuestion.objects.get(quiz=self.quiz, position=1)
+        question.content = "changed"
+        question.save()
+        response = self.get(self.students[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["content"], "changed")
+
+    def test_position_selects_one_question(self):
+        self.assertEqual(self.get(self.owner, data={"position": 2}).data["position"], 2)
+        # positions start at 1, position 0 is a missing question and not the whole list
+        self.assertEqual(self.get(self.owner, data={"position": 0}).status_code, 404)
+
+
+class FakeSendGridMailer:
+    '''
+    Local stand in for SendGridMailer, fails the first `failures` sends.
+    '''
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    def send(self, from_email, to_emails, subject, message, message_type="html"):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("sendgrid unavailable")
+        self.sent.append((from_email, to_emails, subject, message))
+
+
+class OutboxWorkerTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.student = User.objects.create_user("student@example.com", "password", first_name="Student")
+        self.quiz = create_quiz(self.owner, questions=2)
+        self.solution = QuizService().process_solution(submit_answers(self.quiz, self.student))
+        QuizService().queue_quiz_results_email(self.solution)
+
+    def test_worker_sends_results_email(self):
+        transport = FakeSendGridMailer()
+        OutboxWorker(mailer=Mailer(transport=transport), workers=2).run(once=True)
+        self.assertEqual(len(transport.sent), 1)
+        self.assertEqual(transport.sent[0][1], ["student@example.com"])
+        self.assertIn("Hi Student", transport.sent[0][3])
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+        self.assertTrue(QuizSolution.objects.get(id=self.solution.id).sent_notification)
+
+    def test_worker_retries_with_backoff(self):
+        transport = FakeSendGridMailer(failures=2)
+        worker = OutboxWorker(mailer=Mailer(transport=transport), workers=1, max_attempts=2, backoff=60)
+        worker.run(once=True)
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        OutboxWorker(mailer=Mailer(transport=transport), workers=1, max_attempts=2).run(once=True)
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.FAILED, 2))
+        self.assertFalse(transport.sent)
+        self.assertFalse(QuizSolution.objects.get(id=self.solution.id).sent_notification)
+
+
+class StubResponse:
+
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+
+class StubSession:
+    '''
+    Stands in for the pooled requests session, answers every post with the queued statuses.
+    '''
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posts = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.posts.append(json)
+        return StubResponse(self.statuses.pop(0) if self.statuses else 202, "error")
+
+
+class SendGridMailerTestCase(SimpleTestCase):
+
+    def mailer(self, session):
+        with patch.object(sendgrid_mailer, "_session", session):
+            return SendGridMailer(api_key="key", api_host="https://sendgrid.test")
+
+    def test_batch_splits_personalizations(self):
+        session = StubSession()
+        recipients = [("student{}@example.com".format(i), {"-first_name-":"Student {}".format(i)})
+            for i in range(2500)]
+        timings = self.mailer(session).send_batch("a@b.c", recipients, "Results", "Hi -first_name-")
+        self.assertEqual([timing["recipients"] for timing in timings], [1000, 1000, 500])
+        self.assertEqual([len(mail["personalizations"]) for mail in session.posts], [1000, 1000, 500])
+        sent = {p["to"][0]["email"]:p["substitutions"] for mail in session.posts for p in mail["personalizations"]}
+        self.assertEqual(len(sent), 2500)
+        self.assertEqual(sent["student2499@example.com"], {"-first_name-":"Student 2499"})
+
+    def test_error_responses_raise(self):
+        mailer = self.mailer(StubSession(400, 503))
+        for _ in range(2):
+            with self.assertRaises(SendGridError):
+                mailer.send_batch("a@b.c", [("student@example.com", None)], "Results", "Hi")
+
+    def test_session_is_reused(self):
+        session = StubSession()
+        mailer = self.mailer(session)
+        mailer.send("a@b.c", ["one@example.com"], "Results", "Hi")
+        mailer.send_batch("a@b.c", [("two@example.com", None)], "Results", "Hi")
+        self.assertEqual(len(session.posts), 2)
+        self.assertIs(self.mailer(session).session, mailer.session)
+        with patch.object(sendgrid_mailer, "_session", None):
+            self.assertIs(sendgrid_mailer.get_session(), sendgrid_mailer.get_session())
+
+
+class MailTemplateRenderTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(TEMPLATES=[{"BACKEND":"django.template.backends.django.DjangoTemplates",
+            "DIRS":[self.directory]}])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        RenderJinjaMailTemplate.templates.clear()
+        self.addCleanup(RenderJinjaMailTemplate.templates.clear)
+        self.renderer = RenderJinjaMailTemplate()
+
+    def write(self, name, content, mtime):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as template:
+            template.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def test_recompiles_only_when_mtime_changes(self):
+        self.write("results.html", "<p>Hi {{ name }}</p>", 1000)
+        with patch.object(mail_template_render, "get_template", wraps=mail_template_render.get_template) as compile:
+            for _ in range(3):
+                self.assertEqual(self.renderer.parse_mail_html_mail_template("results.html", {"name":"Ann"}),
+                    "<p>Hi Ann</p>")
+            self.assertEqual(compile.call_count, 1)
+            self.write("results.html", "<p>Hello {{ name }}</p>", 2000)
+            self.assertEqual(self.renderer.parse_mail_html_mail_template("results.html", {"name":"Ann"}),
+                "<p>Hello Ann</p>")
+            self.assertEqual(compile.call_count, 2)
+
+    def test_render_many_matches_single_renders(self):
+        self.write("results.html", "<p>Hi {{ name }}, you scored {{ points }}</p>", 1000)
+        contexts = [{"name":"Student {}".format(i), "points":i} for i in range(5)]
+        self.assertEqual(self.renderer.render_many("results.html", contexts),
+            [self.renderer.parse_mail_html_mail_template("results.html", context) for context in contexts])
+
+    def test_text_template_is_rendered(self):
+        # the text variant used to render an undefined variable instead of the template
+        self.write("results.txt", "Hi {{ name }}", 1000)
+        self.assertEqual(self.renderer.parse_mail_text_mail_template("results.txt", {"name":"Ann"}), "Hi Ann")
+
+
+class LeaderboardTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.quiz = create_quiz(self.owner, questions=4)
+        self.students = []
+        for i, correct in enumerate([False, True, True]):
+            student = User.objects.create_user("student{}@example.com".format(i), "password")
+            QuizService().process_solution(submit_answers(self.quiz, student, correct=correct))
+            self.students.append(student)
+        self.client = APIClient()
+        self.client.force_authenticate(self.students[0])
+
+    def test_leaderboard(self):
+        response = self.client.get("/api/v1/quiz/{}/leaderboard/".format(self.quiz.id), {"limit":2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual([e["user"] for e in response.data["results"]], [self.students[1].id, self.students[2].id])
+        self.assertEqual(response.data["my_rank"]["rank"], 3)
+        self.assertEqual(response.data["my_rank"]["total_points"], 0)
+
+    def test_results_need_the_creator_or_a_solution(self):
+        outsider = User.objects.create_user("outsider@example.com", "password")
+        self.client.force_authenticate(outsider)
+        for action in ("leaderboard", "score_distribution"):
+            url = "/api/v1/quiz/{}/{}/".format(self.quiz.id, action)
+            self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(self.owner)
+        for action in ("leaderboard", "score_distribution"):
+            url = "/api/v1/quiz/{}/{}/".format(self.quiz.id, action)
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_rank_reads_the_primary(self):
+        routed = []
+
+        def record_routing(execute, sql, params, many, context):
+            routed.append(reading_from_replica())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_routing), read_from_replica():
+            LeaderboardService().rank(self.quiz.id, self.students[0])
+        self.assertTrue(routed)
+        self.assertFalse(any(routed))
+
+    def test_rank_counts_buckets_and_ties(self):
+        service = LeaderboardService()
+        ordered = list(LeaderboardEntry.objects.filter(quiz=self.quiz).order_by(*service.ORDERING)
+            .values_list("user_id", flat=True))
+        for student in self.students:
+            self.assertEqual(service.rank(self.quiz.id, student)["rank"], ordered.index(student.id) + 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(service.rank(self.quiz.id, self.students[0])["rank"], 3)
+        self.assertIsNone(service.rank(self.quiz.id, self.owner))
+
+    def test_score_distribution(self):
+        response = self.client.get("/api/v1/quiz/{}/score_distribution/".format(self.quiz.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["buckets"], [{"points":0, "count":1}, {"points":4, "count":2}])
+
+
+class PaginationTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        for i in range(5):
+            VideoTutorial.objects.create(title="tutorial {}".format(i), video_link="https://youtube.com/embed/x",
+                embed_type=VideoTutorial.YOUTUBE_EMBED, created_by=self.owner)
+        VideoTutorial.objects.update(updated_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_cursor_pagination_walks_all_rows(self):
+        titles = []
+        response = self.client.get("/api/v1/video_tutorials/", {"page_size":2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            titles += [t["title"] for t in response.data["results"]]
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+        self.assertEqual(titles, ["tutorial {}".format(i) for i in reversed(range(5))])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/v1/video_tutorials/", {"cursor":"invalid"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_sparse_fieldset(self):
+        response = self.client.get("/api/v1/video_tutorials/", {"fields":"id,title"})
+        self.assertEqual(set(response.data["results"][0].keys()), {"id", "title"})
+
+
+class InstrumentationTestCase(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.quiz = create_quiz(self.owner, questions=4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_sampled_request_is_tagged_and_timed(self):
+        response = self.client.get("/api/v1/quiz/%s/quiz_questions/" % self.quiz.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('db;dur=', response["Server-Timing"])
+        self.assertIn('serializer;dur=', response["Server-Timing"])
+        metrics = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").content.decode()
+        self.assertIn('eneza_requests_total{view="QuizView.quiz_questions",status="200"} 1', metrics)
+        self.assertIn('eneza_db_queries_total{view="QuizView.quiz_questions"}', metrics)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_measured(self):
+        response = self.client.get("/api/v1/quiz/%s/quiz_questions/" % self.quiz.id)
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.assertNotIn("QuizView.quiz_questions", registry.render())
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+    def test_metrics_without_token_are_denied(self):
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_non_ascii_header(self):
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s\u00e9cret").status_code, 403)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"], REPLICA_MAX_LAG=None)
+class ReplicaRoutingTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Quiz), "default")
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(Quiz), "replica")
+            self.assertEqual(router.db_for_read(User), "default")
+            self.assertEqual(router.db_for_write(Quiz), "default")
+
+    def route(self, method, action, token):
+        view = QuizView.as_view({method:action})
+        routed = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {"pk":1})
+            routed.append(reading_from_replica())
+            return None
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        middleware(getattr(self.factory, method)("/", HTTP_AUTHORIZATION="Token " + token))
+        self.assertFalse(reading_from_replica())
+        return "replica" if routed[0] else "default"
+
+    def test_middleware_keeps_writers_on_the_primary(self):
+        self.assertEqual(self.route("get", "quiz_questions", "a"), "replica")
+        self.assertEqual(self.route("get", "start_quiz", "a"), "default")
+        # read your writes
+        self.assertEqual(self.route("get", "quiz_questions", "a"), "default")
+        self.assertEqual(self.route("get", "quiz_questions", "b"), "replica")
+        self.assertEqual(self.route("post", "submit_quiz", "b"), "default")
+        self.assertEqual(self.route("get", "quiz_solution", "b"), "default")
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+
+    def pool(self, **kwargs):
+        opened = []
+
+        def connect():
+            opened.append(FakeConnection())
+            return opened[-1]
+        return ConnectionPool(connect, **kwargs), opened
+
+    def test_reuses_released_connections(self):
+        pool, opened = self.pool(max_size=2)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        pool.acquire()
+        self.assertEqual(len(opened), 2)
+        self.assertEqual(pool.in_use, 2)
+        self.assertEqual(pool.stats["acquired"], 3)
+
+    def test_waits_then_times_out(self):
+        pool, opened = self.pool(max_size=1, timeout=0.01)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.stats["timeouts"], 1)
+        self.assertEqual(len(opened), 1)
+
+    def test_drops_broken_connections(self):
+        pool, opened = self.pool(max_size=1, reset=lambda connection: False)
+        pool.release(pool.acquire())
+        self.assertTrue(opened[0].closed)
+        self.assertIsNot(pool.acquire(), opened[0])
+
+        pool, opened = self.pool(max_size=1, is_usable=lambda connection: False, health_check_interval=-1)
+        pool.release(pool.acquire())
+        pool.acquire()
+        self.assertEqual(len(opened), 2)
+        self.assertEqual(pool.stats["health_closed"], 1)
+
+
+class ASGIHandlerTestCase(SimpleTestCase):
+
+    def call(self, application, messages, **scope):
+        scope = dict({"type":"http", "method":"GET", "path":"/", "query_string":b"", "headers":[]}, **scope)
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        handler = ASGIHandler(application, max_threads=2)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(handler(scope, receive, send))
+        finally:
+            loop.close()
+            handler.executor.shutdown()
+        return sent
+
+    def test_streams_the_wsgi_response(self):
+        def application(environ, start_response):
+            start_response("201 Created", [("Content-Type", "text/plain")])
+            return [environ["PATH_INFO"].encode("latin-1"), b"?", environ["QUERY_STRING"].encode(),
+                b" ", environ["HTTP_X_TAG"].encode(), b" ", environ["wsgi.input"].read()]
+
+        sent = self.call(application, [{"type":"http.request", "body":b"ab", "more_body":True},
+            {"type":"http.request", "body":b"c"}], method="POST", path="/caf\u00e9", query_string=b"a=1",
+            headers=[(b"x-tag", b"1"), (b"x-tag", b"2")])
+        self.assertEqual(sent[0], {"type":"http.response.start", "status":201, "headers":[(b"content-type", b"text/plain")]})
+        self.assertEqual(b"".join(message["body"] for message in sent[1:]), "/caf\u00e9?a=1 1,2 abc".encode())
+        self.assertFalse(sent[-1].get("more_body"))
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_runs_django(self):
+        sent = self.call(get_wsgi_application(), [{"type":"http.request"}], path="/metrics",
+            headers=[(b"authorization", b"Bearer secret")])
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertIn(b"eneza_instrumentation_sample_rate", b"".join(message.get("body", b"") for message in sent))
+
+    def test_client_disconnects_before_the_body(self):
+        def application(environ, start_response):
+            raise AssertionError("the view must not run")
+
+        self.assertEqual(self.call(application, [{"type":"http.disconnect"}], method="POST"), [])
+
+
+class StubOEmbedHandler(BaseHTTPRequestHandler):
+    '''
+    Local stand in for the oEmbed API, urls containing "missing" are unknown.
+    '''
+
+    def do_GET(self):
+        url = parse_qs(urlparse(self.path).query)["url"][0]
+        if "missing" in url:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps({"html":'<iframe width="200" src="https://www.youtube.com/embed/dQw4w9WgXcQ?feature=oembed"></iframe>'})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EmbedResolverTestCase(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), StubOEmbedHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parses_known_url_shapes_offline(self):
+        embed = "https://youtube.com/embed/dQw4w9WgXcQ"
+        shapes = {
+            "https://www.youtube.com/watch?v=dQw4w9WgXcQ": embed,
+            "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=1m30s": embed + "?start=90",
+            "https://youtu.be/dQw4w9WgXcQ?t=42": embed + "?start=42",
+            "https://youtube.com/shorts/dQw4w9WgXcQ": embed,
+            "https://youtube.com/embed/dQw4w9WgXcQ": embed,
+            "https://m.youtube.com/watch?v=dQw4w9WgXcQ&list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG": embed +
+                "?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",
+            "https://www.youtube.com/playlist?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG":
+                "https://youtube.com/embed/videoseries?list=PLx0sYbCqOb8TBPRdmBHs5Iftvv9TPboYG",
+            "https://www.youtube.com/attribution_link?u=%2Fwatch%3Fv%3DdQw4w9WgXcQ": None,
+            "https://www.youtube.com/watch?v=short": None,
+        }
+        for url, expected in shapes.items():
+            self.assertEqual(parse_youtube_url(url), expected, url)
+
+    def create_tutorial(self, url):
+        return self.client.post("/api/v1/video_tutorials/", {"title":"tutorial", "video_link":url,
+            "embed_type":VideoTutorial.YOUTUBE_EMBED}, format="json")
+
+    def resolve_queued(self):
+        with override_settings(YOUTUBE_OEMBED_URL="http://127.0.0.1:{}/oembed".format(self.server.server_port)):
+            EmbedWorker(workers=2, timeout=1).run(once=True)
+
+    def test_unknown_shapes_are_resolved_in_the_background(self):
+        url = "https://www.youtube.com/attribution_link?u=%2Fwatch%3Fv%3DdQw4w9WgXcQ"
+        response = self.create_tutorial(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["video_link"], url)
+        self.assertEqual(VideoEmbed.objects.get().status, VideoEmbed.PENDING)
+        self.resolve_queued()
+        tutorial = VideoTutorial.objects.get(pk=response.data["id"])
+        self.assertEqual(tutorial.video_link, "https://youtube.com/embed/dQw4w9WgXcQ")
+        # the resolved link is served from the cache table from now on
+        self.assertEqual(self.create_tutorial(url).data["video_link"], "https://youtube.com/embed/dQw4w9WgXcQ")
+
+    def test_unknown_videos_and_other_hosts_are_rejected(self):
+        url = "https://www.youtube.com/attribution_link?u=missing"
+        self.assertEqual(self.create_tutorial(url).status_code, 201)
+        self.resolve_queued()
+        self.assertEqual(VideoEmbed.objects.get().status, VideoEmbed.FAILED)
+        self.assertEqual(self.create_tutorial(url).status_code, 400)
+        self.assertEqual(self.create_tutorial("https://notyoutube.com/watch?v=dQw4w9WgXcQ").status_code, 400)
+
+
+class VideoUploadTestCase(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings = override_settings(MEDIA_ROOT=self.media_root, VIDEO_UPLOAD_CHUNK_SIZE=4)
+        self.settings.enable()
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.content = b"0123456789"
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def start(self, **data):
+        data = dict({"filename":"lesson.mp4", "size":len(self.content),
+            "checksum":hashlib.sha256(self.content).hexdigest()}, **data)
+        return self.client.post("/api/v1/video_uploads/", data, format="json")
+
+    def send(self, upload_id, offset, chunk, checksum=None):
+        headers = {"HTTP_UPLOAD_OFFSET":str(offset)}
+        if checksum is not None:
+            headers["HTTP_UPLOAD_CHECKSUM"] = "sha256 " + checksum
+        return self.client.patch("/api/v1/video_uploads/{}/chunk/".format(upload_id), chunk,
+            content_type="application/offset+octet-stream", **headers)
+
+    def test_resumes_after_failed_chunks(self):
+        upload_id = self.start().data["id"]
+        self.assertEqual(self.send(upload_id, 0, b"0123", hashlib.sha256(b"0123").hexdigest())["Upload-Offset"], "4")
+        self.assertEqual(self.send(upload_id, 0, b"0123").status_code, 409)
+        self.assertEqual(self.send(upload_id, 4, b"4567", hashlib.sha256(b"corrupt").hexdigest()).status_code, 400)
+        # a connection that dropped midway
+        with self.assertRaises(SimpleValidationError):
+            VideoUploadService().append(VideoUpload.objects.get(), 4, io.BytesIO(b"45"), 4)
+        self.assertEqual(self.client.get("/api/v1/video_uploads/{}/".format(upload_id)).data["offset"], 4)
+        self.assertEqual(self.client.post("/api/v1/video_uploads/{}/complete/".format(upload_id)).status_code, 409)
+
+        self.send(upload_id, 4, b"4567")
+        self.send(upload_id, 8, b"89")
+        response = self.client.post("/api/v1/video_uploads/{}/complete/".format(upload_id))
+        self.assertEqual(response.data["status"], VideoUpload.COMPLETE)
+        video = Video.objects.get(pk=response.data["video"])
+        with video.video.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "video_uploads")), [])
+
+    def test_concurrent_complete_returns_the_video(self):
+        upload_id = self.start().data["id"]
+        self.send(upload_id, 0, b"0123")
+        self.send(upload_id, 4, b"4567")
+        self.send(upload_id, 8, b"89")
+        # both requests read the upload before either completed it
+        first, second = VideoUpload.objects.get(), VideoUpload.objects.get()
+        video = VideoUploadService().complete(first)
+        self.assertEqual(VideoUploadService().complete(second), video)
+
+    def test_purge_skips_locked_uploads(self):
+        upload_id = self.start().data["id"]
+        upload = VideoUpload.objects.get(pk=upload_id)
+        VideoUpload.objects.update(updated_at=timezone.now() - datetime.timedelta(days=2))
+        with locked_partial(upload):
+            call_command("purge_video_uploads", stdout=io.StringIO())
+            self.assertTrue(VideoUpload.objects.filter(pk=upload_id).exists())
+            with self.assertRaises(ConflictException):
+                VideoUploadService().abort(upload)
+        call_command("purge_video_uploads", stdout=io.StringIO())
+        self.assertFalse(VideoUpload.objects.filter(pk=upload_id).exists())
+        self.assertFalse(os.path.exists(partial_path(upload)))
+
+    def test_limits(self):
+        with override_settings(MAX_VIDEO_UPLOAD_SIZE=5):
+            self.assertEqual(self.start().status_code, 413)
+        self.assertEqual(self.start(filename="lesson.exe").status_code, 400)
+        upload_id = self.start().data["id"]
+        self.assertEqual(self.send(upload_id, 0, b"01234").status_code, 413)
+        self.send(upload_id, 0, b"0123")
+        self.assertEqual(self.send(upload_id, 4, b"45678901").status_code, 413)
+
+
+class GradebookExportTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.students = [User.objects.create_user("student%s@example.com" % i, "password") for i in range(3)]
+        self.quiz = create_quiz(self.owner, questions=4)
+        submit_answers(self.quiz, self.students[0])
+        submit_answers(self.quiz, self.students[1], correct=False)
+        # started but nothing answered yet
+        QuizSolution.objects.create(quiz=self.quiz, user=self.students[2], created_by=self.students[2],
+            start=timezone.now())
+        # answers of another quiz must not leak into the merge
+        submit_answers(create_quiz(self.owner, questions=2), self.students[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = "/api/v1/quiz/{}/export/".format(self.quiz.id)
+
+    def test_csv(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][-2:], ["q4_answer", "q4_correct"])
+        self.assertEqual([row[2] for row in rows[1:]], ["student0@example.com", "student1@example.com",
+            "student2@example.com"])
+        self.assertEqual(rows[1][9:11], [" answer ", "False"])
+        self.assertEqual(rows[2][11], "c")
+        self.assertEqual(rows[3][9:], [""] * 8)
+
+    def test_ndjson(self):
+        response = self.client.get(self.url, {"export_format":"ndjson"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual([answer["position"] for answer in lines[0]["answers"]], [1, 2, 3, 4])
+        self.assertEqual(lines[1]["answers"][0]["answer"], "wrong")
+        self.assertIsNone(lines[2]["answers"][0]["answer"])
+
+    def test_only_the_creator_can_export(self):
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class QuestionImportTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.quiz = create_quiz(self.owner, questions=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = "/api/v1/quiz/{}/import_questions/".format(self.quiz.id)
+
+    def test_json(self):
+        questions = [
+            {"question_type":Question.FREE_FORM_QUESTION_TYPE, "position":3, "content":"q3", "answer":"Answer"},
+            {"question_type":Question.MULTI_CHOICE_QUESTION_TYPE, "position":4, "content":"q4", "points":2,
+                "choices":[{"choice":"a", "answer":True}, {"choice":"b"}]},
+        ]
+        self.assertEqual(len(answer_keys.get(self.quiz.id).questions), 2)
+        response = self.client.post(self.url, {"questions":questions}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["count"], 2)
+        self.assertEqual(FreeFormQuestion.objects.get(quiz=self.quiz, position=3).answer, "Answer")
+        question = MultiChoiceQuestion.objects.get(quiz=self.quiz, position=4)
+        self.assertEqual(response.data["questions"][4], question.id)
+        self.assertEqual(question.points, 2)
+        self.assertEqual(list(question.choices.order_by("position").values_list("choice", "position", "answer")),
+            [("a", 1, True), ("b", 2, False)])
+        # the answer key compiled before the import is replaced
+        self.assertEqual(len(answer_keys.get(self.quiz.id).questions), 4)
+
+    def test_csv(self):
+        body = ("position,question_type,content,points,answer,choice,choice_answer\n"
+            "3,FREE_FORM_QUESTION_TYPE,q3,,Answer,,\n"
+            "4,MULTI_CHOICE_QUESTION_TYPE,q4,1,,a,true\n"
+            "4,,,,,b,\n")
+        response = self.client.post(self.url, body, content_type="text/csv")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(MultiChoiceQuestion.objects.get(quiz=self.quiz, position=4).choices.count(), 2)
+
+    def test_child_rows_match_parent_rows(self):
+        types = (Question.MULTI_CHOICE_QUESTION_TYPE, Question.FREE_FORM_QUESTION_TYPE)
+        questions = [{"question_type":types[p % 2], "position":p, "content":"q{}".format(p), "answer":"a", "choices":[{"choice":"a", "answer":True}]}
+            for p in range(3, 13)]
+        response = self.client.post(self.url, questions, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        created = {question_type:set(ids) for question_type, ids in (
+            (Question.FREE_FORM_QUESTION_TYPE, FreeFormQuestion.objects.filter(quiz=self.quiz, position__gte=3)
+                .values_list("question_ptr_id", flat=True)),
+            (Question.MULTI_CHOICE_QUESTION_TYPE, MultiChoiceQuestion.objects.filter(quiz=self.quiz, position__gte=3)
+                .values_list("question_ptr_id", flat=True)))}
+        parents = Question.objects.filter(quiz=self.quiz, position__gte=3).values_list("id", "question_type")
+        self.assertEqual(len(parents), 10)
+        for question_id, question_type in parents:
+            self.assertIn(question_id, created[question_type])
+        self.assertEqual(sum(len(ids) for ids in created.values()), 10)
+        self.assertEqual(set(response.data["questions"].values()), {question_id for question_id, _ in parents})
+
+    def test_positions_must_be_unique(self):
+        question = {"question_type":Question.FREE_FORM_QUESTION_TYPE, "content":"q", "answer":"a"}
+        for positions in ([2], [3, 3]):
+            response = self.client.post(self.url, [dict(question, position=p) for p in positions], format="json")
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Question.objects.filter(quiz=self.quiz).count(), 2)
+
+    def test_only_the_creator_can_import(self):
+        self.client.force_authenticate(User.objects.create_user("student@example.com", "password"))
+        response = self.client.post(self.url, [{"question_type":Question.FREE_FORM_QUESTION_TYPE, "position":3,
+            "content":"q", "answer":"a"}], format="json")
+        self.assertEqual(response.status_code, 401)
+
+
+class QuizVersionTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.students = [User.objects.create_user("student%s@example.com" % i, "password") for i in range(3)]
+        self.quiz = create_quiz(self.owner, questions=4)
+        self.client = APIClient()
+
+    def start(self, student):
+        self.client.force_authenticate(student)
+        return self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id)).data["version"]
+
+    def test_versions_are_copy_on_write(self):
+        first = self.start(self.students[0])
+        self.assertEqual(self.start(self.students[1]), first)
+        FreeFormQuestion.objects.get(quiz=self.quiz, position=1).save()
+        self.assertNotEqual(self.start(self.students[2]), first)
+        self.assertEqual(QuizVersion.objects.filter(quiz=self.quiz).count(), 2)
+
+    def test_solutions_are_graded_against_their_version(self):
+        self.start(self.students[0])
+        question = FreeFormQuestion.objects.get(quiz=self.quiz, position=1)
+        question.answer = "changed"
+        question.save()
+        self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id),
+            [{"question":question.id, "answer":"answer"}], format="json")
+        self.assertEqual(QuizSolution.objects.get(user=self.students[0]).total_points, 1)
+        self.start(self.students[1])
+        self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id),
+            [{"question":question.id, "answer":"changed"}], format="json")
+        self.assertEqual(QuizSolution.objects.get(user=self.students[1]).total_points, 1)
+
+    def test_open_solution_renders_its_version(self):
+        self.start(self.students[0])
+        url = "/api/v1/quiz/{}/quiz_questions/".format(self.quiz.id)
+        before = self.client.get(url).data
+        question = FreeFormQuestion.objects.get(quiz=self.quiz, position=1)
+        question.content = "edited"
+        question.save()
+        FreeFormQuestion.objects.get(quiz=self.quiz, position=3).delete()
+        MultiChoiceQuestion.objects.get(quiz=self.quiz, position=4).choices.get(position=1).delete()
+
+        def content(questions):
+            return [(q["id"], q["position"], q["content"], [(c["id"], c["choice"]) for c in q.get("choices", [])])
+                for q in questions]
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content(response.data), content(before))
+        self.assertEqual(self.client.get(url, {"position":3}).data["id"], before[2]["id"])
+        answers = [{"question":q["id"], "answer":"answer" if q["question_type"] == Question.FREE_FORM_QUESTION_TYPE
+            else [c["id"] for c in q["choices"] if c["position"] == 1][0]} for q in response.data]
+        response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id), answers, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["total_points"], 4)
+
+        # the submitted solution and a solution started after the edit see the live questions
+        self.assertEqual(self.client.get(url).data[0]["content"], "edited")
+        self.start(self.students[1])
+        self.assertEqual([q["content"] for q in self.client.get(url).data][0], "edited")
+        self.assertEqual(len(self.client.get(url).data), 3)
+
+    def test_clone(self):
+        question = MultiChoiceQuestion.objects.get(quiz=self.quiz, position=4)
+        question.choices.get(position=3).delete()
+        FreeFormQuestion.objects.get(quiz=self.quiz, position=3).delete()
+        tutorial = VideoTutorial.objects.create(title="copy", video_link="https://youtube.com/embed/x",
+            embed_type=VideoTutorial.YOUTUBE_EMBED, created_by=self.owner)
+        self.client.force_authenticate(self.owner)
+        url = "/api/v1/quiz/{}/clone/".format(self.quiz.id)
+        # lookups, the quiz insert, one INSERT ... SELECT per table and the revision update
+        with self.assertNumQueries(13):
+            response = self.client.post(url, {"video_tutorial":tutorial.id}, format="json")
+        self.assertEqual(response.status_code, 201)
+        clone = Quiz.objects.get(pk=response.data["id"])
+        self.assertEqual(clone.video_tutorial, tutorial)
+        self.assertEqual(list(FreeFormQuestion.objects.filter(quiz=clone).values_list("position", "answer")),
+            [(1, "Answer")])
+        copy = MultiChoiceQuestion.objects.get(quiz=clone, position=4)
+        self.assertEqual(list(copy.choices.order_by("position").values_list("position", "answer")),
+            [(1, True), (2, False)])
+        self.assertEqual(len(answer_keys.get(clone.id).questions), 3)
+        # the tutorial has a quiz now
+        self.assertEqual(self.client.post(url, {"video_tutorial":tutorial.id}, format="json").status_code, 400)
+
+    def test_only_the_creator_can_clone(self):
+        self.client.force_authenticate(self.students[0])
+        tutorial = VideoTutorial.objects.create(title="copy", video_link="https://youtube.com/embed/x",
+            embed_type=VideoTutorial.YOUTUBE_EMBED, created_by=self.students[0])
+        response = self.client.post("/api/v1/quiz/{}/clone/".format(self.quiz.id), {"video_tutorial":tutorial.id},
+            format="json")
+        self.assertEqual(response.status_code, 401)
+
+
+class SolutionEventTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.student = User.objects.create_user("student@example.com", "password")
+        self.quiz = create_quiz(self.owner, questions=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id))
+        self.url = "/api/v1/quiz/{}/events/".format(self.quiz.id)
+        self.question = Question.objects.filter(quiz=self.quiz).first()
+
+    def events(self, count):
+        return [{"kind":"viewed", "question":self.question.id, "occurred_at":"2020-01-01T10:00:00Z",
+            "duration_ms":i} for i in range(count)]
+
+    def test_events_are_buffered_until_the_buffer_is_full(self):
+        buffer = EventBuffer(max_size=5, max_age=3600)
+        with patch.object(QuizView, "event_buffer", buffer):
+            response = self.client.post(self.url, self.events(3), format="json")
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(SolutionEvent.objects.count(), 0)
+            self.client.post(self.url, self.events(3) + [{"kind":"focus_lost",
+                "occurred_at":"2020-01-01T10:00:01Z"}], format="json")
+        self.assertEqual(SolutionEvent.objects.count(), 7)
+        self.assertEqual(SolutionEvent.objects.filter(kind=SolutionEvent.FOCUS_LOST, question_id=None).count(), 1)
+
+    def test_invalid_events(self):
+        with patch.object(QuizView, "event_buffer", EventBuffer(max_age=0)):
+            self.assertEqual(self.client.post(self.url, [{"kind":"unknown", "occurred_at":"2020-01-01T10:00:00Z"}],
+                format="json").status_code, 400)
+            self.assertEqual(self.client.post(self.url, [dict(self.events(1)[0], question=0)],
+                format="json").status_code, 404)
+            self.client.force_authenticate(self.owner)
+            self.assertEqual(self.client.post(self.url, self.events(1), format="json").status_code, 404)
+        self.assertEqual(SolutionEvent.objects.count(), 0)
+
+    def test_rollover(self):
+        solution = QuizSolution.objects.get(user=self.student)
+        now = timezone.now()
+        SolutionEvent.objects.bulk_create([SolutionEvent(solution=solution, kind=SolutionEvent.VIEWED,
+            occurred_at=now, recorded_at=now - datetime.timedelta(days=days)) for days in (10, 9, 8, 1)])
+        archive = io.StringIO()
+        self.assertEqual(rollover(now - datetime.timedelta(days=5), archive=archive, batch_size=2), 3)
+        self.assertEqual(SolutionEvent.objects.count(), 1)
+        self.assertEqual(len(archive.getvalue().splitlines()), 3)
+
+
+class ItemStatsTestCase(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user("owner@example.com", "password")
+        self.students = [User.objects.create_user("student%s@example.com" % i, "password") for i in range(3)]
+        self.quiz = create_quiz(self.owner, questions=4)
+        self.freeform = FreeFormQuestion.objects.filter(quiz=self.quiz).order_by("position")
+        self.multichoice = MultiChoiceQuestion.objects.filter(quiz=self.quiz).order_by("position")
+        self.client = APIClient()
+        # student 0 answers the first three questions right, 1 the first two and 2 the first one
+        for i, student in enumerate(self.students):
+            self.submit(student, correct=3 - i, duration_ms=1000 * (i + 1))
+
+    def submit(self, student, correct, duration_ms, buffer=None):
+        self.client.force_authenticate(student)
+        self.client.get("/api/v1/quiz/{}/start_quiz/".format(self.quiz.id))
+        questions = sorted(list(self.freeform) + list(self.multichoice), key=lambda q: q.position)
+        with patch.object(QuizView, "event_buffer", buffer or EventBuffer(max_age=0)):
+            self.client.post("/api/v1/quiz/{}/events/".format(self.quiz.id), [{"kind":"viewed",
+                "question":questions[0].id, "occurred_at":"2020-01-01T10:00:00Z", "duration_ms":duration_ms}],
+                format="json")
+        answers = []
+        for i, question in enumerate(questions):
+            right = i < correct
+            if question.question_type == Question.FREE_FORM_QUESTION_TYPE:
+                answers.append({"question":question.id, "answer":"answer" if right else "wrong"})
+            else:
+                choice = question.choices.get(position=1 if right else 2)
+                answers.append({"question":question.id, "answer":choice.id})
+        response = self.client.post("/api/v1/quiz/{}/submit_quiz/".format(self.quiz.id), answers, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def counters(self):
+        return list(QuestionStats.objects.filter(quiz=self.quiz).order_by("question__position")
+            .values_list("attempts", "correct", "timed", "total_time_ms"))
+
+    def test_counters_are_updated_when_grading(self):
+        self.assertEqual(self.counters(), [(3, 3, 3, 6000), (3, 2, 0, 0), (3, 1, 0, 0), (3, 0, 0, 0)])
+        question = self.multichoice[0]
+        self.assertEqual(list(ChoiceStats.objects.filter(choice__question=question).order_by("choice__position")
+            .values_list("selections", flat=True)), [2, 1])
+
+    def test_buffered_durations_are_counted(self):
+        buffer = EventBuffer(max_size=1000, max_age=3600)
+        # nothing is left for the flusher thread to write once the test database is gone
+        self.addCleanup(buffer.take)
+        student = User.objects.create_user("student3@example.com", "password")
+        with patch.object(quiz_service, "event_buffer", buffer):
+            self.submit(student, correct=4, duration_ms=4000, buffer=buffer)
+        self.assertTrue(buffer.buffered(QuizSolution.objects.get(user=student).id))
+        self.assertEqual(self.counters()[0], (4, 4, 4, 10000))
+
+    def test_record_updates_each_table_once(self):
+        solution = QuizSolution.objects.filter(quiz=self.quiz).first()
+        questions = list(Question.objects.filter(quiz=self.quiz).order_by("position"))
+        choice = self.multichoice[0].choices.get(position=1)
+        graded = [(questions[0].id, None, True), (questions[1].id, choice.id, False), (questions[2].id, None, True)]
+        before = self.counters()
+        # question stats insert and update, choice stats insert and update
+        with self.assertNumQueries(4):
+            ItemStatsService().record(solution, graded, {questions[0].id:500})
+        after = self.counters()
+        self.assertEqual(after[0], (before[0][0] + 1, before[0][1] + 1, before[0][2] + 1, before[0][3] + 500))
+        self.assertEqual(after[1], (before[1][0] + 1, before[1][1], before[1][2], before[1][3]))
+        self.assertEqual(after[2], (before[2][0] + 1, before[2][1] + 1, before[2][2], before[2][3]))
+        self.assertEqual(after[3], before[3])
+
+    def test_rebuild(self):
+        incremental = self.counters()
+        QuestionStats.objects.all().delete()
+        self.assertEqual(ItemStatsService().rebuild(self.quiz.id), 3)
+        self.assertEqual(self.counters(), incremental)
+        discrimination = list(QuestionStats.objects.filter(quiz=self.quiz).order_by("question__position")
+            .values_list("discrimination", flat=True))
+        self.assertGreater(discrimination[1], 0)
+        # everybody answered the first question right, nobody the last one
+        self.assertIsNone(discrimination[0])
+        self.assertIsNone(discrimination[3])
+        self.assertEqual(ChoiceStats.objects.filter(choice__question__quiz=self.quiz).count(), 6)
+
+    def test_stats_view(self):
+        self.client.force_authenticate(self.owner)
+        # quiz and creator lookups, choices and questions with their stats
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/v1/questions/stats/", {"quiz":self.quiz.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[1]["correct_rate"], 2 / 3)
+        self.assertEqual(response.data[0]["mean_time_ms"], 2000)
+        self.assertEqual([c["selections"] for c in response.data[1]["choices"]], [2, 1, 0])
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(self.client.get("/api/v1/questions/stats/", {"quiz":self.quiz.id}).status_code, 401)
+
+
+class SharedCacheCheckTestCase(SimpleTestCase):
+
+    def test_cache_config(self):
+        self.assertEqual(cache_config("memcached://a:11211,b:11211"), {
+            "BACKEND":"django.core.cache.backends.memcached.MemcachedCache", "LOCATION":["a:11211", "b:11211"]})
+        self.assertEqual(cache_config("redis://cache:6379/0")["LOCATION"], "redis://cache:6379/0")
+        self.assertEqual(cache_config("locmem://eneza")["LOCATION"], "eneza")
+
+    def test_process_local_cache_warns_without_debug(self):
+        with override_settings(DEBUG=False):
+            self.assertEqual([w.id for w in check_shared_cache(None)], ["eneza.W001"])
+        with override_settings(DEBUG=True):
+            self.assertEqual(check_shared_cache(None), [])
+        with override_settings(DEBUG=False, CACHES={"default":cache_config("memcached://cache:11211")}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_check_warns_by_default(self):
+        # DEBUG is off unless the environment turns it on
+        env = {key:value for key, value in os.environ.items() if key not in ("DEBUG", "CACHE_URL")}
+        result = subprocess.run([sys.executable, "manage.py", "check"], env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertIn(b"eneza.W001", result.stdout)
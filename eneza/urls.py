@@ -2,10 +2,12 @@ from django.urls import path, include
 from rest_framework import routers
 from eneza.views import VideoTutorialView, QuizView, MultiChoiceQuestionView,\
     QuestionView, MultiChoiceQuestionChoiceView, FreeFormQuestionView,\
-    SubmittedMultichoiceAnswerView, SubmittedFreeformAnswerView
+    SubmittedMultichoiceAnswerView, SubmittedFreeformAnswerView, VideoView, VideoUploadView
 
 router = routers.DefaultRouter()
 router.register(r'video_tutorials', VideoTutorialView, base_name='video-tutorials-view')
+router.register(r'videos', VideoView, base_name='videos-view')
+router.register(r'video_uploads', VideoUploadView, base_name='video-uploads-view')
 router.register(r'quiz', QuizView, base_name='quiz-view')
 router.register(r'questions', QuestionView, base_name='question-view')
 router.register(r'multi-choice-questions', MultiChoiceQuestionView, base_name='multi-choice-question-view')
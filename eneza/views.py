@@ -1,3 +1,4 @@
+import csv, hashlib
 from rest_framework.views import APIView
 from rest_framework.viewsets import ViewSet, ModelViewSet
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -5,22 +6,39 @@ from rest_framework.parsers import FileUploadParser,MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
-from rest_framework.exceptions import APIException, NotFound
+from rest_framework.exceptions import APIException, MethodNotAllowed, NotFound, ValidationError
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 
-from eneza.serializers import VideoTutorialSerializer, QuizSerializer,\
+from eneza.serializers import VideoSerializer, VideoUploadSerializer, VideoTutorialSerializer, QuizSerializer,\
     MultiChoiceQuestionSerializer, QuestionSerializer, FreeFormQuestionSerializer, MultiChoiceQuestionChoiceSerializer,\
-    QuizSolutionSerializer, SubmittedMultichoiceAnswerSerializer, SubmittedFreeformAnswerSerializer, SubmitQuizSerializer
+    QuizSolutionSerializer, SubmittedMultichoiceAnswerSerializer, SubmittedFreeformAnswerSerializer, SubmitQuizSerializer,\
+    QuestionImportSerializer, SolutionEventSerializer
 
-from eneza.models import VideoTutorial, Quiz, MultiChoiceQuestion,\
+from eneza.models import Video, VideoUpload, VideoTutorial, Quiz, MultiChoiceQuestion,\
     Question, FreeFormQuestion, MultiChoiceQuestionChoice, QuizSolution,\
-    SubmittedFreeformAnswer, SubmittedMultichoiceAnswer
+    SubmittedFreeformAnswer, SubmittedMultichoiceAnswer, SolutionEvent
 
-from eneza.exceptions import InvalidPermissionsException,SimpleValidationError
+from eneza.exceptions import ForbiddenException, InvalidPermissionsException,SimpleValidationError
 from eneza.services.quiz_service import QuizService
+from eneza.services.submission_service import QuizSubmissionService
+from eneza.services.leaderboard_service import LeaderboardService
+from eneza.services.content_cache import rendered_content
+from eneza.services.gradebook import Gradebook
+from eneza.services.question_import import QuestionImportService, parse_question_csv
+from eneza.services.quiz_versions import QuizVersionService, snapshot_questions
+from eneza.services.activity_log import event_buffer
+from eneza.services.answer_keys import answer_keys
+from eneza.services.video_uploads import VideoUploadService, parse_checksum
+from eneza.services.content_versions import get_content_version, get_quiz_version
+from eneza.db_routers import routed_stream
 
 
 class ExtendedModelViewSet(ModelViewSet):
+    private_owners = None
 
     def creator_filter(self, queryset,user):
         return queryset.filter(created_by=user)
@@ -32,6 +50,42 @@ class ExtendedModelViewSet(ModelViewSet):
                 raise InvalidPermissionsException(detail="You do not have permission to read this object")
         return status
 
+    def get_sparse_fields(self):
+        fields = self.request.query_params.get("fields", None)
+        if not fields:
+            return None
+        return [f.strip() for f in fields.split(",") if f.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request and self.request.method == "GET":
+            kwargs.setdefault("fields", self.get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.private_owners is not None:
+            context["private_owners"] = self.private_owners
+        return context
+
+    def cached_content(self, request, name, version, render):
+        '''
+        Returns (data, etag) of the payload render() builds for this url and content version.
+        While render runs, self.private_owners is set for the shared variant.
+        '''
+        def _render(private_owners):
+            self.private_owners = private_owners
+            try:
+                return render()
+            finally:
+                self.private_owners = None
+        return rendered_content.get(name, version, request.build_absolute_uri(), request.user, _render)
+
+    def content_response(self, request, data, etag):
+        tags = [tag.strip() for tag in request.META.get("HTTP_IF_NONE_MATCH", "").split(",")]
+        if "*" in tags or etag in tags or "W/" + etag in tags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag":etag})
+        return Response(data, status=status.HTTP_200_OK, headers={"ETag":etag})
+
     def get_obj_or_404(self, Model, pk, raise_exception=True, detail="object with that id does not exists"):
         try:
             return Model.objects.get(pk=pk)
@@ -43,60 +97,183 @@ class ExtendedModelViewSet(ModelViewSet):
 ModelViewSet=ExtendedModelViewSet
 
 class VideoView(ModelViewSet):
-    parser_classes = (MultiPartParser,FormParser,)
+    '''
+    Uploaded videos, they are created through VideoUploadView.
+    '''
     permission_classes = (IsAuthenticated,)
-    serializer_class = VideoTutorialSerializer
-    queryset =  VideoTutorial.objects.all()   
+    serializer_class = VideoSerializer
+    queryset =  Video.objects.all()
+    http_method_names = ["get", "head", "options"]
+
+
+class VideoUploadView(ModelViewSet):
+    '''
+    Resumable video uploads.
+
+    POST with filename, size and optionally the sha256 checksum of the file,
+    then PATCH the chunks in order to chunk/ with an Upload-Offset header and
+    optionally an Upload-Checksum of `sha256 <hex digest>`. After a failure GET
+    returns the offset to resume from. POST complete/ creates the Video.
+    '''
+    permission_classes = (IsAuthenticated,)
+    serializer_class = VideoUploadSerializer
+    http_method_names = ["get", "post", "patch", "delete", "head", "options"]
+
+    def get_queryset(self):
+        return self.creator_filter(VideoUpload.objects.all(), self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = VideoUploadService().start(request.user, **serializer.validated_data)
+        return Response(self.get_serializer(upload).data, status=status.HTTP_201_CREATED)
+
+    def partial_update(self, request, *args, **kwargs):
+        raise MethodNotAllowed(request.method)
+
+    def perform_destroy(self, instance):
+        VideoUploadService().abort(instance)
+
+    @action(detail=True, methods=["PATCH"])
+    def chunk(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.META["HTTP_UPLOAD_OFFSET"])
+            length = int(request.META["CONTENT_LENGTH"])
+        except (KeyError, ValueError):
+            raise SimpleValidationError(detail="Upload-Offset and Content-Length headers are required")
+        checksum = request.META.get("HTTP_UPLOAD_CHECKSUM")
+        checksum = parse_checksum(checksum) if checksum else None
+        # the body is read from the stream as it arrives, never parsed into request.data
+        offset = VideoUploadService().append(upload, offset, request.stream, length, checksum)
+        return Response(self.get_serializer(upload).data, status=status.HTTP_200_OK,
+            headers={"Upload-Offset":str(offset)})
+
+    @action(detail=True, methods=["POST"])
+    def complete(self, request, pk=None):
+        upload = self.get_object()
+        VideoUploadService().complete(upload)
+        return Response(self.get_serializer(upload).data, status=status.HTTP_200_OK)
 
 
-class VideoTutorialView(ModelViewSet):
+class CachedContentListMixin:
+    '''
+    Serves list from the rendered content cache, keyed on the global content version.
+    '''
+
+    def list(self, request, *args, **kwargs):
+        data, etag = self.cached_content(request, "{}.list".format(self.__class__.__name__), get_content_version(),
+            lambda: super(CachedContentListMixin, self).list(request, *args, **kwargs).data)
+        return self.content_response(request, data, etag)
+
+
+class VideoTutorialView(CachedContentListMixin, ModelViewSet):
     permission_classes = (IsAuthenticated,)
     serializer_class = VideoTutorialSerializer
     queryset =  VideoTutorial.objects.all() 
 
 class CustomQuestionSerializer:
     parent_serializer_class = QuestionSerializer
-
-    def __init__(self, request, queryset=None, many=True, with_answer=False):
+    children_models=[
+        ("freeformquestion", FreeFormQuestionSerializer, (SubmittedFreeformAnswer, SubmittedFreeformAnswerSerializer)),
+        ("multichoicequestion", MultiChoiceQuestionSerializer, (SubmittedMultichoiceAnswer, SubmittedMultichoiceAnswerSerializer)),
+        ]
+    question_types = {Question.FREE_FORM_QUESTION_TYPE:"freeformquestion",
+        Question.MULTI_CHOICE_QUESTION_TYPE:"multichoicequestion"}
+
+    def __init__(self, request, queryset=None, many=True, with_answer=False, fields=None, private_owners=None):
         self.request = request
+        self.fields = fields
         self.queryset = queryset
         self.many = many
         self._data = []
         self.with_answer = with_answer
+        self._user_answers = {}
+        self.context = {'request':request}
+        if private_owners is not None:
+            self.context['private_owners'] = private_owners
+
+    @staticmethod
+    def prefetch(queryset):
+        '''
+        Joins both question subtypes and prefetches choices so that rendering
+        does not query per question.
+        '''
+        return queryset.select_related("freeformquestion", "multichoicequestion")\
+            .prefetch_related("multichoicequestion__choices")
 
     @property
     def data(self):
         return self.serialize_questions(self.queryset, many=self.many)
 
-    def _serialize(self, instance):
-        children_models=[
-            (FreeFormQuestion,"freeformquestion", FreeFormQuestionSerializer, (SubmittedFreeformAnswer, SubmittedFreeformAnswerSerializer)),
-            (MultiChoiceQuestion,"multichoicequestion",MultiChoiceQuestionSerializer, (SubmittedMultichoiceAnswer, SubmittedMultichoiceAnswerSerializer)),
-            ]
-        for model, related_query_name, s,_a_s in children_models:
+    def load_user_answers(self, question_ids):
+        '''
+        Fetches the user's submitted answers for all questions, one query per answer model.
+        '''
+        self._user_answers = {}
+        for related_query_name, s, (answer_model, answer_serializer) in self.children_models:
+            answers = answer_model.objects.filter(question_id__in=question_ids, solution__user=self.request.user)
+            for answer in answers:
+                self._user_answers[(related_query_name, answer.question_id)] = answer
+
+    def _render(self, instance):
+        '''
+        Returns (related_query_name, question id, data), related_query_name is None for a bare question.
+        '''
+        for related_query_name, s, answer_models in self.children_models:
             try:
                 i=getattr(instance,related_query_name)
-                data = s(instance=i, context={'request':self.request}).data
-                if self.with_answer:
-                    try:
-                        answer = _a_s[0].objects.get(question=i, created_by=self.request.user)
-                        answer = _a_s[1](instance=answer,  context={'request':self.request}).data
-                    except _a_s[0].DoesNotExist:
-                        answer = None
-                    data["user_answer"]=answer
-                return data
-            except model.DoesNotExist:
+            except ObjectDoesNotExist:
                 continue
-        return self.parent_serializer_class(instance=instance, context={'request':self.request}).data 
+            return (related_query_name, instance.id, s(instance=i, context=self.context, fields=self.fields).data)
+        return (None, instance.id, self.parent_serializer_class(instance=instance, context=self.context, fields=self.fields).data)
+
+    def render_questions(self, queryset, many=True):
+        '''
+        Renders the questions without the user's answers, the result can be shared between users.
+        '''
+        questions = list(queryset) if many==True else [queryset]
+        return [self._render(q) for q in questions]
+
+    def render_instances(self, questions):
+        '''
+        Renders FreeFormQuestion and MultiChoiceQuestion instances that are not
+        rows, e.g. the questions of a QuizVersion snapshot.
+        '''
+        serializers = {related_query_name:s for related_query_name, s, answer_models in self.children_models}
+        rendered = []
+        for question in questions:
+            related_query_name = self.question_types[question.question_type]
+            rendered.append((related_query_name, question.id,
+                serializers[related_query_name](instance=question, context=self.context, fields=self.fields).data))
+        return rendered
+
+    def merge_user_answers(self, rendered):
+        '''
+        Returns the data of rendered questions with the user's answers added, rendered is left untouched.
+        '''
+        if not (self.with_answer and (not self.fields or "user_answer" in self.fields)):
+            return [data for related_query_name, question_id, data in rendered]
+        self.load_user_answers([question_id for related_query_name, question_id, data in rendered])
+        answer_serializers = {related_query_name:answer_serializer
+            for related_query_name, s, (answer_model, answer_serializer) in self.children_models}
+        result = []
+        for related_query_name, question_id, data in rendered:
+            if related_query_name is not None:
+                data = dict(data)
+                answer = self._user_answers.get((related_query_name, question_id), None)
+                if answer is not None:
+                    answer = answer_serializers[related_query_name](instance=answer, context=self.context).data
+                data["user_answer"]=answer
+            result.append(data)
+        return result
+
+    def user_answers_fingerprint(self):
+        return sorted((key, answer.id, str(answer.updated_at)) for key, answer in self._user_answers.items())
 
     def serialize_questions(self, queryset, many=True):
-        data = [] if many==True else {}
-        if many==True:
-            for q in self.queryset:
-                data.append(self._serialize(q))
-            return data
-        else:
-            return self._serialize(queryset)  
+        data = self.merge_user_answers(self.render_questions(queryset, many=many))
+        return data if many==True else data[0]
 
 class QuizView(ModelViewSet):
     permission_classes = (IsAuthenticated,)
@@ -105,10 +282,17 @@ class QuizView(ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['video_tutorial',]
     quiz_service = QuizService
-
-    def get_user_quiz_solution(self,quiz, user, raise_exception=True):
+    submission_service = QuizSubmissionService
+    leaderboard_service = LeaderboardService
+    event_buffer = event_buffer
+    # GET actions that write, they never read from a replica
+    primary_actions = ('start_quiz', 'end_quiz')
+    export_content_types = {"csv":"text/csv; charset=utf-8", "ndjson":"application/x-ndjson"}
+
+    def get_user_quiz_solution(self,quiz, user, raise_exception=True, lock=False):
+        queryset = QuizSolution.objects.select_for_update() if lock else QuizSolution.objects
         try: 
-            solution = QuizSolution.objects.get(quiz=quiz, user=user)
+            solution = queryset.get(quiz=quiz, user=user)
             return solution
         except QuizSolution.DoesNotExist:
             if raise_exception:
@@ -128,19 +312,21 @@ class QuizView(ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-    def _end_quiz(self, request, quiz):
-        solution:QuizSolution = self.get_user_quiz_solution(quiz, request.user, raise_exception=True)
-        if solution.complete:
-            return SimpleValidationError(detail="Quiz solution has already been submitted")
-
-        self.is_creator(solution, request.user, raise_exception=True)
+    def _end_quiz(self, request, quiz, answers=None):
+        '''
+        Stores the submitted answers, if any, grades the solution and queues the results
+        email in a single transaction.
+        '''
         quiz_service = self.quiz_service()
-        _solution = quiz_service.process_solution(solution)
-        try:
-            quiz_service.send_quiz_results_email(_solution)
-        except Exception as e:
-            print(e)
-            pass
+        with transaction.atomic():
+            solution:QuizSolution = self.get_user_quiz_solution(quiz, request.user, raise_exception=True, lock=True)
+            if solution.complete:
+                raise SimpleValidationError(detail="Quiz solution has already been submitted")
+            self.is_creator(solution, request.user, raise_exception=True)
+            if answers is not None:
+                self.submission_service().create_answers(solution, answers, request.user)
+            _solution = quiz_service.process_solution(solution)
+            quiz_service.queue_quiz_results_email(_solution)
         if _solution and isinstance(_solution, QuizSolution):
             serializer = QuizSolutionSerializer(instance=_solution,many=False,context={"request":request})
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -167,23 +353,170 @@ class QuizView(ModelViewSet):
         if solution == False and quiz.created_by !=request.user:
             raise SimpleValidationError(detail="Must start quiz or be quiz owner to view questions")
         position = request.GET.get('position', None)
-        if position:
+        if position is not None:
             try:
                 position=int(position)
             except Exception:
                 raise SimpleValidationError(detail='position must be an integer')
-            try:
-                question = Question.objects.get(quiz=quiz, position=int(position))
-                serializer = CustomQuestionSerializer(request, queryset=question, many=False, with_answer=True)
+        fields = self.get_sparse_fields()
+        # a student with an open solution answers the version it was started on, see submit_quiz
+        version = None
+        if solution and not solution.complete and solution.version_id is not None:
+            version = solution.version
+            if version.revision == quiz.revision:
+                version = None
+
+        def render():
+            serializer = CustomQuestionSerializer(request, fields=fields, private_owners=self.private_owners)
+            if version is not None:
+                questions = snapshot_questions(version, created_by_id=quiz.created_by_id)
+                if position is not None:
+                    questions = [question for question in questions if question.position == position]
+                    if not questions:
+                        raise NotFound(detail="Question does not exist")
+                return serializer.render_instances(questions)
+            questions = CustomQuestionSerializer.prefetch(Question.objects.filter(quiz=quiz))
+            if position is not None:
+                try:
+                    questions = questions.get(position=position)
+                except Question.DoesNotExist:
+                    raise NotFound(detail="Question does not exist")
+            else:
+                questions = questions.order_by('position')
+            return serializer.render_questions(questions, many=position is None)
+
+        # question content is shared through the cache, only the user's answers are read per request
+        content_version = get_quiz_version(quiz.id) if version is None else "version-{}".format(version.id)
+        rendered, etag = self.cached_content(request, "QuizView.quiz_questions", content_version, render)
+        serializer = CustomQuestionSerializer(request, with_answer=True, fields=fields)
+        data = serializer.merge_user_answers(rendered)
+        etag = '"{}"'.format(hashlib.md5((etag + repr(serializer.user_answers_fingerprint())).encode()).hexdigest())
+        return self.content_response(request, data[0] if position is not None else data, etag)
+
+    def check_results_access(self, quiz, user):
+        '''
+        Results of a quiz are shown to its creator and to the users who took it.
+        '''
+        if quiz.created_by_id == user.pk or user.is_superuser:
+            return
+        if not QuizSolution.objects.filter(quiz=quiz, user=user).exists():
+            raise ForbiddenException(detail="Only the quiz creator and its students can view its results")
 
-            except Question.DoesNotExist:
-                raise NotFound(detail="Question does not exist")
-        else:
-            questions =  Question.objects.filter(quiz=quiz).order_by('position')
-            serializer = CustomQuestionSerializer(request, queryset=questions, many=True, with_answer=True)
-        data =serializer.data
+    @action(detail=True, methods=["GET"])
+    def leaderboard(self, request, pk=None):
+        quiz = self.get_obj_or_404(Quiz, pk)
+        self.check_results_access(quiz, request.user)
+        try:
+            offset = max(int(request.GET.get('offset', 0)), 0)
+            limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+        except ValueError:
+            raise SimpleValidationError(detail='offset and limit must be integers')
+        leaderboard_service = self.leaderboard_service()
+        data = {
+            "count":leaderboard_service.count(quiz.id),
+            "offset":offset,
+            "limit":limit,
+            "results":leaderboard_service.top(quiz.id, offset=offset, limit=limit),
+            "my_rank":leaderboard_service.rank(quiz.id, request.user),
+        }
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["GET"])
+    def score_distribution(self, request, pk=None):
+        quiz = self.get_obj_or_404(Quiz, pk)
+        self.check_results_access(quiz, request.user)
+        buckets = self.leaderboard_service().distribution(quiz.id)
+        data = {"count":sum(b["count"] for b in buckets), "buckets":buckets}
         return Response(data, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=["GET"])
+    def export(self, request, pk=None):
+        '''
+        Streams the gradebook of the quiz to its creator, one row per student.
+        ?export_format=csv (default) or ndjson, `format` is taken by DRF.
+        '''
+        quiz = self.get_obj_or_404(Quiz, pk)
+        self.is_creator(quiz, request.user, raise_exception=True)
+        export_format = request.GET.get("export_format", "csv")
+        if export_format not in self.export_content_types:
+            raise SimpleValidationError(detail="export_format must be csv or ndjson")
+        gradebook = Gradebook(quiz)
+        chunks = gradebook.as_csv() if export_format == "csv" else gradebook.as_ndjson()
+        response = StreamingHttpResponse(routed_stream(chunks), content_type=self.export_content_types[export_format])
+        response["Content-Disposition"] = 'attachment; filename="quiz-{}-gradebook.{}"'.format(quiz.id, export_format)
+        return response
+
+    @action(detail=True, methods=["POST"])
+    def clone(self, request, pk=None):
+        '''
+        Copies the quiz with its questions and choices to another video tutorial of
+        the quiz creator, {"video_tutorial": id}.
+        '''
+        quiz = self.get_obj_or_404(Quiz, pk)
+        self.is_creator(quiz, request.user, raise_exception=True)
+        try:
+            video_tutorial_id = int(request.data.get("video_tutorial"))
+        except (TypeError, ValueError):
+            raise SimpleValidationError(detail="video_tutorial must be an integer")
+        video_tutorial = self.get_obj_or_404(VideoTutorial, video_tutorial_id)
+        self.is_creator(video_tutorial, request.user, raise_exception=True)
+        clone = QuizVersionService().clone(quiz, video_tutorial, request.user)
+        return Response(QuizSerializer(instance=clone, context={"request":request}).data,
+            status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=["POST"])
+    def import_questions(self, request, pk=None):
+        '''
+        Creates many questions of the quiz at once, for its creator. Takes a JSON
+        list of questions, or {"questions": [...]}, each multi choice question with
+        its nested choices, or a text/csv body, see parse_question_csv.
+        '''
+        quiz = self.get_obj_or_404(Quiz, pk)
+        self.is_creator(quiz, request.user, raise_exception=True)
+        if request.content_type.startswith("text/csv"):
+            try:
+                questions = parse_question_csv(request.body.decode("utf-8"))
+            except (UnicodeDecodeError, csv.Error):
+                raise SimpleValidationError(detail="Unable to read the CSV")
+        else:
+            questions = request.data.get("questions") if isinstance(request.data, dict) else request.data
+        if type(questions) != list or not questions:
+            raise SimpleValidationError(detail="Provide a non empty list of questions")
+        serializer = QuestionImportSerializer(data=questions, many=True)
+        serializer.is_valid(raise_exception=True)
+        ids = QuestionImportService(quiz, request.user).import_questions(serializer.validated_data)
+        return Response({"count":len(ids), "questions":ids}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=["POST"])
+    def events(self, request, pk=None):
+        '''
+        Takes a batch of telemetry events of the student's running solution, e.g.
+        questions viewed or focus lost. Events are buffered and written in bulk,
+        see eneza.services.activity_log.
+        '''
+        if type(request.data) != list or not request.data:
+            raise SimpleValidationError(detail="Provide a non empty list of events")
+        if len(request.data) > settings.ACTIVITY_MAX_BATCH:
+            raise SimpleValidationError(detail="At most {} events per request".format(settings.ACTIVITY_MAX_BATCH))
+        serializer = SolutionEventSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        solution = QuizSolution.objects.filter(quiz_id=pk, user=request.user).only("id", "quiz_id", "version_id",
+            "complete").first()
+        if solution is None:
+            raise NotFound(detail="Quiz does not have a solution")
+        if solution.complete:
+            raise SimpleValidationError(detail="Quiz solution has already been submitted")
+        answer_key = answer_keys.for_solution(solution)
+        events = []
+        for d in serializer.validated_data:
+            question_id = d.get("question")
+            if question_id is not None and answer_key.question_type(question_id) is None:
+                raise NotFound(detail="Question with that id does not exist")
+            events.append(SolutionEvent(solution_id=solution.id, question_id=question_id, kind=d["kind"],
+                occurred_at=d["occurred_at"], duration_ms=d.get("duration_ms")))
+        self.event_buffer.add(events)
+        return Response({"accepted":len(events)}, status=status.HTTP_202_ACCEPTED)
+
     @action(detail=True, methods=["POST"])
     def submit_quiz(self, request, pk=None):
         if type(request.data) != list:
@@ -193,46 +526,11 @@ class QuizView(ModelViewSet):
         if solution.complete:
             raise SimpleValidationError(detail="Already submitted solution for quiz")
 
-        validated_data=[]
-        
-        for d in request.data:
-            d["solution"]=solution.id
-
-            s= SubmitQuizSerializer(data=d, context={"request":request})
-            if s.is_valid(raise_exception=True):
-                validated_data.append(s.data)
-        free_form_answers=[]
-        multi_choice_answers=[]
-        models_mapper = {Question.FREE_FORM_QUESTION_TYPE:SubmittedFreeformAnswer,
-                    Question.MULTI_CHOICE_QUESTION_TYPE:SubmittedMultichoiceAnswer}
-        for d in validated_data:
-            question:Question = Question.objects.get(id=d["question"])
-            _M =  models_mapper[question.question_type]
-            if  _M.objects.filter(question_id=question.id, created_by=request.user):
-                raise SimpleValidationError(detail="Question {_id} already has an answer".format(_id=question.id))
-
-            if question.question_type==Question.MULTI_CHOICE_QUESTION_TYPE:
-                question:MultiChoiceQuestion = question.multichoicequestion
-                try:
-                    choice = int(d["answer"])
-                except Exception:
-                    raise SimpleValidationError(detail="Choice must be an integer")
-                choice = self.get_obj_or_404(MultiChoiceQuestionChoice, choice, detail="Choice does not exist")
-                multi_choice_answers.append(
-                    _M(selected_choice=choice,solution=solution,question=question)
-                )
-            if  question.question_type==Question.FREE_FORM_QUESTION_TYPE:
-                question:FreeFormQuestion = question.freeformquestion 
-                free_form_answers.append(
-                    _M(solution=solution, question=question, answer=d["answer"])
-                )
-        _x = [(free_form_answers,SubmittedFreeformAnswer),(multi_choice_answers,SubmittedMultichoiceAnswer)]
-        for instances, _M in _x:
-            try:
-                _M.objects.bulk_create(instances)
-            except Exception as e:
-                raise SimpleValidationError(detail="Unable to create answers"+str(e))
-        return self._end_quiz(request, quiz)
+        serializer = SubmitQuizSerializer(data=request.data, many=True, context={"request":request})
+        if not serializer.is_valid():
+            # answers used to be validated one at a time, keep answering with the errors of the first invalid one
+            raise ValidationError(next(errors for errors in serializer.errors if errors))
+        return self._end_quiz(request, quiz, answers=serializer.validated_data)
         
 
     def destroy(self, request, pk=None):
@@ -246,27 +544,11 @@ class QuestionView(ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['quiz','position']
 
-    def _serialize(self, request, instance):
-        children_models=[
-            (FreeFormQuestion,"freeformquestion", FreeFormQuestionSerializer),
-            (MultiChoiceQuestion,"multichoicequestion",MultiChoiceQuestionSerializer),
-            ]
-        for model, related_query_name, s in children_models:
-            try:
-                i=getattr(instance,related_query_name)
-                return s(instance=i, context={'request':request}).data
-            except model.DoesNotExist:
-                continue
-        return self.serializer_class(instance=instance).data 
+    cursor_ordering = ('position', 'id')
 
     def serialize_questions(self,request, queryset, many=True):
-        data = [] if many==True else {}
-        if many==True:
-            for q in queryset:
-                data.append(self._serialize(request, q))
-            return data
-        else:
-            return self._serialize(request, queryset)
+        return CustomQuestionSerializer(request, queryset=queryset, many=many, fields=self.get_sparse_fields(),
+            private_owners=self.private_owners).data
 
     def create(self, request):
         return Response({"error":"Not Implemented"},status=status.HTTP_501_NOT_IMPLEMENTED)
@@ -281,15 +563,55 @@ class QuestionView(ModelViewSet):
         return Response({"error":"Not Implemented"},status=status.HTTP_501_NOT_IMPLEMENTED)   
 
     def list(self, request):
-        queryset=self.filter_queryset(self.get_queryset())
-        data =self.serialize_questions(request, queryset)
-        # data = self.serializer_class(instance=queryset, many=True).data
+        def render():
+            queryset=CustomQuestionSerializer.prefetch(self.filter_queryset(self.get_queryset()))
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(self.serialize_questions(request, page)).data
+            return self.serialize_questions(request, queryset)
+        data, etag = self.cached_content(request, "QuestionView.list", get_content_version(), render)
+        return self.content_response(request, data, etag)
+
+    @action(detail=False, methods=["GET"])
+    def stats(self, request):
+        '''
+        Item analytics of every question of ?quiz=, for its creator: attempts,
+        share answered correctly, mean time, discrimination and how often each
+        choice was picked. A constant number of queries whatever the size of the quiz.
+        '''
+        try:
+            quiz_id = int(request.GET.get("quiz"))
+        except (TypeError, ValueError):
+            raise SimpleValidationError(detail="quiz must be an integer")
+        quiz = self.get_obj_or_404(Quiz, quiz_id)
+        self.is_creator(quiz, request.user, raise_exception=True)
+        choices = {}
+        for choice in MultiChoiceQuestionChoice.objects.filter(question__quiz_id=quiz_id).order_by("position")\
+                .values("id", "question_id", "position", "choice", "answer", "stats__selections"):
+            choices.setdefault(choice.pop("question_id"), []).append({"id":choice["id"],
+                "position":choice["position"], "choice":choice["choice"], "answer":choice["answer"],
+                "selections":choice["stats__selections"] or 0})
+        data = []
+        for question in Question.objects.filter(quiz_id=quiz_id).order_by("position").values("id", "position",
+                "question_type", "stats__attempts", "stats__correct", "stats__timed", "stats__total_time_ms",
+                "stats__discrimination"):
+            attempts, correct, timed = (question["stats__" + k] or 0 for k in ("attempts", "correct", "timed"))
+            data.append({"question":question["id"], "position":question["position"],
+                "question_type":question["question_type"], "attempts":attempts, "correct":correct,
+                "correct_rate":correct / attempts if attempts else None,
+                "mean_time_ms":question["stats__total_time_ms"] / timed if timed else None,
+                "discrimination":question["stats__discrimination"], "choices":choices.get(question["id"], [])})
         return Response(data, status=status.HTTP_200_OK)
 
     def retrieve(self, request, pk=None):
-        question = self.get_obj_or_404(Question, pk)
-        data =self.serialize_questions(request, question, many=False)
-        return Response(data, status=status.HTTP_200_OK)
+        def render():
+            try:
+                question = CustomQuestionSerializer.prefetch(Question.objects.all()).get(pk=pk)
+            except Question.DoesNotExist:
+                raise NotFound(detail="object with that id does not exists")
+            return self.serialize_questions(request, question, many=False)
+        data, etag = self.cached_content(request, "QuestionView.retrieve", get_content_version(), render)
+        return self.content_response(request, data, etag)
 
  
 class MultiChoiceQuestionView(ModelViewSet):
@@ -298,7 +620,7 @@ class MultiChoiceQuestionView(ModelViewSet):
     queryset = MultiChoiceQuestion.objects.all()
 
 
-class MultiChoiceQuestionChoiceView(ModelViewSet):
+class MultiChoiceQuestionChoiceView(CachedContentListMixin, ModelViewSet):
     permission_classes = (IsAuthenticated,)
     serializer_class = MultiChoiceQuestionChoiceSerializer
     queryset = MultiChoiceQuestionChoice.objects.all()
@@ -323,7 +645,6 @@ class SubmittedFreeformAnswerView(ModelViewSet):
 
     def create(self, request):
         serializer = self.serializer_class(data=request.data, context={"request":request})
-        print(serializer.Meta.read_ony_fields)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)